@@ -1,39 +1,121 @@
-from fastapi import FastAPI, Depends
-from fastapi.responses import JSONResponse
+import asyncio
+import logging
+import os
+import traceback
+from contextlib import asynccontextmanager
+from functools import lru_cache
+
+import dotenv
+from fastapi import Depends, FastAPI, Request
+from fastapi.responses import JSONResponse, Response
 from pydantic import BaseModel
-from typing import List, Optional
+
+from chat_session import ChatSessionStore
+from deadline import Deadline, DeadlineExceeded
+from embeddings import Embedder
+from hedged import Backend, HedgedLangModel
 from indexer import Indexer, IndexerMetrics
+from lang_model import LangModel, LangModelError
+from lexical import LexicalIndex
+from map_reduce import MapReduceSummarizer
+from ollama import OllamaLangModel
 from openrouter import OpenRouterLangModel
 from query import ContextChunk, QueryEngine
+from rollups import RollupBuilder
+from snapshot import SnapshotError, export_snapshot, import_snapshot
+from tuning import recommend, tune_hnsw
 from vector_store import VectorStore
-import traceback
-import logging
-import dotenv
 
 dotenv.load_dotenv()
 
+# Ordered, comma-separated list of query backends, e.g. "openrouter,ollama"
+LANG_MODELS_ENV = "WHISPER_NOTE_LANG_MODELS"
+# Model for time range extraction as "<backend>:<model>", e.g.
+# "ollama:qwen2.5:0.5b". Defaults to the query lang model.
+TIME_RANGE_MODEL_ENV = "WHISPER_NOTE_TIME_RANGE_MODEL"
+# Seconds to wait for a backend's first token before hedging to the next one
+HEDGE_DEADLINE_ENV = "WHISPER_NOTE_HEDGE_DEADLINE"
+# Set to "1" to precompute daily/weekly summaries in the background
+ROLLUPS_ENV = "WHISPER_NOTE_ROLLUPS"
+# Concurrent LLM calls when summarizing a wide time range with map-reduce
+MAP_REDUCE_FAN_OUT_ENV = "WHISPER_NOTE_MAP_REDUCE_FAN_OUT"
+# Deadline for a query when the client does not send one (seconds)
+DEFAULT_QUERY_TIMEOUT = 60.0
+# How often to check whether a client waiting on a query has gone away
+DISCONNECT_POLL_INTERVAL = 0.5
+
+LANG_MODEL_FACTORIES = {
+    "ollama": OllamaLangModel,
+    "openrouter": OpenRouterLangModel,
+}
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 for mod in [
     "api",
     "chunker",
     "embeddings",
+    "hedged",
+    "http_client",
     "indexer",
+    "lexical",
+    "map_reduce",
     "ollama",
     "openrouter",
     "query",
+    "rollups",
     "time_range",
+    "tuning",
     "vector_store",
 ]:
     logging.getLogger(mod).setLevel(logging.DEBUG)
 
-app = FastAPI()
+
+def ollama_lang_models(lang_model: LangModel) -> list[OllamaLangModel]:
+    """The Ollama models behind lang_model, including hedged backends."""
+    if isinstance(lang_model, HedgedLangModel):
+        return [
+            b.lang_model
+            for b in lang_model.backends
+            if isinstance(b.lang_model, OllamaLangModel)
+        ]
+    return [lang_model] if isinstance(lang_model, OllamaLangModel) else []
+
+
+def configured_lang_model_names() -> list[str]:
+    names = os.environ.get(LANG_MODELS_ENV, "openrouter").split(",")
+    return [name.strip().lower() for name in names if name.strip()]
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Load local models as soon as the daemon starts and keep them loaded
+    # while it serves, so the first query does not pay for the model load.
+    warmed = []
+    try:
+        if "ollama" in configured_lang_model_names():
+            warmed += ollama_lang_models(get_lang_model())
+        time_range_lang_model = get_time_range_lang_model()
+        if time_range_lang_model is not None:
+            warmed += ollama_lang_models(time_range_lang_model)
+    except Exception:
+        logging.getLogger(__name__).exception("Failed to build lang model")
+    for lang_model in warmed:
+        lang_model.start_keep_warm()
+    yield
+    for lang_model in warmed:
+        lang_model.stop_keep_warm()
+
+
+app = FastAPI(lifespan=lifespan)
 
 
 class IndexMetricsResponse(BaseModel):
     file_count: int
     chunk_count: int
-    failed_files: List[dict] = []
+    failed_files: list[dict] = []
+    removed_count: int = 0
+    renamed_count: int = 0
 
 
 @app.get("/api/v1/health")
@@ -43,33 +125,98 @@ def health_check():
 
 class IndexRequest(BaseModel):
     directory: str
-    file_extensions: Optional[List[str]] = None  # Example: [".txt", ".md"]
+    file_extensions: list[str] | None = None  # Example: [".txt", ".md"]
 
 
 def get_collection_name():
     return "notes"  # Default collection for production
 
 
+def build_lang_model() -> LangModel:
+    names = configured_lang_model_names()
+    unknown = [name for name in names if name not in LANG_MODEL_FACTORIES]
+    if not names or unknown:
+        raise ValueError(
+            f"{LANG_MODELS_ENV} must list one or more of {sorted(LANG_MODEL_FACTORIES)}"
+        )
+    lang_models = [LANG_MODEL_FACTORIES[name]() for name in names]
+    if len(lang_models) == 1:
+        return lang_models[0]
+    deadline = float(os.environ.get(HEDGE_DEADLINE_ENV, "2.0"))
+    return HedgedLangModel(
+        [
+            Backend(lang_model, first_token_deadline=deadline)
+            for lang_model in lang_models
+        ]
+    )
+
+
+@lru_cache(maxsize=1)
+def get_lang_model() -> LangModel:
+    # Shared across requests so the HTTP connection pool is reused
+    return build_lang_model()
+
+
+def build_time_range_lang_model() -> LangModel | None:
+    spec = os.environ.get(TIME_RANGE_MODEL_ENV, "").strip()
+    if not spec:
+        return None
+    name, _, model = spec.partition(":")
+    factory = LANG_MODEL_FACTORIES.get(name.strip().lower())
+    if factory is None or not model:
+        raise ValueError(
+            f"{TIME_RANGE_MODEL_ENV} must be '<backend>:<model>' with a backend "
+            f"in {sorted(LANG_MODEL_FACTORIES)}"
+        )
+    return factory(model=model)
+
+
+@lru_cache(maxsize=1)
+def get_time_range_lang_model() -> LangModel | None:
+    return build_time_range_lang_model()
+
+
+@lru_cache(maxsize=8)
+def _cached_rollup_builder(collection_name: str) -> RollupBuilder:
+    builder = RollupBuilder(
+        VectorStore(collection_name=collection_name), get_lang_model()
+    )
+    builder.start_background()
+    return builder
+
+
+def get_rollup_builder(
+    collection_name: str = Depends(get_collection_name),
+) -> RollupBuilder | None:
+    if os.environ.get(ROLLUPS_ENV, "").lower() not in {"1", "true", "yes"}:
+        return None
+    return _cached_rollup_builder(collection_name)
+
+
 @app.post("/api/v1/index", response_model=IndexMetricsResponse)
 def index_directory(
     request: IndexRequest,
     collection_name: str = Depends(get_collection_name),
+    rollups: RollupBuilder | None = Depends(get_rollup_builder),
 ):
     directory = request.directory
     file_extensions = request.file_extensions
     try:
-        indexer = Indexer(vector_store=VectorStore(collection_name=collection_name))
-        metrics = indexer.index_dir(directory, file_exts=file_extensions)
+        with Indexer(
+            vector_store=VectorStore(collection_name=collection_name),
+            rollups=rollups,
+        ) as indexer:
+            metrics = indexer.index_dir(directory, file_exts=file_extensions)
         response = IndexMetricsResponse(
             file_count=metrics.file_count,
             chunk_count=metrics.chunk_count,
             failed_files=metrics.failed_files,
+            removed_count=metrics.removed_count,
+            renamed_count=metrics.renamed_count,
         )
         return response
     except Exception as e:
-        logging.getLogger(__name__).error(
-            f"500 Internal Server Error: {e}\n{traceback.format_exc()}"
-        )
+        logging.getLogger(__name__).exception("500 Internal Server Error")
         return JSONResponse(
             status_code=500,
             content={"error": str(e)},
@@ -78,58 +225,322 @@ def index_directory(
 
 class QueryRequest(BaseModel):
     query: str
+    timeout: float | None = None  # Seconds the client is willing to wait
 
 
 @app.get("/api/v1/index", response_model=IndexMetricsResponse)
 def get_index(collection_name: str = Depends(get_collection_name)):
     """Return current index metrics (files, chunks, failed files)."""
     try:
-        indexer = Indexer(vector_store=VectorStore(collection_name=collection_name))
-        metadata = indexer.vector_store.get_all_metadata()
-        metrics = build_indexer_metrics_from_metadata(metadata)
-        return metrics
-    except Exception as e:
-        logging.getLogger(__name__).error(
-            f"500 Internal Server Error: {e}\n{traceback.format_exc()}"
+        # From the chunk catalog and file membership, without reading the
+        # collection's metadata
+        counts = VectorStore(collection_name=collection_name).counts()
+        return IndexerMetrics(
+            file_count=counts.file_count,
+            chunk_count=counts.chunk_count,
+            failed_files=[],
         )
+    except Exception as e:
+        logging.getLogger(__name__).exception("500 Internal Server Error")
         return JSONResponse(
             status_code=500,
             content={"error": str(e)},
         )
 
 
+class SnapshotRequest(BaseModel):
+    path: str  # On the daemon's machine
+    force: bool = False  # Import a snapshot made with another embedding model
+
+
+class SnapshotResponse(BaseModel):
+    path: str
+    count: int
+    dimension: int
+    embedding_model: str
+    file_count: int
+
+
+@app.post("/api/v1/snapshot/export", response_model=SnapshotResponse)
+def export_index(
+    request: SnapshotRequest, collection_name: str = Depends(get_collection_name)
+):
+    try:
+        info = export_snapshot(
+            VectorStore(collection_name=collection_name), request.path
+        )
+        return SnapshotResponse(**info.__dict__)
+    except Exception as e:
+        logging.getLogger(__name__).exception("500 Internal Server Error")
+        return JSONResponse(status_code=500, content={"error": str(e)})
+
+
+@app.post("/api/v1/snapshot/import", response_model=SnapshotResponse)
+def import_index(
+    request: SnapshotRequest,
+    collection_name: str = Depends(get_collection_name),
+    rollups: RollupBuilder | None = Depends(get_rollup_builder),
+):
+    try:
+        info = import_snapshot(
+            VectorStore(collection_name=collection_name),
+            request.path,
+            force=request.force,
+        )
+        if rollups:
+            # Rollups of days whose chunks did not change are kept as they are
+            rollups.backfill()
+        return SnapshotResponse(**info.__dict__)
+    except (SnapshotError, FileNotFoundError) as e:
+        return JSONResponse(status_code=400, content={"error": str(e)})
+    except Exception as e:
+        logging.getLogger(__name__).exception("500 Internal Server Error")
+        return JSONResponse(status_code=500, content={"error": str(e)})
+
+
+class TuneRequest(BaseModel):
+    k: int = 10
+    sample_size: int = 100  # Stored vectors to query with, without queries
+    queries: list[str] | None = None  # Real queries to tune on
+    target_recall: float = 0.95
+    apply: bool = False  # Persist the recommended search_ef
+
+
+class HnswConfigResponse(BaseModel):
+    space: str
+    m: int
+    construction_ef: int
+    search_ef: int
+
+
+class TuningResultResponse(BaseModel):
+    m: int
+    construction_ef: int
+    search_ef: int
+    recall: float
+    latency_ms: float
+    p95_latency_ms: float
+    build_seconds: float
+
+
+class TuneResponse(BaseModel):
+    config: HnswConfigResponse
+    results: list[TuningResultResponse]
+    # Fastest result reaching the target recall with the collection's m and
+    # construction_ef, which only a re-index into a new collection changes
+    recommended: TuningResultResponse | None = None
+    applied: bool = False
+
+
+@app.post("/api/v1/index/tune", response_model=TuneResponse)
+def tune_index(
+    request: TuneRequest, collection_name: str = Depends(get_collection_name)
+):
+    try:
+        vector_store = VectorStore(collection_name=collection_name)
+        queries = Embedder().embed(request.queries) if request.queries else None
+        results = tune_hnsw(
+            vector_store, k=request.k, sample_size=request.sample_size, queries=queries
+        )
+        config = vector_store.hnsw_config
+        best = recommend(results, request.target_recall, config)
+        applied = False
+        if request.apply and best and best.search_ef != config.search_ef:
+            vector_store.set_search_ef(best.search_ef)
+            applied = True
+        return TuneResponse(
+            config=HnswConfigResponse(**config.__dict__),
+            results=[TuningResultResponse(**r.__dict__) for r in results],
+            recommended=TuningResultResponse(**best.__dict__) if best else None,
+            applied=applied,
+        )
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"error": str(e)})
+    except Exception as e:
+        logging.getLogger(__name__).exception("500 Internal Server Error")
+        return JSONResponse(status_code=500, content={"error": str(e)})
+
+
 class QueryResponse(BaseModel):
     answer: str
-    context: List[ContextChunk]
+    context: list[ContextChunk]
+    degradations: list[str] = []
+
+
+@lru_cache(maxsize=8)
+def _cached_query_engine(
+    collection_name: str,
+    lang_model: LangModel,
+    rollups: RollupBuilder | None,
+    time_range_lang_model: LangModel | None,
+) -> QueryEngine:
+    vector_store = VectorStore(collection_name=collection_name)
+    return QueryEngine(
+        vector_store=vector_store,
+        lang_model=lang_model,
+        rollups=rollups.store if rollups else None,
+        map_reducer=MapReduceSummarizer(
+            lang_model, fan_out=int(os.environ.get(MAP_REDUCE_FAN_OUT_ENV, "4"))
+        ),
+        time_range_lang_model=time_range_lang_model,
+        lexical=LexicalIndex(vector_store.sidecar_path("lexical.sqlite")),
+    )
+
+
+def get_query_engine(
+    collection_name: str = Depends(get_collection_name),
+    lang_model: LangModel = Depends(get_lang_model),
+    rollups: RollupBuilder | None = Depends(get_rollup_builder),
+    time_range_lang_model: LangModel | None = Depends(get_time_range_lang_model),
+) -> QueryEngine:
+    # Sync dependency, so FastAPI builds the engine (and loads the embedding
+    # model) in its threadpool rather than on the event loop.
+    return _cached_query_engine(
+        collection_name, lang_model, rollups, time_range_lang_model
+    )
+
+
+class ClientDisconnected(Exception):
+    pass
+
+
+async def cancel_on_disconnect(http_request: Request, coro):
+    """Await coro, cancelling it if the client disconnects first."""
+    task = asyncio.ensure_future(coro)
+    while True:
+        done, _ = await asyncio.wait({task}, timeout=DISCONNECT_POLL_INTERVAL)
+        if done:
+            return task.result()
+        if await http_request.is_disconnected():
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+            raise ClientDisconnected()
 
 
 @app.post("/api/v1/query", response_model=QueryResponse)
-def query(request: QueryRequest, collection_name: str = Depends(get_collection_name)):
+async def query(
+    request: QueryRequest,
+    http_request: Request,
+    engine: QueryEngine = Depends(get_query_engine),
+):
     try:
-        engine = QueryEngine(
-            vector_store=VectorStore(collection_name=collection_name),
-            lang_model=OpenRouterLangModel(),
+        deadline = Deadline(request.timeout or DEFAULT_QUERY_TIMEOUT)
+        result = await cancel_on_disconnect(
+            http_request, engine.aquery(request.query, deadline=deadline)
+        )
+        resp = QueryResponse(
+            answer=result.answer,
+            context=result.context,
+            degradations=result.degradations,
         )
-        result = engine.query(request.query)
-        resp = QueryResponse(answer=result.answer, context=result.context)
         return resp
     except Exception as e:
-        logging.getLogger(__name__).error(
-            f"500 Internal Server Error: {e}\n{traceback.format_exc()}"
+        return query_error_response(e)
+
+
+def query_error_response(e: Exception) -> Response:
+    """Map an exception raised while answering a query to an HTTP response."""
+    if isinstance(e, ClientDisconnected):
+        logging.getLogger(__name__).info("Client disconnected, query cancelled")
+        # 499 Client Closed Request; the client is gone so nobody reads it
+        return Response(status_code=499)
+    if isinstance(e, DeadlineExceeded):
+        logging.getLogger(__name__).error(f"504 Gateway Timeout: {e}")
+        return JSONResponse(status_code=504, content={"error": str(e)})
+    if isinstance(e, LangModelError):
+        logging.getLogger(__name__).error(f"502 Bad Gateway: {e}")
+        return JSONResponse(
+            status_code=502,
+            content={"error": str(e), "lang_model": e.to_dict()},
         )
+    logging.getLogger(__name__).error(
+        f"500 Internal Server Error: {e}\n{traceback.format_exc()}"
+    )
+    return JSONResponse(
+        status_code=500,
+        content={"error": str(e)},
+    )
+
+
+class ChatSessionResponse(BaseModel):
+    session_id: str
+
+
+class ChatMessageRequest(BaseModel):
+    message: str
+    timeout: float | None = None  # Seconds the client is willing to wait
+
+
+class ChatMessageResponse(QueryResponse):
+    session_id: str
+    reused_context: bool = False
+
+
+@lru_cache(maxsize=1)
+def get_chat_sessions() -> ChatSessionStore:
+    return ChatSessionStore()
+
+
+@app.post("/api/v1/sessions", response_model=ChatSessionResponse)
+def create_chat_session(sessions: ChatSessionStore = Depends(get_chat_sessions)):
+    """Start a chat session whose retrieved context is reused across messages."""
+    return ChatSessionResponse(session_id=sessions.create().id)
+
+
+@app.post("/api/v1/sessions/{session_id}/messages", response_model=ChatMessageResponse)
+async def send_chat_message(
+    session_id: str,
+    request: ChatMessageRequest,
+    http_request: Request,
+    engine: QueryEngine = Depends(get_query_engine),
+    sessions: ChatSessionStore = Depends(get_chat_sessions),
+):
+    session = sessions.get(session_id)
+    if session is None:
         return JSONResponse(
-            status_code=500,
-            content={"error": str(e)},
+            status_code=404, content={"error": f"Unknown session: {session_id}"}
+        )
+    try:
+        deadline = Deadline(request.timeout or DEFAULT_QUERY_TIMEOUT)
+        result = await cancel_on_disconnect(
+            http_request, engine.achat(session, request.message, deadline=deadline)
+        )
+        return ChatMessageResponse(
+            answer=result.answer,
+            context=result.context,
+            degradations=result.degradations,
+            session_id=session.id,
+            reused_context=result.reused_context,
         )
+    except Exception as e:
+        return query_error_response(e)
 
 
-def build_indexer_metrics_from_metadata(metadata_list):
-    file_set = set()
-    chunk_count = 0
-    for metadata in metadata_list:
-        if metadata.file:
-            file_set.add(metadata.file)
-            chunk_count += 1
-    return IndexerMetrics(
-        file_count=len(file_set), chunk_count=chunk_count, failed_files=[]
-    )
+@app.delete("/api/v1/sessions/{session_id}")
+def delete_chat_session(
+    session_id: str, sessions: ChatSessionStore = Depends(get_chat_sessions)
+):
+    if not sessions.delete(session_id):
+        return JSONResponse(
+            status_code=404, content={"error": f"Unknown session: {session_id}"}
+        )
+    return JSONResponse(content={"status": "ok"})
+
+
+@app.get("/api/v1/metrics")
+def get_metrics(lang_model: LangModel = Depends(get_lang_model)):
+    """Return per-backend LLM latency histograms, if the lang model records them."""
+    latency = {}
+    if isinstance(lang_model, HedgedLangModel):
+        latency = lang_model.latency_stats()
+    return JSONResponse(content={"lang_model_latency": latency})
+
+
+@app.get("/api/v1/models")
+def get_models(lang_model: LangModel = Depends(get_lang_model)):
+    """Report whether the local models are loaded in memory."""
+    models = [m.status() for m in ollama_lang_models(lang_model)]
+    return JSONResponse(content={"models": models})
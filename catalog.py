@@ -0,0 +1,169 @@
+import sqlite3
+import threading
+from collections.abc import Iterable, Sequence
+from dataclasses import dataclass
+from datetime import date
+
+# Metadata fields the catalog keeps of every chunk
+CATALOG_FIELDS = (
+    "file",
+    "file_hash",
+    "created_at",
+    "modified_at",
+    "event_date",
+    "duplicate_of",
+)
+# Of those, the timestamps
+CATALOG_TIME_FIELDS = ("created_at", "modified_at", "event_date")
+
+
+@dataclass
+class CatalogCounts:
+    file_count: int
+    chunk_count: int  # Chunks that belong to a file
+    duplicate_count: int  # Of those, duplicates sharing another's embedding
+
+
+class ChunkCatalog:
+    """
+    SQLite copy of the fields of each chunk's metadata that file-level
+    operations filter on, indexed so that looking up a file's chunks, the
+    files under a folder or the counts of the index does not scan the
+    collection. The VectorStore keeps it in step with every write. A chunk
+    shared by files with the same content is cataloged under the file it
+    was stored for; the MembershipStore records the others.
+    """
+
+    def __init__(self, path: str = ":memory:"):
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS chunks ("
+                " chunk_id TEXT PRIMARY KEY,"
+                " file TEXT,"
+                " file_hash TEXT,"
+                " created_at REAL,"
+                " modified_at REAL,"
+                " event_date REAL,"
+                " duplicate_of TEXT)"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS chunks_file ON chunks (file, file_hash)"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS chunks_event_date ON chunks (event_date)"
+            )
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+
+    def add(self, ids: Sequence[str], metadatas: Sequence[dict] | None = None):
+        """Record chunks by their stored metadata, replacing those already recorded."""
+        metadatas = metadatas or [None] * len(ids)
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO chunks (chunk_id, file, file_hash,"
+                " created_at, modified_at, event_date, duplicate_of)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    (chunk_id, *((md or {}).get(f) for f in CATALOG_FIELDS))
+                    for chunk_id, md in zip(ids, metadatas)
+                ),
+            )
+
+    def update(self, ids: Sequence[str], metadatas: Sequence[dict]):
+        """Apply metadata updates, as given to VectorStore.update_metadata."""
+        with self._lock, self._conn:
+            for chunk_id, md in zip(ids, metadatas):
+                changed = [f for f in CATALOG_FIELDS if f in md]
+                if changed:
+                    self._conn.execute(
+                        f"UPDATE chunks SET {', '.join(f'{f} = ?' for f in changed)}"
+                        " WHERE chunk_id = ?",
+                        (*(md[f] for f in changed), chunk_id),
+                    )
+
+    def delete(self, ids: Iterable[str]):
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "DELETE FROM chunks WHERE chunk_id = ?",
+                ((chunk_id,) for chunk_id in ids),
+            )
+
+    def clear(self):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM chunks")
+
+    def ids_of_file(self, file: str, file_hash: str | None = None) -> list[str]:
+        """The chunks stored for a file, with this file hash if given."""
+        sql = "SELECT chunk_id FROM chunks WHERE file = ?"
+        params: list = [file]
+        if file_hash is not None:
+            sql += " AND file_hash = ?"
+            params.append(file_hash)
+        with self._lock:
+            return [chunk_id for (chunk_id,) in self._conn.execute(sql, params)]
+
+    def ids_under(self, prefix: str) -> list[str]:
+        """The chunks stored for files whose path starts with prefix."""
+        # A range rather than LIKE, so the index on file is used and "%" or
+        # "_" in the prefix match literally
+        with self._lock:
+            return [
+                chunk_id
+                for (chunk_id,) in self._conn.execute(
+                    "SELECT chunk_id FROM chunks WHERE file >= ? AND file < ?",
+                    (prefix, prefix + "\U0010ffff"),
+                )
+            ]
+
+    def files(self, prefix: str = "") -> list[str]:
+        """The files chunks are stored for whose path starts with prefix."""
+        with self._lock:
+            return [
+                file
+                for (file,) in self._conn.execute(
+                    "SELECT DISTINCT file FROM chunks WHERE file >= ? AND file < ?"
+                    " AND file != ''",
+                    (prefix, prefix + "\U0010ffff"),
+                )
+            ]
+
+    def has_file_hash(self, file: str, file_hash: str) -> bool:
+        """
+        True if a chunk with an event date is stored for the file with this
+        file hash.
+        """
+        with self._lock:
+            return (
+                self._conn.execute(
+                    "SELECT 1 FROM chunks WHERE file = ? AND file_hash = ?"
+                    " AND event_date IS NOT NULL LIMIT 1",
+                    (file, file_hash),
+                ).fetchone()
+                is not None
+            )
+
+    def days(self, time_field: str = "event_date") -> list[date]:
+        """The local days of the chunks' time_field, in order."""
+        if time_field not in CATALOG_TIME_FIELDS:
+            raise ValueError(f"Not a cataloged time field: {time_field}")
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT DISTINCT date({time_field}, 'unixepoch', 'localtime')"
+                f" FROM chunks WHERE {time_field} > 0 ORDER BY 1"
+            ).fetchall()
+        return [date.fromisoformat(day) for (day,) in rows]
+
+    def counts(self) -> CatalogCounts:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT COUNT(DISTINCT file), COUNT(file),"
+                " COUNT(NULLIF(duplicate_of, '')) FROM chunks WHERE file != ''"
+            ).fetchone()
+        return CatalogCounts(*row)
+
+    def close(self):
+        self._conn.close()
@@ -0,0 +1,86 @@
+import asyncio
+import math
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any
+
+
+@dataclass
+class ChatSession:
+    """
+    Server-side state of a multi-turn conversation: the message history and
+    the context retrieved for it, which follow-up turns reuse.
+    """
+
+    id: str
+    messages: list[dict[str, str]] = field(default_factory=list)
+    context: list[Any] = field(default_factory=list)
+    system_prompt: str | None = None
+    time_range: Any | None = None
+    topic_query: str | None = None  # Query the context was retrieved for
+    topic_embedding: list[float] | None = None
+    index_version: int | None = None
+    last_used: float = field(default_factory=time.monotonic)
+    # Serializes turns so concurrent messages cannot interleave the history
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock, repr=False)
+
+    def add_turn(self, question: str, answer: str, max_messages: int):
+        self.messages.append({"role": "user", "content": question})
+        self.messages.append({"role": "assistant", "content": answer})
+        # Drop the oldest turns; this changes the prompt prefix, so only do it
+        # once the history is long.
+        if len(self.messages) > max_messages:
+            del self.messages[: len(self.messages) - max_messages]
+
+
+class ChatSessionStore:
+    """In-memory chat sessions, evicted when idle for ttl seconds or when full."""
+
+    def __init__(self, ttl: float = 1800.0, max_sessions: int = 100):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self._sessions: OrderedDict[str, ChatSession] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def create(self) -> ChatSession:
+        session = ChatSession(id=uuid.uuid4().hex)
+        with self._lock:
+            self._evict()
+            while len(self._sessions) >= self.max_sessions:
+                self._sessions.popitem(last=False)
+            self._sessions[session.id] = session
+        return session
+
+    def get(self, session_id: str) -> ChatSession | None:
+        with self._lock:
+            self._evict()
+            session = self._sessions.get(session_id)
+            if session is not None:
+                session.last_used = time.monotonic()
+                self._sessions.move_to_end(session_id)
+            return session
+
+    def delete(self, session_id: str) -> bool:
+        with self._lock:
+            return self._sessions.pop(session_id, None) is not None
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._sessions)
+
+    def _evict(self):
+        cutoff = time.monotonic() - self.ttl
+        while self._sessions:
+            session = next(iter(self._sessions.values()))
+            if session.last_used >= cutoff:
+                break
+            self._sessions.popitem(last=False)
+
+
+def cosine_similarity(a: list[float], b: list[float]) -> float:
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
@@ -1,10 +1,107 @@
+import codecs
+import hashlib
+import io
+import itertools
+import logging
+import mmap
 import os
-from typing import List, Optional
 import re
-import logging
+from collections.abc import Iterable, Iterator
 from dataclasses import dataclass
 from datetime import datetime
 
+# Bytes of a file read at a time when streaming it
+READ_BLOCK_SIZE = 1 << 20
+
+
+class Chunk:
+    """
+    A chunk of a file, kept as offsets into the text it was cut from (source)
+    so that its text is only built when it is needed, e.g. to be embedded.
+    header names the note and its dates, prefix is the headings the chunk
+    falls under, and offset is the position of source in the file's text.
+    Only the content (prefix and body) is embedded and stored: note_text()
+    puts the header back from the stored metadata, so a copy of the note
+    under another name, or an edit elsewhere in it, leaves the chunk as is.
+    """
+
+    __slots__ = (
+        "_hash",
+        "end",
+        "event_date",
+        "header",
+        "offset",
+        "prefix",
+        "source",
+        "start",
+    )
+
+    def __init__(
+        self,
+        source: str,
+        start: int = 0,
+        end: int | None = None,
+        prefix: str = "",
+        offset: int = 0,
+        event_date: datetime | None = None,  # When the chunk's events happened
+        header: str = "",
+    ):
+        self.source = source
+        self.start = start
+        self.end = len(source) if end is None else end
+        self.header = header
+        self.prefix = prefix
+        self.offset = offset
+        self.event_date = event_date
+        self._hash = None
+
+    @property
+    def text(self) -> str:
+        return self.header + self.content
+
+    @property
+    def content(self) -> str:
+        """The chunk's text without its header: what is embedded and stored."""
+        return self.prefix + self.source[self.start : self.end]
+
+    @property
+    def body(self) -> str:
+        """The chunk's text without its header and prefix."""
+        return self.source[self.start : self.end]
+
+    @property
+    def file_start(self) -> int:
+        """Offset of the chunk's first character in the file's text."""
+        return self.offset + self.start
+
+    @property
+    def file_end(self) -> int:
+        return self.offset + self.end
+
+    @property
+    def content_hash(self) -> str:
+        """SHA-256 of the chunk's content, which keys its embedding."""
+        if self._hash is None:
+            self._hash = hashlib.sha256(self.content.encode("utf-8")).hexdigest()
+        return self._hash
+
+    @property
+    def id(self) -> str:
+        """
+        Id of the chunk's stored row: its content_hash, or for a dated chunk
+        a hash of that and the date, as a row has one date to be found by.
+        """
+        if self.event_date is None:
+            return self.content_hash
+        key = f"{self.event_date.date().isoformat()}\n{self.content_hash}"
+        return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+    def __repr__(self) -> str:
+        return (
+            f"Chunk(file_start={self.file_start}, file_end={self.file_end}, "
+            f"event_date={self.event_date})"
+        )
+
 
 @dataclass
 class FileMetadata:
@@ -22,84 +119,212 @@ class Chunker:
     Then splits by the specified chunk size with optional overlap.
     """
 
+    # Tokens the embedding model adds around every input ([CLS] and [SEP])
+    SPECIAL_TOKENS = 2
+    # Characters of a file held in memory at a time while it is chunked
+    STREAM_BUFFER = 1 << 20
+
     def __init__(
-        self, chunk_size: int = 512, overlap: int = 0, split_on: Optional[str] = r"\n\n"
+        self,
+        chunk_size: int = 512,
+        overlap: int = 0,
+        split_on: str | None = r"\n\n",
+        tokenizer=None,
     ):
         """
         chunk_size: number of characters per chunk (default)
         overlap: number of characters to overlap between chunks
         split_on: optional regex pattern to split on (e.g., '\n\n' for paragraphs)
+        tokenizer: optional Hugging Face tokenizer. If given, chunk_size and
+            overlap count tokens, and chunk_size includes the headings a
+            chunk starts with.
         """
         self.chunk_size = chunk_size
         self.overlap = overlap
         self.split_on = split_on
+        self.tokenizer = tokenizer
         logging.getLogger(__name__).debug(
-            f"Initialized Chunker with chunk_size={chunk_size}, overlap={overlap}, split_on={split_on}"
+            f"Initialized {type(self).__name__} with chunk_size={chunk_size}, overlap={overlap}, split_on={split_on}, tokenizer={type(tokenizer).__name__ if tokenizer else None}"
+        )
+
+    @classmethod
+    def for_embedder(cls, embedder, overlap: int = 32, **kwargs) -> "Chunker":
+        """
+        Chunker sized in the embedder's tokens so the content of every chunk,
+        headings included, fits in one pass of the model without being
+        truncated.
+        """
+        return cls(
+            chunk_size=embedder.max_seq_length - cls.SPECIAL_TOKENS,
+            overlap=overlap,
+            tokenizer=embedder.tokenizer,
+            **kwargs,
         )
 
-    def chunk_file(self, file_path: str) -> List[str]:
+    def chunk_file(self, file_path: str) -> list[str]:
         """
         Chunk a file into smaller pieces.
         Returns a list of strings.
         """
-        try:
-            metadata = self._extract_metadata(file_path)
-            with open(file_path, "r", encoding="utf-8") as f:
-                text = f.read()
-            return self._chunk_text(text, metadata)
-        except UnicodeDecodeError as e:
-            raise ValueError(f"Could not decode file {file_path}: {e}") from e
+        return list(self.iter_file(file_path))
 
-    def _chunk_text(
-        self, text: str, metadata: Optional[FileMetadata] = None
-    ) -> List[str]:
+    def iter_file(self, file_path: str, hasher=None) -> Iterator[str]:
+        """Like iter_chunks(), but yields the text of each chunk."""
+        for chunk in self.iter_chunks(file_path, hasher):
+            yield chunk.text
+
+    def iter_chunks(self, file_path: str, hasher=None) -> Iterator[Chunk]:
+        """
+        Yield the chunks of a file as they are made, reading it through a
+        memory map so that memory use does not grow with the file's size.
+        If hasher (e.g. hashlib.sha256()) is given, it is fed the file's bytes
+        on the same pass.
+        """
+        metadata = self._extract_metadata(file_path)
+        pending, offset = "", 0
+        for text in read_text(file_path, hasher):
+            pending += text
+            if len(pending) >= self.STREAM_BUFFER:
+                end, start = self._stream_cut(pending)
+                yield from self._chunk_spans(pending, metadata, 0, end, offset)
+                pending, offset = pending[start:], offset + start
+        yield from self._chunk_spans(pending, metadata, 0, len(pending), offset)
+
+    def _stream_cut(self, text: str):
+        """
+        Where to split buffered text while streaming: text[:end] is chunked
+        now and text[start:] is kept for the next read. Splits at the last
+        split_on match, which chunks exactly as the whole text would, else at
+        the last whitespace.
+        """
+        if self.split_on:
+            last = None
+            for last in re.finditer(self.split_on, text):
+                pass
+            if last is not None and last.start() > 0:
+                return last.start(), last.end()
+        cut = max(text.rfind("\n"), text.rfind(" "))
+        if cut <= 0:
+            cut = len(text)
+        return cut, cut
+
+    def _chunk_text(self, text: str, metadata: FileMetadata | None = None) -> list[str]:
         """
         Chunk text into smaller pieces based on patterns in the text (e.g., paragraphs).
         Returns a list of strings.
         """
+        return [chunk.text for chunk in self._chunk_spans(text, metadata)]
+
+    def _chunk_spans(
+        self,
+        text: str,
+        metadata: FileMetadata | None = None,
+        start: int = 0,
+        end: int | None = None,
+        offset: int = 0,
+    ) -> Iterator[Chunk]:
+        """
+        Chunk text[start:end], first on split_on (e.g. paragraphs) and then by
+        size. offset is the position of text in the file.
+        """
+        end = len(text) if end is None else end
+        header = self._chunk_header(metadata)
+        budget = self._budget("")
+        parts = [(start, end)]
         if self.split_on:
             # Split on regex pattern (e.g., paragraphs)
-            parts = re.split(self.split_on, text)
-            chunks = []
-            for part in parts:
-                chunks.extend(self._chunk_by_size(part, metadata))
-            return [c for c in chunks if c.strip()]
+            parts, part_start = [], start
+            for match in re.compile(self.split_on).finditer(text, start, end):
+                parts.append((part_start, match.start()))
+                part_start = match.end()
+            parts.append((part_start, end))
+        for part_start, part_end in parts:
+            for piece_start, piece_end in self._split_by_size(
+                text, budget, part_start, part_end
+            ):
+                yield self._create_chunk(
+                    text, piece_start, piece_end, "", offset=offset, header=header
+                )
 
-        return self._chunk_by_size(text, metadata)
+    def _length(self, text: str) -> int:
+        """Size of text in the unit chunk_size is measured in."""
+        if self.tokenizer is None:
+            return len(text)
+        return len(self._tokenize(text)["input_ids"])
 
-    def _chunk_by_size(
-        self, text: str, metadata: Optional[FileMetadata] = None
-    ) -> List[str]:
+    def _span_length(self, text: str, start: int, end: int) -> int:
+        """Size of text[start:end], without copying it when counting characters."""
+        if self.tokenizer is None:
+            return end - start
+        return self._length(text[start:end])
+
+    def _budget(self, prefix: str) -> int:
+        """Room left for text in a chunk that starts with prefix."""
+        if self.tokenizer is None:
+            return self.chunk_size  # Character sizes do not include the prefix
+        # Never let long headings squeeze the text out entirely
+        return max(self.chunk_size - self._length(prefix), self.chunk_size // 4, 1)
+
+    def _split_by_size(
+        self, text: str, size: int, start: int = 0, end: int | None = None
+    ) -> list[tuple[int, int]]:
         """
-        Chunks text into smaller pieces based on the specified chunk size and overlap.
-        Returns a list of strings.
+        Split text[start:end] into spans of at most size characters or tokens,
+        with overlap, skipping spans that are only whitespace.
         """
-        chunks = []
-        start = 0
-        while start < len(text):
-            end = min(start + self.chunk_size, len(text))
-            text_segment = text[start:end]
-            if text_segment.strip():
-                chunk = self._create_chunk(text_segment, metadata)
-                chunks.append(chunk)
-            start += (
-                self.chunk_size - self.overlap
-                if self.chunk_size > self.overlap
-                else self.chunk_size
-            )
-        return chunks
-
-    def _create_chunk(self, text_segment: str, metadata: Optional[FileMetadata]) -> str:
-        """
-        Format the chunk with metadata if provided, and log the chunk.
-        """
-        if metadata:
-            created_at = format_date(metadata.created_at)
-            modified_at = format_date(metadata.modified_at)
-            chunk = f"User note: title '{metadata.file_name}', created at '{created_at}', last modified at '{modified_at}': {text_segment}"
+        end = len(text) if end is None else end
+        step = size - self.overlap if size > self.overlap else size
+        if self.tokenizer is None:
+            spans = [(i, min(i + size, end)) for i in range(start, end, step)]
         else:
-            chunk = text_segment
-        logging.getLogger(__name__).debug(f"Created chunk: {chunk}")
+            offsets = self._tokenize(text[start:end])["offset_mapping"]
+            spans = [
+                (
+                    start + offsets[i][0],
+                    start + offsets[min(i + size, len(offsets)) - 1][1],
+                )
+                for i in range(0, len(offsets), step)
+            ]
+        return [(s, e) for s, e in spans if _NON_SPACE.search(text, s, e)]
+
+    def _tokenize(self, text: str) -> dict:
+        return self.tokenizer(
+            text,
+            add_special_tokens=False,
+            return_offsets_mapping=True,
+            verbose=False,
+        )
+
+    def _chunk_header(
+        self, metadata: FileMetadata | None, event_date: datetime | None = None
+    ) -> str:
+        if not metadata:
+            return ""
+        return note_header(
+            metadata.file_name,
+            metadata.created_at,
+            metadata.modified_at,
+            event_date.timestamp() if event_date else None,
+        )
+
+    def _create_chunk(
+        self,
+        source: str,
+        start: int,
+        end: int,
+        prefix: str,
+        offset: int = 0,
+        event_date: datetime | None = None,
+        header: str = "",
+    ) -> Chunk:
+        """
+        Make a chunk of source[start:end] starting with header and prefix,
+        and log it.
+        """
+        chunk = Chunk(source, start, end, prefix, offset, event_date, header)
+        logger = logging.getLogger(__name__)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"Created chunk: {chunk.text}")
         return chunk
 
     def _extract_metadata(self, file_path: str) -> FileMetadata:
@@ -111,5 +336,336 @@ class Chunker:
         )
 
 
+class MarkdownChunker(Chunker):
+    """
+    Chunks Markdown notes along their structure: the text is split into
+    sections at headings, and each section into blocks (paragraphs and lists)
+    that are packed into chunks of up to chunk_size characters (or tokens,
+    with a tokenizer). Every chunk starts with the headings it falls under.
+
+    Each chunk is given the date of the events it describes, taken from the
+    nearest dated heading above it, else the front matter ("date:" or
+    "created:"), else a date in the file name (e.g. daily notes named
+    2024-05-01.md).
+    """
+
+    HEADING = re.compile(r"^(#{1,6})\s+(.*?)\s*#*\s*$")
+    FRONT_MATTER_DATE_KEYS = ("date", "created", "day")
+    # Front matter longer than this is taken to be an unclosed "---"
+    FRONT_MATTER_MAX_LINES = 100
+
+    def __init__(self, chunk_size: int = 512, overlap: int = 0, tokenizer=None):
+        super().__init__(
+            chunk_size=chunk_size, overlap=overlap, split_on=None, tokenizer=tokenizer
+        )
+
+    def chunk_file_with_dates(self, file_path: str) -> list[Chunk]:
+        """Chunk a file, returning each chunk with its event date, if known."""
+        return list(self.iter_chunks(file_path))
+
+    def iter_chunks(self, file_path: str, hasher=None) -> Iterator[Chunk]:
+        """
+        Yield a file's chunks with their event dates section by section,
+        streaming the file like Chunker.iter_chunks().
+        """
+        metadata = self._extract_metadata(file_path)
+        front_matter, offset, lines = self._split_front_matter(
+            read_lines(file_path, hasher)
+        )
+        file_date = self._front_matter_date(front_matter) or parse_date(
+            os.path.basename(file_path)
+        )
+        for headings, section, event_date, section_offset in self._sections(
+            lines, file_date, offset
+        ):
+            header = self._chunk_header(metadata, event_date)
+            prefix = " > ".join(headings) + "\n" if headings else ""
+            budget = self._budget(prefix)
+            for start, end in self._pack_blocks(section, budget):
+                yield self._create_chunk(
+                    section, start, end, prefix, section_offset, event_date, header
+                )
+
+    def _split_front_matter(self, lines: Iterator[str]):
+        """
+        Return the front matter, the length of the text it takes up, and an
+        iterator over the lines after it.
+        """
+        first = next(lines, None)
+        if first is None or first.rstrip() != "---":
+            return "", 0, itertools.chain([first] if first is not None else [], lines)
+        front_matter = []
+        for line in lines:
+            if line.rstrip() == "---":
+                length = sum(len(text) + 1 for text in [first, *front_matter, line])
+                return "\n".join(front_matter), length, lines
+            front_matter.append(line)
+            if len(front_matter) >= self.FRONT_MATTER_MAX_LINES:
+                break
+        return "", 0, itertools.chain([first], front_matter, lines)
+
+    def _front_matter_date(self, front_matter: str) -> datetime | None:
+        for line in front_matter.splitlines():
+            key, _, value = line.partition(":")
+            if key.strip().lower() in self.FRONT_MATTER_DATE_KEYS:
+                date = parse_date(value)
+                if date:
+                    return date
+        return None
+
+    def _sections(
+        self, lines: Iterable[str], file_date: datetime | None, offset: int = 0
+    ):
+        """
+        Yield (headings, text, event_date, offset) for each section, where
+        offset is the position of text in the file. A date in a heading
+        applies to its section and to the sections nested under it. Sections
+        longer than STREAM_BUFFER are yielded in parts.
+        """
+        stack = []  # (level, heading, date) of the enclosing headings
+        section_lines, size, has_text = [], 0, False
+        section_offset = offset
+
+        def section():
+            headings = [heading for _, heading, _ in stack]
+            date = stack[-1][2] if stack else file_date
+            return headings, "\n".join(section_lines), date, section_offset
+
+        for line in lines:
+            offset += len(line) + 1
+            match = self.HEADING.match(line)
+            if not match:
+                section_lines.append(line)
+                size += len(line) + 1
+                has_text = has_text or bool(line.strip())
+                # Flush long sections at a blank line so no paragraph is
+                # split, unless there is none to be found
+                if (size >= self.STREAM_BUFFER and not line.strip()) or (
+                    size >= 2 * self.STREAM_BUFFER
+                ):
+                    if has_text:
+                        yield section()
+                    section_lines, size, has_text = [], 0, False
+                    section_offset = offset
+                continue
+            if has_text:
+                yield section()
+            section_lines, size, has_text = [], 0, False
+            section_offset = offset
+            level, heading = len(match.group(1)), match.group(2)
+            while stack and stack[-1][0] >= level:
+                stack.pop()
+            inherited = stack[-1][2] if stack else file_date
+            default_year = inherited.year if inherited else None
+            date = parse_date(heading, default_year) or inherited
+            stack.append((level, line.strip(), date))
+        if has_text:
+            yield section()
+
+    def _pack_blocks(self, text: str, budget: int) -> list[tuple[int, int]]:
+        """
+        Pack paragraphs and lists into spans of text of at most budget in
+        size. A span runs from the start of its first block to the end of
+        its last.
+        """
+        spans = []
+        current, current_size = None, 0
+        separator = self._length("\n\n")
+        for start, end in _block_spans(text):
+            size = self._span_length(text, start, end)
+            if current and current_size + separator + size > budget:
+                spans.append(current)
+                current, current_size = None, 0
+            if size > budget:
+                spans.extend(self._split_by_size(text, budget, start, end))
+                continue
+            if current:
+                current = (current[0], end)
+                current_size += separator + size
+            else:
+                current, current_size = (start, end), size
+        if current:
+            spans.append(current)
+        return spans
+
+
+_NON_SPACE = re.compile(r"\S")
+_BLANK_LINE = re.compile(r"\n\s*\n")
+
+
+def _block_spans(text: str) -> Iterator[tuple[int, int]]:
+    """(start, end) of each block of text between blank lines, stripped."""
+    start = 0
+    for separator in itertools.chain(_BLANK_LINE.finditer(text), [None]):
+        end = separator.start() if separator else len(text)
+        first = _NON_SPACE.search(text, start, end)
+        if first:
+            last = end
+            while text[last - 1].isspace():
+                last -= 1
+            yield first.start(), last
+        if separator:
+            start = separator.end()
+
+
+def read_blocks(
+    file_path: str, hasher=None, block_size: int | None = None
+) -> Iterator[bytes]:
+    """
+    Yield the bytes of a file block by block from a memory map, feeding each
+    block to hasher (e.g. hashlib.sha256()), if given, on the way.
+    """
+    block_size = block_size or READ_BLOCK_SIZE
+    with open(file_path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return  # Empty files cannot be mapped
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            for start in range(0, len(mapped), block_size):
+                block = mapped[start : start + block_size]
+                if hasher is not None:
+                    hasher.update(block)
+                yield block
+
+
+def read_text(file_path: str, hasher=None) -> Iterator[str]:
+    """
+    Decode a file as UTF-8 while it is read by read_blocks(), translating
+    newlines like open() does.
+    """
+    decoder = io.IncrementalNewlineDecoder(
+        codecs.getincrementaldecoder("utf-8")(), translate=True
+    )
+    try:
+        for block in read_blocks(file_path, hasher):
+            text = decoder.decode(block)
+            if text:
+                yield text
+        text = decoder.decode(b"", final=True)
+        if text:
+            yield text
+    except UnicodeDecodeError as e:
+        raise ValueError(f"Could not decode file {file_path}: {e}") from e
+
+
+def read_lines(
+    file_path: str, hasher=None, max_length: int = READ_BLOCK_SIZE
+) -> Iterator[str]:
+    """
+    Yield the lines of a file, without line endings, as it is read. Lines
+    longer than max_length are broken at whitespace so memory stays bounded.
+    """
+    pending = ""
+    for text in read_text(file_path, hasher):
+        *lines, pending = (pending + text).split("\n")
+        yield from lines
+        while len(pending) > max_length:
+            cut = pending.rfind(" ", 0, max_length)
+            cut = cut if cut > 0 else max_length
+            yield pending[:cut]
+            pending = pending[cut:]
+    if pending:
+        yield pending
+
+
+MONTHS = {
+    name: i + 1
+    for i, names in enumerate(
+        [
+            ("january", "jan"),
+            ("february", "feb"),
+            ("march", "mar"),
+            ("april", "apr"),
+            ("may",),
+            ("june", "jun"),
+            ("july", "jul"),
+            ("august", "aug"),
+            ("september", "sep", "sept"),
+            ("october", "oct"),
+            ("november", "nov"),
+            ("december", "dec"),
+        ]
+    )
+    for name in names
+}
+_MONTH = "(" + "|".join(sorted(MONTHS, key=len, reverse=True)) + r")\.?"
+_ISO_DATE = re.compile(r"(?<!\d)(\d{4})[-_.](\d{2})[-_.](\d{2})(?!\d)")
+_MONTH_DAY_YEAR = re.compile(
+    rf"\b{_MONTH}\s+(\d{{1,2}})(?:st|nd|rd|th)?\b(?:,?\s+(\d{{4}}))?", re.IGNORECASE
+)
+_DAY_MONTH_YEAR = re.compile(
+    rf"\b(\d{{1,2}})(?:st|nd|rd|th)?\s+{_MONTH}(?:,?\s+(\d{{4}}))?\b", re.IGNORECASE
+)
+
+
+def parse_date(text: str, default_year: int | None = None) -> datetime | None:
+    """
+    Find a date in text: "2024-05-01", "May 1, 2024" or "1 May 2024". Dates
+    without a year use default_year, and are ignored if it is None.
+    """
+    match = _ISO_DATE.search(text)
+    if match:
+        year, month, day = (int(g) for g in match.groups())
+        return _make_date(year, month, day)
+    for pattern, order in ((_MONTH_DAY_YEAR, "mdy"), (_DAY_MONTH_YEAR, "dmy")):
+        match = pattern.search(text)
+        if not match:
+            continue
+        if order == "mdy":
+            month_name, day, year = match.groups()
+        else:
+            day, month_name, year = match.groups()
+        year = int(year) if year else default_year
+        if year is None:
+            continue
+        return _make_date(year, MONTHS[month_name.lower()], int(day))
+    return None
+
+
+def _make_date(year: int, month: int, day: int) -> datetime | None:
+    try:
+        return datetime(year, month, day)
+    except ValueError:
+        return None
+
+
 def format_date(ts: float) -> str:
     return datetime.fromtimestamp(ts).strftime("%A, %B %d, %Y")
+
+
+def note_header(
+    file_name: str,
+    created_at: float,
+    modified_at: float,
+    event_date: float | None = None,
+) -> str:
+    """The header naming a note and its dates that a chunk's text starts with."""
+    dated = f", dated '{format_date(event_date)}'" if event_date else ""
+    return (
+        f"User note: title '{file_name}', created at '{format_date(created_at)}',"
+        f" last modified at '{format_date(modified_at)}'{dated}: "
+    )
+
+
+# Chunk texts stored with their header, before only their content was
+_STORED_HEADER = re.compile(r"User note: title '")
+
+
+def note_text(document: str, metadata: dict | None) -> str:
+    """
+    A stored chunk's text as given to the lang model: its content preceded
+    by the header naming its note and dates, from the chunk's metadata.
+    """
+    if not metadata or not document or _STORED_HEADER.match(document):
+        return document
+    created_at, modified_at = metadata.get("created_at"), metadata.get("modified_at")
+    if not metadata.get("file") or not created_at or not modified_at:
+        return document
+    # Chunks without a date of their own are stored with the file's
+    event_date = metadata.get("event_date")
+    header = note_header(
+        os.path.basename(metadata["file"]),
+        created_at,
+        modified_at,
+        event_date if event_date != created_at else None,
+    )
+    return header + document
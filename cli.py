@@ -1,18 +1,31 @@
-from rich.table import Table
-from rich.console import Console
-import typer
-from typing import List
 from pathlib import Path
+
+import dotenv
 import requests
-from rich.panel import Panel
+import typer
+from rich.console import Console
 from rich.markup import escape
-from api import QueryResponse, ContextChunk, IndexMetricsResponse
-import dotenv
+from rich.panel import Panel
+from rich.table import Table
+
+from api import (
+    ChatMessageResponse,
+    ContextChunk,
+    IndexMetricsResponse,
+    QueryResponse,
+    SnapshotResponse,
+    TuneResponse,
+)
 
 dotenv.load_dotenv()
 
 WHISPER_NOTE_DAEMON_URL = "http://localhost:8000"
 TIMEOUT = 60  # seconds
+# Tuning builds an index per parameter combination
+TUNE_TIMEOUT = 1800  # seconds
+# Ask the daemon to answer a little before we give up, so it does not keep
+# working on a request nobody is waiting for.
+QUERY_DEADLINE = TIMEOUT - 5  # seconds
 
 app = typer.Typer(help="Whisper Note: Index and query your files with AI.")
 
@@ -27,7 +40,7 @@ def index(
     directory: Path = typer.Argument(
         ..., exists=True, file_okay=False, dir_okay=True, help="Directory to index."
     ),
-    file_extensions: List[str] = typer.Option(
+    file_extensions: list[str] = typer.Option(
         [".txt", ".md"], help="File extensions to include."
     ),
 ):
@@ -56,6 +69,88 @@ def status():
         console.print(f"[red]Failed to retrieve index status: {e}[/red]")
 
 
+@app.command(
+    name="export",
+    help="Export the index, embeddings included, to a snapshot file.",
+    short_help="Export the index to a file.",
+    rich_help_panel="Commands",
+)
+def export(
+    path: Path = typer.Argument(..., dir_okay=False, help="Snapshot file to write."),
+):
+    console = Console()
+    try:
+        snapshot = submit_post_snapshot("export", str(path.resolve()))
+        console.print(show_snapshot(snapshot))
+    except (requests.exceptions.RequestException, ValueError) as e:
+        console.print(f"[red]Export failed: {e}[/red]")
+
+
+@app.command(
+    name="import",
+    help="Load a snapshot file into the index without re-embedding it.",
+    short_help="Import the index from a file.",
+    rich_help_panel="Commands",
+)
+def import_(
+    path: Path = typer.Argument(
+        ..., exists=True, dir_okay=False, help="Snapshot file to load."
+    ),
+    force: bool = typer.Option(
+        False, help="Import a snapshot made with another embedding model."
+    ),
+):
+    console = Console()
+    try:
+        snapshot = submit_post_snapshot("import", str(path.resolve()), force)
+        console.print(show_snapshot(snapshot))
+    except (requests.exceptions.RequestException, ValueError) as e:
+        console.print(f"[red]Import failed: {e}[/red]")
+
+
+@app.command(
+    name="tune",
+    help=(
+        "Measure recall@k against exact search and query latency of HNSW"
+        " parameter combinations on the indexed vectors."
+    ),
+    short_help="Tune the vector index.",
+    rich_help_panel="Commands",
+)
+def tune(
+    query: list[str] | None = typer.Option(
+        None, help="A real query to tune on; by default stored chunks are used."
+    ),
+    k: int = typer.Option(10, help="Results per query."),
+    sample_size: int = typer.Option(100, help="Stored chunks to query with."),
+    target_recall: float = typer.Option(0.95, help="Recall@k to reach."),
+    apply: bool = typer.Option(False, help="Use the recommended search_ef."),
+):
+    console = Console()
+    try:
+        tuning = submit_post_tune(
+            {
+                "k": k,
+                "sample_size": sample_size,
+                "queries": query or None,
+                "target_recall": target_recall,
+                "apply": apply,
+            }
+        )
+        console.print(show_tuning(tuning))
+        if tuning.recommended is None:
+            console.print(
+                "[yellow]No result for the index's m and construction_ef[/yellow]"
+            )
+        elif tuning.applied:
+            console.print(
+                f"search_ef set to {tuning.recommended.search_ef};"
+                " restart the daemon for it to take effect."
+            )
+    except (requests.exceptions.RequestException, ValueError) as e:
+        console.print(f"[red]Tuning failed: {e}[/red]")
+
+
 @app.command(
     name="query",
     help="Ask the AI a question.",
@@ -70,13 +165,15 @@ def query(
 ):
     console = Console()
     try:
-        payload = {"query": question}
+        payload = {"query": question, "timeout": QUERY_DEADLINE}
         resp = submit_post_query(payload)
         if not resp.answer:
             console.print("[yellow]No answer found in response.[/yellow]")
             return
         view = show_answer(resp.answer)
         console.print(view)
+        if getattr(resp, "degradations", None):
+            console.print(show_degradations(resp.degradations))
         if debug and resp.context:
             for panel in show_context(resp.context):
                 console.print(panel)
@@ -99,6 +196,8 @@ def chat(
     console.print(
         "Type your question and press Enter. Type 'q' or 'Ctrl+C' to end the session.\n"
     )
+    # The daemon keeps the conversation and its context between questions
+    session_id = None
     while True:
         try:
             try:
@@ -112,9 +211,14 @@ def chat(
             if not question.strip():
                 continue  # Ignore empty or whitespace-only input
 
-            # Submit query
+            # Submit the message, starting a new session if it expired
             with console.status("Thinking...", spinner="dots"):
-                resp = submit_post_query({"query": question, "debug": debug})
+                if session_id is None:
+                    session_id = submit_post_session()
+                resp = submit_post_message(session_id, question)
+                if resp is None:
+                    session_id = submit_post_session()
+                    resp = submit_post_message(session_id, question)
 
             # Show answer
             console.print()
@@ -122,6 +226,8 @@ def chat(
                 console.print(show_answer(resp.answer))
             else:
                 console.print(no_answer_found())
+            if getattr(resp, "degradations", None):
+                console.print(show_degradations(resp.degradations))
 
             # Show context if debug is enabled
             if debug and resp.context:
@@ -144,10 +250,57 @@ def show_index_metrics(metrics: IndexMetricsResponse) -> Table:
     metrics_table.add_row("Indexed files", str(metrics.file_count))
     metrics_table.add_row("Indexed chunks", str(metrics.chunk_count))
     metrics_table.add_row("Failed files", str(len(metrics.failed_files)))
+    for label, count in [
+        ("Removed files", getattr(metrics, "removed_count", 0)),
+        ("Renamed files", getattr(metrics, "renamed_count", 0)),
+    ]:
+        if count:
+            metrics_table.add_row(label, str(count))
     return metrics_table
 
 
-def show_context(context: List[ContextChunk]) -> List[Panel]:
+def show_snapshot(snapshot: SnapshotResponse) -> Table:
+    """Return a Table describing an exported or imported snapshot."""
+    table = Table(show_header=True, header_style="bold magenta")
+    table.add_column("Snapshot", style="dim")
+    table.add_column("Value", style="bold")
+    table.add_row("File", snapshot.path)
+    table.add_row("Files", str(snapshot.file_count))
+    table.add_row("Chunks", str(snapshot.count))
+    table.add_row("Embedding model", snapshot.embedding_model)
+    table.add_row("Dimensions", str(snapshot.dimension))
+    return table
+
+
+def show_tuning(tuning: TuneResponse) -> Table:
+    """Return a Table of recall against latency, the recommendation marked."""
+    config = tuning.config
+    table = Table(
+        title=(
+            f"space={config.space} m={config.m}"
+            f" construction_ef={config.construction_ef} search_ef={config.search_ef}"
+        ),
+        show_header=True,
+        header_style="bold magenta",
+    )
+    for column in ["m", "construction_ef", "search_ef", "Recall", "ms", "p95 ms"]:
+        table.add_column(column, justify="right")
+    table.add_column("Build s", justify="right", style="dim")
+    for r in tuning.results:
+        table.add_row(
+            str(r.m),
+            str(r.construction_ef),
+            str(r.search_ef),
+            f"{r.recall:.3f}",
+            f"{r.latency_ms:.2f}",
+            f"{r.p95_latency_ms:.2f}",
+            f"{r.build_seconds:.1f}",
+            style="bold green" if r == tuning.recommended else None,
+        )
+    return table
+
+
+def show_context(context: list[ContextChunk]) -> list[Panel]:
     """Return a list of Panels for the relevant context provided to the lang model."""
     panels = []
     for idx, chunk in enumerate(context, start=1):
@@ -172,6 +325,12 @@ def no_answer_found() -> Panel:
     )
 
 
+def show_degradations(degradations: list[str]) -> str:
+    """Return a note listing the shortcuts taken to answer within the deadline."""
+    steps = ", ".join(d.replace("_", " ") for d in degradations)
+    return f"[dim]Answered under time pressure: {escape(steps)}[/dim]"
+
+
 def show_answer(answer: str) -> Panel:
     """Return the Panel for the answer provided by the lang model."""
     return Panel(
@@ -192,6 +351,25 @@ def submit_post_query(payload: dict) -> QueryResponse:
     return QueryResponse(**resp.json())
 
 
+def submit_post_session() -> str:
+    resp = requests.post(f"{WHISPER_NOTE_DAEMON_URL}/api/v1/sessions", timeout=TIMEOUT)
+    resp.raise_for_status()
+    return resp.json()["session_id"]
+
+
+def submit_post_message(session_id: str, message: str) -> ChatMessageResponse | None:
+    """Send a chat message. Returns None if the session no longer exists."""
+    resp = requests.post(
+        f"{WHISPER_NOTE_DAEMON_URL}/api/v1/sessions/{session_id}/messages",
+        json={"message": message, "timeout": QUERY_DEADLINE},
+        timeout=TIMEOUT,
+    )
+    if resp.status_code == 404:
+        return None
+    resp.raise_for_status()
+    return ChatMessageResponse(**resp.json())
+
+
 def submit_get_index() -> IndexMetricsResponse:
     resp = requests.get(f"{WHISPER_NOTE_DAEMON_URL}/api/v1/index", timeout=TIMEOUT)
     resp.raise_for_status()
@@ -213,5 +391,31 @@ def submit_post_index(
     return IndexMetricsResponse(**resp.json())
 
 
+def submit_post_snapshot(
+    action: str, path: str, force: bool = False
+) -> SnapshotResponse:
+    resp = requests.post(
+        f"{WHISPER_NOTE_DAEMON_URL}/api/v1/snapshot/{action}",
+        json={"path": path, "force": force},
+        timeout=TIMEOUT,
+    )
+    if resp.status_code == 400:
+        raise ValueError(resp.json()["error"])
+    resp.raise_for_status()
+    return SnapshotResponse(**resp.json())
+
+
+def submit_post_tune(payload: dict) -> TuneResponse:
+    resp = requests.post(
+        f"{WHISPER_NOTE_DAEMON_URL}/api/v1/index/tune",
+        json=payload,
+        timeout=TUNE_TIMEOUT,
+    )
+    if resp.status_code == 400:
+        raise ValueError(resp.json()["error"])
+    resp.raise_for_status()
+    return TuneResponse(**resp.json())
+
+
 if __name__ == "__main__":
     app()
@@ -0,0 +1,35 @@
+import time
+
+
+class DeadlineExceeded(Exception):
+    """Raised when a request runs out of time before it can produce a result."""
+
+
+class Deadline:
+    """
+    A point in time by which a request must complete, measured on the
+    monotonic clock so it is unaffected by wall-clock changes.
+    """
+
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self) -> float:
+        """Seconds left before the deadline, never negative."""
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def check(self, stage: str):
+        """Raise DeadlineExceeded if the deadline has passed."""
+        if self.expired():
+            raise DeadlineExceeded(
+                f"Deadline of {self.seconds:.1f}s exceeded before {stage}"
+            )
+
+    def timeout(self, cap: float | None = None) -> float:
+        """Remaining time, optionally capped, for use as an I/O timeout."""
+        remaining = self.remaining()
+        return min(remaining, cap) if cap is not None else remaining
@@ -0,0 +1,217 @@
+import hashlib
+import random
+import re
+import sqlite3
+import struct
+import threading
+from collections.abc import Iterable
+
+# Chunks whose estimated Jaccard similarity (of their word shingles) is at
+# least this are near duplicates
+NEAR_DUPLICATE_SIMILARITY = 0.7
+# Texts with fewer shingles than this only match exact duplicates; a single
+# changed word is too large a part of a short text
+MIN_NEAR_DUPLICATE_SHINGLES = 8
+
+_WORD = re.compile(r"\w+")
+_PRIME = (1 << 61) - 1
+_NUM_HASHES = 32
+_BANDS = 8  # Chunks sharing the hashes of any band are compared
+_ROWS = _NUM_HASHES // _BANDS
+# Fixed, so signatures stay comparable across runs
+_PERMUTATIONS = [
+    (rng.randrange(1, _PRIME), rng.randrange(0, _PRIME))
+    for rng in [random.Random(0x5EED)]
+    for _ in range(_NUM_HASHES)
+]
+
+Signature = tuple[int, ...]
+
+
+def shingles(text: str, size: int = 3) -> list[str]:
+    """Overlapping runs of size words of text, lowercased."""
+    words = _WORD.findall(text.lower())
+    if len(words) <= size:
+        return [" ".join(words)] if words else []
+    return [" ".join(words[i : i + size]) for i in range(len(words) - size + 1)]
+
+
+def minhash(text: str) -> Signature:
+    """
+    MinHash signature of text's word shingles. The share of positions two
+    signatures agree on estimates the Jaccard similarity of the texts.
+    """
+    hashes = {
+        int.from_bytes(
+            hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest(), "big"
+        )
+        for s in shingles(text)
+    } or {0}
+    return tuple(
+        min((a * h + b) % _PRIME for h in hashes) & 0xFFFFFFFF for a, b in _PERMUTATIONS
+    )
+
+
+def similarity(a: Signature, b: Signature) -> float:
+    return sum(x == y for x, y in zip(a, b)) / len(a)
+
+
+def min_similarity(text: str) -> float:
+    """How similar another chunk must be to text to be its duplicate."""
+    if len(shingles(text)) < MIN_NEAR_DUPLICATE_SHINGLES:
+        return 1.0
+    return NEAR_DUPLICATE_SIMILARITY
+
+
+def signature_key(signature: Signature) -> str:
+    """Short, stable identifier of a signature."""
+    return hashlib.blake2b(_pack(signature), digest_size=8).hexdigest()
+
+
+class FingerprintIndex:
+    """
+    SQLite-backed index of the MinHash signatures of unique chunks, for
+    finding near duplicates, and of their SHA-256 for exact ones.
+    Signatures are split into bands (locality-sensitive hashing) so a
+    lookup only compares the chunks that agree with it on a whole band.
+    """
+
+    def __init__(self, path: str = ":memory:"):
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        bands = ", ".join(f"b{i} INTEGER NOT NULL" for i in range(_BANDS))
+        with self._lock, self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS fingerprints ("
+                " chunk_id TEXT PRIMARY KEY,"
+                " file TEXT NOT NULL,"
+                " signature BLOB NOT NULL,"
+                f" {bands},"
+                " body_hash TEXT NOT NULL DEFAULT '')"
+            )
+            columns = {
+                row[1] for row in self._conn.execute("PRAGMA table_info(fingerprints)")
+            }
+            if "body_hash" not in columns:
+                # Indexes made before exact duplicates were told apart
+                self._conn.execute(
+                    "ALTER TABLE fingerprints"
+                    " ADD COLUMN body_hash TEXT NOT NULL DEFAULT ''"
+                )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS fingerprints_file ON fingerprints (file)"
+            )
+            for i in range(_BANDS):
+                self._conn.execute(
+                    f"CREATE INDEX IF NOT EXISTS fingerprints_b{i} ON fingerprints (b{i})"
+                )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS fingerprints_body_hash"
+                " ON fingerprints (body_hash)"
+            )
+
+    def add(self, chunk_id: str, file: str, signature: Signature, body_hash: str = ""):
+        bands = ", ".join(f"b{i}" for i in range(_BANDS))
+        with self._lock, self._conn:
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO fingerprints (chunk_id, file, signature,"
+                f" {bands}, body_hash) VALUES (?, ?, ?{', ?' * _BANDS}, ?)",
+                (chunk_id, file, _pack(signature), *_bands(signature), body_hash),
+            )
+
+    def find_exact(
+        self, body_hash: str, exclude: Iterable[str] = ()
+    ) -> tuple[str, Signature] | None:
+        """
+        The (chunk_id, signature) of an indexed chunk with this body, other
+        than those in exclude, or None.
+        """
+        exclude = set(exclude)
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT chunk_id, signature FROM fingerprints WHERE body_hash = ?",
+                (body_hash,),
+            ).fetchall()
+        for chunk_id, packed in rows:
+            if chunk_id not in exclude:
+                return chunk_id, _unpack(packed)
+        return None
+
+    def find(
+        self,
+        signature: Signature,
+        min_similarity: float = NEAR_DUPLICATE_SIMILARITY,
+        exclude: Iterable[str] = (),
+    ) -> tuple[str, Signature] | None:
+        """
+        The (chunk_id, signature) of the most similar indexed chunk, other
+        than those in exclude, that is at least min_similarity similar, or
+        None.
+        """
+        exclude = set(exclude)
+        where = " OR ".join(f"b{i} = ?" for i in range(_BANDS))
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT chunk_id, signature FROM fingerprints WHERE {where}",
+                _bands(signature),
+            ).fetchall()
+        best = None
+        for chunk_id, packed in rows:
+            if chunk_id in exclude:
+                continue
+            candidate = _unpack(packed)
+            score = similarity(signature, candidate)
+            if score >= min_similarity and (best is None or score > best[0]):
+                best = (score, chunk_id, candidate)
+        return (best[1], best[2]) if best else None
+
+    def delete(self, chunk_id: str):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "DELETE FROM fingerprints WHERE chunk_id = ?", (chunk_id,)
+            )
+
+    def delete_file(self, file: str):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM fingerprints WHERE file = ?", (file,))
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM fingerprints").fetchone()[0]
+
+    def items(self) -> list[tuple[str, str, Signature, str]]:
+        """(chunk_id, file, signature, body_hash) of every indexed chunk."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT chunk_id, file, signature, body_hash FROM fingerprints"
+                " ORDER BY chunk_id"
+            ).fetchall()
+        return [
+            (chunk_id, file, _unpack(packed), body_hash)
+            for chunk_id, file, packed, body_hash in rows
+        ]
+
+    def close(self):
+        self._conn.close()
+
+
+def _pack(signature: Signature) -> bytes:
+    return struct.pack(f"<{len(signature)}I", *signature)
+
+
+def _unpack(packed: bytes) -> Signature:
+    return struct.unpack(f"<{len(packed) // 4}I", packed)
+
+
+def _bands(signature: Signature) -> tuple[int, ...]:
+    """One signed 64-bit key per band, for SQLite's INTEGER columns."""
+    return tuple(
+        int.from_bytes(
+            hashlib.blake2b(
+                _pack(signature[i * _ROWS : (i + 1) * _ROWS]), digest_size=8
+            ).digest(),
+            "big",
+            signed=True,
+        )
+        for i in range(_BANDS)
+    )
@@ -1,12 +1,24 @@
 from sentence_transformers import SentenceTransformer
-from typing import List
+
+DEFAULT_MODEL_NAME = "all-MiniLM-L6-v2"
 
 
 class Embedder:
-    def __init__(self, model_name: str = "all-MiniLM-L6-v2"):
+    def __init__(self, model_name: str = DEFAULT_MODEL_NAME):
+        self.model_name = model_name
         self.model = SentenceTransformer(model_name)
 
-    def embed(self, texts: List[str]) -> List[List[float]]:
+    @property
+    def tokenizer(self):
+        """The model's Hugging Face tokenizer."""
+        return self.model.tokenizer
+
+    @property
+    def max_seq_length(self) -> int:
+        """Tokens per input the model embeds; anything longer is truncated."""
+        return self.model.max_seq_length
+
+    def embed(self, texts: list[str]) -> list[list[float]]:
         """
         Generate embeddings for a list of texts.
         Returns a list of vectors (one per text).
@@ -21,7 +33,7 @@ class Embedder:
             result = [v.tolist() for v in result]
         return result
 
-    def embed_one(self, text: str) -> List[float]:
+    def embed_one(self, text: str) -> list[float]:
         """
         Generate an embedding for a single text.
         Ensures output is always a list of floats.
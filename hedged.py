@@ -0,0 +1,344 @@
+import asyncio
+import bisect
+import contextlib
+import logging
+import threading
+import time
+from collections.abc import AsyncIterator, Awaitable, Callable
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+
+from lang_model import LangModel, LangModelError
+
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0, 30.0, 60.0, float("inf"))
+
+
+class LatencyHistogram:
+    """Fixed-bucket latency histogram."""
+
+    def __init__(self, buckets: tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.total = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float):
+        with self._lock:
+            self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+            self.count += 1
+            self.total += seconds
+
+    def quantile(self, q: float) -> float | None:
+        """Upper bound of the bucket holding the q-th quantile."""
+        if self.count == 0:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, n in zip(self.buckets, self.counts):
+            seen += n
+            if seen >= rank:
+                return bound
+        return self.buckets[-1]
+
+    def to_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "mean": self.total / self.count if self.count else None,
+            "p50": self.quantile(0.5),
+            "p99": self.quantile(0.99),
+            "buckets": {
+                ("+Inf" if b == float("inf") else str(b)): n
+                for b, n in zip(self.buckets, self.counts)
+            },
+        }
+
+
+@dataclass
+class Backend:
+    """
+    A language model in a HedgedLangModel.
+    first_token_deadline: seconds to wait for this backend's first token
+    before a hedged request is sent to the next backend.
+    """
+
+    lang_model: LangModel
+    first_token_deadline: float = 2.0
+    name: str | None = None
+
+    def __post_init__(self):
+        if not self.name:
+            model = getattr(self.lang_model, "model", None)
+            self.name = type(self.lang_model).__name__ + (f":{model}" if model else "")
+
+
+@dataclass
+class BackendStats:
+    first_token: LatencyHistogram = field(default_factory=LatencyHistogram)
+    total: LatencyHistogram = field(default_factory=LatencyHistogram)
+    wins: int = 0
+    hedges: int = 0
+    errors: int = 0
+
+    def to_dict(self) -> dict:
+        return {
+            "first_token": self.first_token.to_dict(),
+            "total": self.total.to_dict(),
+            "wins": self.wins,
+            "hedges": self.hedges,
+            "errors": self.errors,
+        }
+
+
+class HedgedLangModel(LangModel):
+    """
+    Composite language model over an ordered list of backends.
+
+    The primary backend is asked first. If it has not produced its first token
+    within its deadline, a hedged request is sent to the next backend, and so
+    on. The first backend to produce a token wins and the others are
+    cancelled. A backend that fails is skipped immediately in favour of the
+    next one, so the composite also acts as a fallback chain.
+    """
+
+    def __init__(self, backends: list[Backend]):
+        if not backends:
+            raise ValueError("HedgedLangModel requires at least one backend")
+        self.backends = backends
+        self.stats: dict[str, BackendStats] = {b.name: BackendStats() for b in backends}
+        self._executor = ThreadPoolExecutor(
+            max_workers=2 * len(backends), thread_name_prefix="hedged"
+        )
+
+    def generate(
+        self,
+        prompt: str,
+        max_tokens: int | None = None,
+        timeout: float | None = None,
+    ) -> str:
+        """
+        Sync variant. Without streaming, the deadline applies to the whole
+        answer, and a losing backend's thread runs to completion in the
+        background with its result discarded.
+        """
+        return self._hedge(lambda lm: lm.generate(prompt, max_tokens, timeout))
+
+    def chat(
+        self,
+        messages: list[dict[str, str]],
+        max_tokens: int | None = None,
+        timeout: float | None = None,
+    ) -> str:
+        return self._hedge(lambda lm: lm.chat(messages, max_tokens, timeout))
+
+    def generate_json(
+        self,
+        prompt: str,
+        schema: dict | None = None,
+        max_tokens: int | None = None,
+        timeout: float | None = None,
+    ) -> str:
+        return self._hedge(
+            lambda lm: lm.generate_json(prompt, schema, max_tokens, timeout)
+        )
+
+    async def agenerate(
+        self,
+        prompt: str,
+        max_tokens: int | None = None,
+        timeout: float | None = None,
+    ) -> str:
+        answer = ""
+        async for token in self.astream(prompt, max_tokens, timeout):
+            answer += token
+        return answer.strip()
+
+    async def achat(
+        self,
+        messages: list[dict[str, str]],
+        max_tokens: int | None = None,
+        timeout: float | None = None,
+    ) -> str:
+        """As generate, the deadline applies to the whole answer."""
+        return await self._ahedge_once(
+            lambda lm: lm.achat(messages, max_tokens, timeout)
+        )
+
+    async def agenerate_json(
+        self,
+        prompt: str,
+        schema: dict | None = None,
+        max_tokens: int | None = None,
+        timeout: float | None = None,
+    ) -> str:
+        """As generate, the deadline applies to the whole answer."""
+        return await self._ahedge_once(
+            lambda lm: lm.agenerate_json(prompt, schema, max_tokens, timeout)
+        )
+
+    async def astream(
+        self,
+        prompt: str,
+        max_tokens: int | None = None,
+        timeout: float | None = None,
+    ) -> AsyncIterator[str]:
+        async for token in self._ahedge(
+            lambda lm: lm.astream(prompt, max_tokens, timeout)
+        ):
+            yield token
+
+    def _hedge(self, call: Callable[[LangModel], str]) -> str:
+        """Make a blocking call to the backends in turn, hedging as generate does."""
+        futures = {}
+        pending = list(self.backends)
+        errors = []
+
+        def launch() -> Backend:
+            backend = pending.pop(0)
+            if futures:
+                self.stats[backend.name].hedges += 1
+            future = self._executor.submit(self._timed_call, backend, call)
+            futures[future] = backend
+            return backend
+
+        current = launch()
+        while futures:
+            # How long to wait before hedging, not the call's own timeout
+            wait_for = current.first_token_deadline if pending else None
+            done, _ = wait(futures, timeout=wait_for, return_when=FIRST_COMPLETED)
+            if not done:
+                current = launch()
+                continue
+            for future in done:
+                backend = futures.pop(future)
+                try:
+                    answer = future.result()
+                except LangModelError as e:
+                    errors.append(e)
+                    if pending:
+                        current = launch()
+                    continue
+                self.stats[backend.name].wins += 1
+                for loser in futures:
+                    loser.cancel()
+                return answer
+        raise self._all_failed(errors)
+
+    async def _ahedge_once(self, call: Callable[[LangModel], Awaitable[str]]) -> str:
+        """Hedge a call whose answer arrives whole, as a stream of one token."""
+
+        async def once(lang_model: LangModel) -> AsyncIterator[str]:
+            yield await call(lang_model)
+
+        answer = ""
+        async for token in self._ahedge(once):
+            answer += token
+        return answer
+
+    async def _ahedge(
+        self, open_stream: Callable[[LangModel], AsyncIterator[str]]
+    ) -> AsyncIterator[str]:
+        """Stream from the backends in turn, hedging on their first token."""
+        attempts: dict[asyncio.Task, tuple[Backend, AsyncIterator[str], float]] = {}
+        pending = list(self.backends)
+        errors = []
+        winner = None
+
+        def launch() -> Backend:
+            backend = pending.pop(0)
+            if attempts:
+                self.stats[backend.name].hedges += 1
+                logging.getLogger(__name__).debug(f"Hedging request to {backend.name}")
+            stream = open_stream(backend.lang_model)
+            task = asyncio.ensure_future(self._first_token(stream))
+            attempts[task] = (backend, stream, time.monotonic())
+            return backend
+
+        try:
+            current = launch()
+            while attempts and winner is None:
+                # How long to wait before hedging, not the call's own timeout
+                wait_for = current.first_token_deadline if pending else None
+                done, _ = await asyncio.wait(
+                    attempts, timeout=wait_for, return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    current = launch()
+                    continue
+                for task in done:
+                    backend, stream, started = attempts.pop(task)
+                    try:
+                        token = task.result()
+                    except LangModelError as e:
+                        self.stats[backend.name].errors += 1
+                        errors.append(e)
+                        await stream.aclose()
+                        if pending:
+                            current = launch()
+                        continue
+                    self.stats[backend.name].first_token.record(
+                        time.monotonic() - started
+                    )
+                    winner = (backend, stream, started, token)
+                    break
+            if winner is None:
+                raise self._all_failed(errors)
+        finally:
+            # Cancel the losers (and everything, if we are being cancelled)
+            await self._cancel(attempts)
+
+        backend, stream, started, token = winner
+        self.stats[backend.name].wins += 1
+        try:
+            if token:
+                yield token
+            async for token in stream:
+                yield token
+        finally:
+            self.stats[backend.name].total.record(time.monotonic() - started)
+            await stream.aclose()
+
+    def latency_stats(self) -> dict:
+        return {name: stats.to_dict() for name, stats in self.stats.items()}
+
+    def _timed_call(self, backend: Backend, call: Callable[[LangModel], str]) -> str:
+        started = time.monotonic()
+        try:
+            answer = call(backend.lang_model)
+        except LangModelError:
+            self.stats[backend.name].errors += 1
+            raise
+        elapsed = time.monotonic() - started
+        self.stats[backend.name].first_token.record(elapsed)
+        self.stats[backend.name].total.record(elapsed)
+        return answer
+
+    @staticmethod
+    async def _first_token(stream: AsyncIterator[str]) -> str:
+        try:
+            return await stream.__anext__()
+        except StopAsyncIteration:
+            return ""
+
+    @staticmethod
+    async def _cancel(attempts):
+        for task in attempts:
+            task.cancel()
+        for task, (_, stream, _) in attempts.items():
+            # A loser's failure no longer matters
+            with contextlib.suppress(asyncio.CancelledError, LangModelError):
+                await task
+            await stream.aclose()
+
+    @staticmethod
+    def _all_failed(errors: list[LangModelError]) -> LangModelError:
+        if errors:
+            last = errors[-1]
+            return LangModelError(
+                "Hedged",
+                "all backends failed: " + "; ".join(str(e) for e in errors),
+                status_code=last.status_code,
+                retryable=any(e.retryable for e in errors),
+            )
+        return LangModelError("Hedged", "no backend produced a response")
@@ -0,0 +1,242 @@
+import asyncio
+import random
+import threading
+from collections.abc import AsyncIterator
+from dataclasses import dataclass
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from lang_model import LangModelError
+
+
+@dataclass
+class RetryPolicy:
+    """
+    Exponential-backoff retry policy for calls to remote language models.
+    Retries are attempted on connection errors and on the status codes in
+    status_forcelist. The delay before retry n is
+    backoff_factor * 2^(n-1) plus up to `jitter` seconds of random jitter,
+    capped at backoff_max.
+    """
+
+    max_retries: int = 3
+    backoff_factor: float = 0.5
+    backoff_max: float = 10.0
+    jitter: float = 0.25
+    status_forcelist: tuple[int, ...] = (429, 500, 502, 503, 504)
+
+    def to_urllib3(self) -> Retry:
+        return Retry(
+            total=self.max_retries,
+            connect=self.max_retries,
+            read=0,  # Never replay a request after the model started answering
+            status=self.max_retries,
+            allowed_methods=frozenset(["GET", "POST"]),
+            status_forcelist=self.status_forcelist,
+            backoff_factor=self.backoff_factor,
+            backoff_max=self.backoff_max,
+            backoff_jitter=self.jitter,
+            raise_on_status=False,  # Hand the final response back to the caller
+            respect_retry_after_header=True,
+        )
+
+    def backoff(self, attempt: int) -> float:
+        """Seconds to wait before the given (1-based) retry attempt."""
+        delay = self.backoff_factor * (2 ** (attempt - 1))
+        delay += random.uniform(0, self.jitter)
+        return min(delay, self.backoff_max)
+
+
+@dataclass
+class Timeouts:
+    """Connect and read timeouts in seconds."""
+
+    connect: float = 5.0
+    read: float = 60.0
+
+    def as_tuple(self) -> tuple[float, float]:
+        return (self.connect, self.read)
+
+    def as_httpx(self) -> httpx.Timeout:
+        return httpx.Timeout(self.read, connect=self.connect)
+
+    def capped(self, limit: float | None) -> "Timeouts":
+        """Timeouts no longer than limit seconds (e.g. a request's remaining time)."""
+        if limit is None:
+            return self
+        return Timeouts(connect=min(self.connect, limit), read=min(self.read, limit))
+
+
+def build_session(
+    retry_policy: RetryPolicy = None, pool_maxsize: int = 10
+) -> requests.Session:
+    """
+    Build a requests.Session that keeps connections alive between calls
+    and retries transient failures according to the retry policy.
+    """
+    retry_policy = retry_policy or RetryPolicy()
+    adapter = HTTPAdapter(
+        max_retries=retry_policy.to_urllib3(),
+        pool_connections=pool_maxsize,
+        pool_maxsize=pool_maxsize,
+    )
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def to_lang_model_error(
+    backend: str, e: requests.exceptions.RequestException
+) -> LangModelError:
+    """Convert a requests exception into a structured LangModelError."""
+    response = getattr(e, "response", None)
+    if response is not None:
+        return LangModelError(
+            backend,
+            f"responded with {response.status_code}: {response.text}",
+            status_code=response.status_code,
+            retryable=response.status_code in RetryPolicy.status_forcelist,
+        )
+    retryable = isinstance(
+        e, (requests.exceptions.ConnectionError, requests.exceptions.Timeout)
+    )
+    return LangModelError(backend, str(e), retryable=retryable)
+
+
+class AsyncSession:
+    """
+    Lazily creates a pooled httpx.AsyncClient for the running event loop.
+    httpx clients are bound to the loop they were first used on, so a new
+    client is created if the session is used from a different loop, and
+    the old one is closed on its own loop.
+    """
+
+    def __init__(
+        self,
+        timeouts: Timeouts | None = None,
+        max_connections: int = 100,
+        headers: dict | None = None,
+    ):
+        self.timeouts = timeouts or Timeouts()
+        self.max_connections = max_connections
+        self.headers = headers or {}
+        self._client = None
+        self._loop = None
+
+    def client(self) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        if self._client is not None and self._loop is not loop:
+            _close_on_loop(self._client, self._loop)
+            self._client = None
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                timeout=self.timeouts.as_httpx(),
+                headers=self.headers,
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections,
+                ),
+            )
+            self._loop = loop
+        return self._client
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+            self._loop = None
+
+
+def _close_on_loop(client: httpx.AsyncClient, loop: asyncio.AbstractEventLoop):
+    """
+    Close a client on the event loop it is bound to, other than the running
+    one. A client whose loop is closed can no longer be closed; its
+    connections are released when it is collected.
+    """
+    if loop.is_closed():
+        return
+    if loop.is_running():
+        asyncio.run_coroutine_threadsafe(client.aclose(), loop)
+        return
+    # An idle loop is run on another thread, as this one is running a loop.
+    # Closing a client only closes its connections, so it is quick.
+    thread = threading.Thread(
+        target=loop.run_until_complete, args=(client.aclose(),), daemon=True
+    )
+    thread.start()
+    thread.join()
+
+
+async def aiter_lines(response: httpx.Response, backend: str) -> AsyncIterator[str]:
+    """
+    The lines of a streamed response, raising LangModelError if the
+    connection fails or times out while they are read.
+    """
+    try:
+        async for line in response.aiter_lines():
+            yield line
+    except httpx.HTTPError as e:
+        raise LangModelError(
+            backend,
+            str(e) or type(e).__name__,
+            retryable=isinstance(e, httpx.TimeoutException),
+        ) from e
+
+
+async def send_with_retries(
+    session: AsyncSession,
+    backend: str,
+    url: str,
+    json: dict,
+    retry_policy: RetryPolicy | None = None,
+    timeouts: Timeouts | None = None,
+) -> httpx.Response:
+    """
+    POST the given JSON body and return the streamed response once a
+    successful status has been received, retrying connection errors and
+    retryable status codes according to the retry policy. The caller is
+    responsible for closing the returned response.
+    """
+    retry_policy = retry_policy or RetryPolicy()
+    client = session.client()
+    kwargs = {"timeout": timeouts.as_httpx()} if timeouts is not None else {}
+    attempt = 0
+    while True:
+        attempt += 1
+        can_retry = attempt <= retry_policy.max_retries
+        request = client.build_request("POST", url, json=json, **kwargs)
+        try:
+            response = await client.send(request, stream=True)
+        except (httpx.ConnectError, httpx.ConnectTimeout) as e:
+            if can_retry:
+                await asyncio.sleep(retry_policy.backoff(attempt))
+                continue
+            raise LangModelError(backend, str(e), retryable=True) from e
+        except httpx.HTTPError as e:
+            raise LangModelError(
+                backend, str(e), retryable=isinstance(e, httpx.TimeoutException)
+            ) from e
+
+        status = response.status_code
+        if status in retry_policy.status_forcelist and can_retry:
+            await response.aclose()
+            delay = retry_policy.backoff(attempt)
+            retry_after = response.headers.get("Retry-After", "")
+            if retry_after.isdigit():
+                delay = max(delay, float(retry_after))
+            await asyncio.sleep(delay)
+            continue
+        if status >= 400:
+            body = await response.aread()
+            await response.aclose()
+            raise LangModelError(
+                backend,
+                f"responded with {status}: {body.decode('utf-8', 'replace')}",
+                status_code=status,
+                retryable=status in retry_policy.status_forcelist,
+            )
+        return response
@@ -1,25 +1,53 @@
-import os
+import functools
+import hashlib
+import itertools
 import logging
-from typing import List, Optional
-from datetime import datetime
+import os
+import sqlite3
+import time
+import uuid
+from collections.abc import Iterable, Iterator
 from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Self
+
+from chunker import Chunk, Chunker, MarkdownChunker, read_blocks
+from dedup import FingerprintIndex, min_similarity, minhash, signature_key
 from embeddings import Embedder
-from chunker import Chunker
+from journal import IndexJournal
+from lexical import LexicalIndex
+from membership import FileRecord, MembershipStore
+from rollups import RollupBuilder
+from scanner import ScanEntry, Scanner
 from vector_store import Metadata, VectorStore
-import hashlib
+
+# Chunks embedded and written to the vector store at a time
+EMBED_BATCH_SIZE = 64
+# Files modified less than this many seconds before being indexed may change
+# again without their modification time changing, so are always re-hashed
+RACY_MTIME_WINDOW = 2.0
+
+# Journal owners of the Indexers alive in this process; journaled files of
+# any other owner were left behind by a crash
+_live_owners = set()
 
 
 @dataclass
 class IndexerMetrics:
     file_count: int
     chunk_count: int
-    failed_files: List[dict] = field(default_factory=list)
+    failed_files: list[dict] = field(default_factory=list)
+    # Indexed files that were deleted, and that were moved and relinked
+    removed_count: int = 0
+    renamed_count: int = 0
 
     def merge(self, other: "IndexerMetrics") -> "IndexerMetrics":
         return IndexerMetrics(
             file_count=self.file_count + other.file_count,
             chunk_count=self.chunk_count + other.chunk_count,
             failed_files=self.failed_files + other.failed_files,
+            removed_count=self.removed_count + other.removed_count,
+            renamed_count=self.renamed_count + other.renamed_count,
         )
 
 
@@ -30,17 +58,83 @@ class Indexer:
 
     def __init__(
         self,
-        embedder: Optional[Embedder] = None,
-        chunker: Optional[Chunker] = None,
-        vector_store: Optional[VectorStore] = None,
+        embedder: Embedder | None = None,
+        chunker: Chunker | None = None,
+        vector_store: VectorStore | None = None,
+        rollups: RollupBuilder | None = None,
+        fingerprints: FingerprintIndex | None = None,
+        membership: MembershipStore | None = None,
+        journal: IndexJournal | None = None,
+        lexical: LexicalIndex | None = None,
     ):
         self.embedder = embedder or Embedder()
-        self.chunker = chunker or Chunker(split_on=None)
+        if chunker is None and hasattr(self.embedder, "tokenizer"):
+            # Size chunks to exactly fill the embedding model's input
+            chunker = MarkdownChunker.for_embedder(self.embedder)
+        self.chunker = chunker or MarkdownChunker()
         self.vector_store = vector_store or VectorStore()
+        self.rollups = rollups
+        # Not `or`: an empty FingerprintIndex is falsy
+        self.fingerprints = (
+            fingerprints
+            if fingerprints is not None
+            else FingerprintIndex(self.vector_store.sidecar_path("fingerprints.sqlite"))
+        )
+        # Shared with the vector store's file-level operations
+        self.membership = membership or self.vector_store.membership
+        self.journal = journal or IndexJournal(
+            self.vector_store.sidecar_path("journal.sqlite")
+        )
+        self.lexical = (
+            lexical
+            if lexical is not None
+            else LexicalIndex(self.vector_store.sidecar_path("lexical.sqlite"))
+        )
+        # The sidecar stores this Indexer opened, and so closes
+        self._opened = [
+            store
+            for store, given in (
+                (self.fingerprints, fingerprints),
+                (self.journal, journal),
+                (self.lexical, lexical),
+            )
+            if given is None
+        ]
+        # Chunks are written to the vector store in large batches, across files
+        self.writer = self.vector_store.writer()
+        self._failed: list[tuple[str, int, str]] = []  # Files whose write failed
+        # Chunks of the files being indexed or buffered, which their stored
+        # membership does not list yet
+        self._pending: dict[str, set] = {}
+        # Files whose chunks are written, to switch over together
+        self._written: list[tuple[FileRecord, list[str], set, set]] = []
+        # Chunks files dropped, or failed to index, that pending files may
+        # still refer to, with the files that dropped them
+        self._dropped: dict[str, set] = {}
+        self._owner = uuid.uuid4().hex
+        _live_owners.add(self._owner)
 
-    def index_dir(
-        self, dir: str, file_exts: Optional[List[str]] = None
-    ) -> IndexerMetrics:
+    def __enter__(self) -> Self:
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """
+        Write buffered chunks and close the sidecar stores this Indexer
+        opened. Files it left journaled are then recovered by the next
+        Indexer, as after a crash.
+        """
+        try:
+            self._flush()
+        finally:
+            _live_owners.discard(self._owner)
+            for store in self._opened:
+                store.close()
+            self._opened = []
+
+    def index_dir(self, dir: str, file_exts: list[str] | None = None) -> IndexerMetrics:
         """
         Index all files in a directory (recursively).
         dir: Directory to index
@@ -51,84 +145,562 @@ class Indexer:
             f"Indexing directory: {dir}, extensions: {file_exts}"
         )
 
+        self.recover()
+        self._backfill_lexical()
+        # A run interrupted before it finished resumes where it stopped
+        run = _run_key(dir, file_exts)
+        committed = self.journal.begin_run(run)
+        if committed:
+            logging.getLogger(__name__).info(
+                f"Resuming indexing of {dir}: {len(committed)} file(s) already done"
+            )
+
         metrics = IndexerMetrics(file_count=0, chunk_count=0, failed_files=[])
-        files = self._find_files(dir, file_exts)
-        for file_path in files:
+        # Files are indexed as they are found
+        scanner = Scanner(file_exts)
+        scanned = set()
+        for entry in scanner.scan(dir):
+            scanned.add(entry.path)
+            if entry.path in committed and self._is_committed(entry):
+                continue
             try:
-                file_metrics = self.index_file(file_path)
+                file_metrics = self.index_file(entry.path, entry.stat, run, flush=False)
                 metrics = metrics.merge(file_metrics)
             except Exception as e:
-                metrics.failed_files.append({"file": file_path, "error": str(e)})
+                metrics.failed_files.append({"file": entry.path, "error": str(e)})
                 continue
+            self._flush(if_due=True)
 
-        return metrics
+        self._flush()
+        metrics = metrics.merge(self._remove_missing(dir, scanner, scanned))
+        self.journal.finish_run(run)
+        return self._take_failed(metrics)
 
-    def index_file(self, file_path) -> IndexerMetrics:
+    def index_file(
+        self,
+        file_path,
+        stat: os.stat_result | None = None,
+        run: str = "",
+        flush: bool = True,
+    ) -> IndexerMetrics:
         """
         Index a single file. Returns IndexerMetrics for this file.
         Skips indexing if the file hash is already present.
+        stat: The file's stat result, if the caller already has it
+        run: The index_dir run the file is indexed as part of
+        flush: Write the file's chunks before returning. Otherwise they may
+            stay buffered, and the file only replaces its old chunks once
+            they are written.
         """
         logging.getLogger(__name__).debug(f"Indexing file: {file_path}")
 
         try:
-            # Check if file is already indexed
-            file_hash = self._compute_file_hash(file_path)
-            if self.vector_store.is_file_hash_indexed(file_path, file_hash):
+            # A file with the modification time and size it was indexed with
+            # is skipped without being read
+            stat = stat or os.stat(file_path)
+            modified_at = datetime.fromtimestamp(stat.st_mtime)
+            if self.membership.is_file_unchanged(
+                file_path, modified_at.timestamp(), stat.st_size
+            ):
                 logging.getLogger(__name__).debug(f"File already indexed: {file_path}")
                 return IndexerMetrics(file_count=0, chunk_count=0)
+            # Otherwise compare its content, if it was indexed before
+            record = self.membership.get_file(file_path)
+            if record and record.file_hash == self._compute_file_hash(file_path):
+                logging.getLogger(__name__).debug(f"File already indexed: {file_path}")
+                self.membership.touch_file(
+                    file_path, modified_at.timestamp(), self._trusted_size(stat)
+                )
+                return IndexerMetrics(file_count=0, chunk_count=0)
+            if record is None and self._relink_renamed(file_path, stat):
+                return IndexerMetrics(file_count=0, chunk_count=0, renamed_count=1)
+            if record is None:
+                # Chunks stored for the file before chunks were shared by content
+                legacy = self.vector_store.get_by_file_path(file_path)["ids"]
+                referenced = self.membership.referenced(legacy) | self._pending_ids()
+                self._delete_chunks([i for i in legacy if i not in referenced])
 
-            # Index file
-            self.vector_store.delete_by_file_path(file_path)
-            chunks = self.chunker.chunk_file(file_path)
-            if not chunks:
-                return IndexerMetrics(file_count=1, chunk_count=0)
-
-            # Create embeddings for each chunk
-            embeddings = self.embedder.embed(chunks)
-            ids, metadatas = [], []
-            for i, chunk in enumerate(chunks):
-                ids.append(f"{file_hash}::chunk{i}")
-                metadatas.append(
-                    Metadata(
-                        file=file_path,
-                        file_hash=file_hash,
-                        chunk_index=i,
-                        text=chunk,
-                        modified_at=get_modified_at(file_path),
-                        created_at=get_created_at(file_path),
-                    )
+            # Index file, hashing it on the same pass as it is chunked.
+            # Chunks are embedded and stored in batches as they are made, so
+            # memory use does not depend on the size of the file. Chunks are
+            # stored once per unique content: content already stored, for
+            # this file or another, is only referenced. The file's old chunks
+            # stay in place until its new ones are all stored, and every
+            # chunk involved is journaled first so a crash can be cleaned up.
+            changed_days = self._indexed_days(file_path)
+            old_ids = set(self.membership.chunk_ids(file_path))
+            self.journal.plan(file_path, run, self._owner, old_ids)
+            created_at = get_created_at(file_path)
+            hasher = hashlib.sha256()
+            chunk_ids = []
+            for batch in _batched(
+                self._iter_chunks(file_path, hasher), EMBED_BATCH_SIZE
+            ):
+                first_index = len(chunk_ids)
+                chunk_ids.extend(chunk.id for chunk in batch)
+                self._pending[file_path] = set(chunk_ids)
+                seen = self.writer.existing_ids(chunk_ids[first_index:])
+                new = []
+                for i, chunk in enumerate(batch, start=first_index):
+                    if chunk_ids[i] not in seen:
+                        seen.add(chunk_ids[i])
+                        new.append((i, chunk))
+                    changed_days.add((chunk.event_date or created_at).date())
+                if new:
+                    self.journal.embedded(file_path, (chunk_ids[i] for i, _ in new))
+                    self._add_chunks(file_path, new, modified_at, created_at, old_ids)
+            record = FileRecord(
+                file=file_path,
+                file_hash=hasher.hexdigest(),
+                modified_at=modified_at.timestamp(),
+                file_size=self._trusted_size(stat),
+            )
+            self.writer.after_flush(
+                functools.partial(
+                    self._commit_file, record, chunk_ids, old_ids, changed_days
                 )
-            self.vector_store.add(ids, embeddings, chunks, metadatas)
-            return IndexerMetrics(file_count=1, chunk_count=len(ids))
+            )
+            self._commit_written()
         except Exception as e:
             logging.getLogger(__name__).error(
-                f"Failed to index file: {file_path}, error: {str(e)}"
+                f"Failed to index file: {file_path}, error: {e!s}"
             )
+            self._recover_file(file_path)
             return IndexerMetrics(
                 file_count=0,
                 chunk_count=0,
                 failed_files=[{"file": file_path, "error": str(e)}],
             )
+        metrics = IndexerMetrics(file_count=1, chunk_count=len(chunk_ids))
+        if not flush:
+            return metrics
+        self._flush()
+        return self._take_failed(metrics)
+
+    def remove_file(self, file_path: str) -> int:
+        """
+        Remove a file from the index. Chunks that other files share are kept.
+        Returns the number of chunks deleted.
+        """
+        return self.remove_files([file_path])
+
+    def remove_files(self, file_paths: list[str]) -> int:
+        """
+        Remove several files from the index with one batch of deletes.
+        Returns the number of chunks deleted.
+        """
+        self._flush()  # So the files' membership is up to date
+        changed_days, old_ids = set(), set()
+        for file_path in file_paths:
+            changed_days |= self._indexed_days(file_path)
+            old_ids.update(self.membership.chunk_ids(file_path))
+        orphans = self.membership.remove_files(file_paths)
+        self._delete_chunks(orphans)
+        self._relink(set(file_paths), old_ids - set(orphans))
+        self._invalidate_rollups(changed_days)
+        return len(orphans)
+
+    def _remove_missing(
+        self, directory: str, scanner: Scanner, scanned: set
+    ) -> IndexerMetrics:
+        """
+        Remove the indexed files under directory, with the extensions
+        scanned for, that the scan did not find: deleted, or now ignored.
+        Files under directories the scan could not list are kept.
+        """
+        unreadable = tuple(os.path.join(path, "") for path in scanner.unreadable)
+        missing = [
+            record.file
+            for record in self.membership.files(os.path.join(directory, ""))
+            if record.file not in scanned
+            and scanner.matches_ext(os.path.basename(record.file))
+            and not (unreadable and record.file.startswith(unreadable))
+        ]
+        if not missing:
+            return IndexerMetrics(file_count=0, chunk_count=0)
+        logging.getLogger(__name__).info(
+            f"Removing {len(missing)} file(s) no longer in {directory}"
+        )
+        self.remove_files(missing)
+        return IndexerMetrics(file_count=0, chunk_count=0, removed_count=len(missing))
 
-    def _find_files(
-        self, directory: str, file_extensions: Optional[List[str]] = None
-    ) -> List[str]:
+    def _relink_renamed(self, file_path: str, stat: os.stat_result) -> bool:
         """
-        Find all files in a directory with optional file extensions filter.
-        Returns: List of file paths.
+        If file_path is an indexed file that was moved, with its content
+        unchanged, make its chunks file_path's without re-embedding them.
+        Their text keeps the header made for the old path until the file
+        changes. Returns True if the file was relinked.
         """
-        result = []
-        for root, _, files in os.walk(directory):
-            for f in files:
-                if not file_extensions or any(
-                    f.lower().endswith(ext) for ext in file_extensions
-                ):
-                    result.append(os.path.join(root, f))
-        return result
+        candidates = [
+            record
+            for record in self.membership.files_of_size(stat.st_size)
+            if not os.path.exists(record.file)
+        ]
+        if not candidates:
+            return False
+        file_hash = self._compute_file_hash(file_path)
+        old = next((r.file for r in candidates if r.file_hash == file_hash), None)
+        if old is None:
+            return False
+        logging.getLogger(__name__).info(f"Relinking {old} moved to {file_path}")
+        # Chroma first: if interrupted, the next run relinks the rest
+        owned = self.vector_store.get_by_file_path(old)["ids"]
+        self.vector_store.update_metadata(owned, [{"file": file_path}] * len(owned))
+        self.membership.rename_file(
+            old,
+            FileRecord(
+                file=file_path,
+                file_hash=file_hash,
+                modified_at=datetime.fromtimestamp(stat.st_mtime).timestamp(),
+                file_size=self._trusted_size(stat),
+            ),
+        )
+        return True
+
+    def _commit_file(
+        self,
+        record: FileRecord,
+        chunk_ids: list[str],
+        old_ids: set,
+        changed_days: set,
+        error: Exception | None,
+    ):
+        """
+        Queue a file to switch over to its new chunks once they are written,
+        by _commit_written.
+        """
+        if error is None:
+            self._written.append((record, chunk_ids, old_ids, changed_days))
+        else:
+            self._fail_file(record.file, len(chunk_ids), error)
+
+    def _commit_written(self):
+        """
+        Switch the files whose chunks are written over to their new chunks,
+        and delete the old chunks no file refers to any more. All the files
+        are switched before any chunk is deleted, and chunks files that are
+        still being indexed or buffered refer to are kept, so a chunk that
+        moves between files is never deleted.
+        """
+        written, self._written = self._written, []
+        if not written and not self._dropped:
+            return
+        committed = []
+        for record, chunk_ids, old_ids, changed_days in written:
+            try:
+                self.membership.replace_file(record, chunk_ids)
+            except sqlite3.Error as e:
+                self._fail_file(record.file, len(chunk_ids), e)
+                continue
+            self._pending.pop(record.file, None)
+            for chunk_id in old_ids - set(chunk_ids):
+                self._dropped.setdefault(chunk_id, set()).add(record.file)
+            committed.append((record.file, changed_days))
+        try:
+            pending = self._pending_ids()
+            dropped = {i: f for i, f in self._dropped.items() if i not in pending}
+            if dropped:
+                referenced = self.membership.referenced(list(dropped))
+                self._delete_chunks([i for i in dropped if i not in referenced])
+                self._relink(set().union(*dropped.values()), referenced)
+                self._dropped = {i: f for i, f in self._dropped.items() if i in pending}
+        except Exception:
+            # The files' new chunks are in place; deleting their old ones is
+            # tried again on the next switch-over
+            logging.getLogger(__name__).exception("Failed to delete old chunks")
+        for file_path, changed_days in committed:
+            self.journal.commit(file_path)
+            self._invalidate_rollups(changed_days)
+
+    def _pending_ids(self) -> set:
+        """The chunks files being indexed or buffered refer to."""
+        return set().union(*self._pending.values())
+
+    def _fail_file(self, file_path: str, chunk_count: int, error: Exception):
+        logging.getLogger(__name__).error(
+            f"Failed to index file: {file_path}, error: {error!s}"
+        )
+        self._recover_file(file_path)
+        self._failed.append((file_path, chunk_count, str(error)))
+
+    def _flush(self, if_due: bool = False):
+        """
+        Write buffered chunks and switch the files they complete over to
+        them. Files whose chunks failed to write are recorded by
+        _commit_file.
+        """
+        try:
+            if if_due:
+                self.writer.flush_if_due()
+            else:
+                self.writer.flush()
+        except Exception:
+            # The files they belong to are failed by the writer's callbacks
+            logging.getLogger(__name__).exception("Failed to write chunks")
+        finally:
+            self._commit_written()
+
+    def _take_failed(self, metrics: IndexerMetrics) -> IndexerMetrics:
+        """Move files counted as indexed whose chunks failed to write to failed_files."""
+        failed, self._failed = self._failed, []
+        for file_path, chunk_count, error in failed:
+            metrics = metrics.merge(
+                IndexerMetrics(
+                    file_count=-1,
+                    chunk_count=-chunk_count,
+                    failed_files=[{"file": file_path, "error": error}],
+                )
+            )
+        return metrics
+
+    def recover(self) -> int:
+        """
+        Clean up after files whose indexing was interrupted by a crash:
+        delete the chunks stored for them that no file refers to. Their old
+        chunks are still in place, so they are re-indexed by the next run.
+        Returns the number of files cleaned up.
+        """
+        recovered = 0
+        for file_path, owner in self.journal.incomplete():
+            if owner in _live_owners:
+                continue  # Still being indexed
+            logging.getLogger(__name__).info(
+                f"Recovering interrupted indexing of {file_path}"
+            )
+            self._recover_file(file_path)
+            recovered += 1
+        return recovered
+
+    def _recover_file(self, file_path: str):
+        """Undo an incomplete re-index of a file, as far as it got."""
+        self._pending.pop(file_path, None)
+        try:
+            chunk_ids = self.journal.chunk_ids(file_path)
+            referenced = self.membership.referenced(chunk_ids)
+            # Chunks other pending files refer to are checked again once
+            # those files are switched over
+            pending = self._pending_ids()
+            for chunk_id in pending.intersection(chunk_ids):
+                self._dropped.setdefault(chunk_id, set()).add(file_path)
+            self._delete_chunks(
+                [i for i in chunk_ids if i not in referenced and i not in pending]
+            )
+            self._relink(
+                {file_path}, referenced - set(self.membership.chunk_ids(file_path))
+            )
+            self.journal.discard(file_path)
+        except Exception:
+            logging.getLogger(__name__).exception(
+                f"Failed to recover indexing of {file_path}"
+            )
+
+    def _is_committed(self, entry: ScanEntry) -> bool:
+        """True if the file is still as it was when a resumed run indexed it."""
+        record = self.membership.get_file(entry.path)
+        return (
+            record is not None
+            and record.modified_at
+            == datetime.fromtimestamp(entry.stat.st_mtime).timestamp()
+        )
+
+    def _add_chunks(
+        self,
+        file_path: str,
+        chunks: list[tuple[int, Chunk]],
+        modified_at: datetime,
+        created_at: datetime,
+        replaced: Iterable[str] = (),
+    ):
+        """
+        Embed and store (chunk_index, chunk) pairs whose content is new.
+        replaced are the file's chunks the new ones replace.
+        """
+        ids = [chunk.id for _, chunk in chunks]
+        texts, embeddings, references = self._embed_batch(
+            file_path, ids, [chunk for _, chunk in chunks], replaced
+        )
+        metadatas = [
+            Metadata(
+                file=file_path,
+                chunk_index=i,
+                modified_at=modified_at,
+                created_at=created_at,
+                event_date=chunk.event_date or created_at,
+                start_offset=chunk.file_start,
+                end_offset=chunk.file_end,
+                chunk_hash=chunk.content_hash,
+                duplicate_of=duplicate_of,
+                dedup_key=dedup_key,
+            )
+            for (i, chunk), (duplicate_of, dedup_key) in zip(chunks, references)
+        ]
+        # Indexed before they are stored, so the lexical index never lacks a
+        # stored chunk; ids it has that are not stored are ignored by queries
+        self.lexical.add(ids, texts, metadatas)
+        self.writer.add(ids, embeddings, texts, metadatas)
+        self._commit_written()
+
+    def _delete_chunks(self, chunk_ids: list[str]):
+        """Delete stored chunks that no file refers to any more."""
+        if not chunk_ids:
+            return
+        self.vector_store.delete(chunk_ids)
+        self.lexical.delete(chunk_ids)
+        for chunk_id in chunk_ids:
+            self.fingerprints.delete(chunk_id)
+
+    def _backfill_lexical(self):
+        """Index the text of stored chunks the lexical index lacks, e.g. imported ones."""
+        if len(self.lexical) >= self.vector_store.collection.count():
+            return
+        added = 0
+        for page in self.vector_store.iter_rows():
+            indexed = self.lexical.existing_ids(page["ids"])
+            rows = [
+                row
+                for row in zip(page["ids"], page["documents"], page["metadatas"])
+                if row[0] not in indexed
+            ]
+            if rows:
+                self.lexical.add(*zip(*rows))
+                added += len(rows)
+        logging.getLogger(__name__).info(
+            f"Added {added} stored chunk(s) to the lexical index"
+        )
+
+    def _relink(self, file_paths: set, chunk_ids: set):
+        """
+        Point chunks owned by file_paths that those files no longer contain,
+        but other files still do, at one of those files.
+        """
+        if not chunk_ids:
+            return
+        results = self.vector_store.get_by_ids(sorted(chunk_ids))
+        ids, metadatas = [], []
+        for chunk_id, md in zip(results["ids"], results.get("metadatas") or []):
+            if md and md.get("file") in file_paths:
+                files = self.membership.files_of(chunk_id)
+                if files:
+                    ids.append(chunk_id)
+                    metadatas.append({"file": files[0]})
+        self.vector_store.update_metadata(ids, metadatas)
+
+    def _embed_batch(
+        self,
+        file_path: str,
+        ids: list[str],
+        batch: list[Chunk],
+        replaced: Iterable[str] = (),
+    ) -> tuple[list[str], list[list[float]], list[tuple[str, str]]]:
+        """
+        Embed the chunks of a batch, except exact duplicates of a chunk
+        already indexed under another date: the text embedded is the same,
+        so they reuse its embedding. Near duplicates are embedded, as what differs may be
+        what a search is for, and only grouped with their original.
+        The chunks the file is replacing are not matched, as they may be
+        deleted once it is stored.
+        Returns the chunks' texts, their embeddings and, for each chunk, the
+        id of the chunk whose embedding it reuses ("" if none) and its
+        dedup_key.
+        """
+        replaced = set(replaced)
+        # The only copy of each chunk's content, shared by the embedder and
+        # the vector store
+        texts = [chunk.content for chunk in batch]
+        embeddings = [None] * len(batch)
+        references, unique = [], []
+        for i, (chunk_id, chunk) in enumerate(zip(ids, batch)):
+            body = chunk.body
+            signature = minhash(body)
+            exact = self.fingerprints.find_exact(chunk.content_hash, replaced)
+            if exact and exact[0] == chunk_id:
+                exact = None  # Fingerprinted by a run that crashed before storing it
+            elif exact and exact[0] not in ids:
+                stored = self.writer.get_embeddings([exact[0]])
+                if exact[0] in stored:
+                    embeddings[i] = stored[exact[0]]
+                else:
+                    self.fingerprints.delete(exact[0])  # Its chunk is gone
+                    exact = None
+            if exact is not None:
+                references.append((exact[0], signature_key(exact[1])))
+                continue
+            near = self.fingerprints.find(signature, min_similarity(body), replaced)
+            if near and near[0] == chunk_id:
+                near = None
+            self.fingerprints.add(chunk_id, file_path, signature, chunk.content_hash)
+            references.append(("", signature_key(near[1] if near else signature)))
+            unique.append(i)
+        if unique:
+            new = self.embedder.embed([texts[i] for i in unique])
+            for i, embedding in zip(unique, new):
+                embeddings[i] = embedding
+        # Duplicates of chunks earlier in the same batch
+        position = {chunk_id: i for i, chunk_id in enumerate(ids)}
+        for i, (duplicate_of, _) in enumerate(references):
+            if embeddings[i] is None:
+                embeddings[i] = embeddings[position[duplicate_of]]
+        if len(unique) < len(batch):
+            logging.getLogger(__name__).debug(
+                f"Reused embeddings for {len(batch) - len(unique)} duplicate chunk(s)"
+                f" in {file_path}"
+            )
+        return texts, embeddings, references
+
+    def _iter_chunks(self, file_path: str, hasher) -> Iterator[Chunk]:
+        """
+        Stream a file's chunks, with event dates if the chunker can find
+        them, feeding the file's bytes to hasher.
+        """
+        if hasattr(self.chunker, "iter_chunks"):
+            yield from self.chunker.iter_chunks(file_path, hasher)
+        else:
+            # Chunkers without a streaming path read the file themselves
+            for _ in read_blocks(file_path, hasher):
+                pass
+            for chunk in self.chunker.chunk_file(file_path):
+                yield Chunk(chunk)
+
+    def _indexed_days(self, file_path: str) -> set:
+        """Days covered by the chunks currently indexed for a file, if rollups are on."""
+        if not self.rollups:
+            return set()
+        results = self.vector_store.get_by_ids(self.membership.chunk_ids(file_path))
+        days = set()
+        for md in results.get("metadatas") or []:
+            timestamp = md and (md.get("event_date") or md.get("created_at"))
+            if timestamp:
+                days.add(datetime.fromtimestamp(timestamp).date())
+        return days
+
+    def _invalidate_rollups(self, days: set):
+        if self.rollups and days:
+            self.rollups.invalidate(days)
 
     def _compute_file_hash(self, path):
-        with open(path, "rb") as f:
-            return hashlib.sha256(f.read()).hexdigest()
+        hasher = hashlib.sha256()
+        for _ in read_blocks(path, hasher):
+            pass
+        return hasher.hexdigest()
+
+    @staticmethod
+    def _trusted_size(stat: os.stat_result) -> int:
+        """The size to record for a file, or -1 if its stat cannot be trusted."""
+        if time.time() - stat.st_mtime < RACY_MTIME_WINDOW:
+            return -1
+        return stat.st_size
+
+
+def _run_key(directory: str, file_exts: list[str] | None) -> str:
+    """Identifies an index_dir run, so an interrupted one can be resumed."""
+    exts = sorted({ext.lower() for ext in file_exts or []})
+    return f"{os.path.abspath(directory)}|{','.join(exts)}"
+
+
+def _batched(iterable: Iterable, size: int) -> Iterator[list]:
+    iterator = iter(iterable)
+    while batch := list(itertools.islice(iterator, size)):
+        yield batch
 
 
 def get_modified_at(file_path: str) -> datetime:
@@ -0,0 +1,121 @@
+import sqlite3
+import threading
+from collections.abc import Iterable
+
+PLANNED = "planned"  # The file is about to be re-indexed
+EMBEDDED = "embedded"  # Some of its new chunks are in the vector store
+COMMITTED = "committed"  # Its chunks were replaced, as part of a run
+
+
+class IndexJournal:
+    """
+    SQLite write-ahead journal of indexing progress, kept next to the Chroma
+    data. A file is journaled before its chunks are touched, together with
+    every chunk it referred to and every chunk stored for it, so a crash
+    leaves enough behind to delete what no file refers to. Files committed
+    by a run that did not finish are remembered so the run can resume.
+    """
+
+    def __init__(self, path: str = ":memory:"):
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS runs ("
+                " run TEXT PRIMARY KEY,"
+                " started_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS files ("
+                " file TEXT PRIMARY KEY,"
+                " run TEXT NOT NULL,"
+                " owner TEXT NOT NULL,"
+                " state TEXT NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS chunks ("
+                " file TEXT NOT NULL,"
+                " chunk_id TEXT NOT NULL,"
+                " PRIMARY KEY (file, chunk_id))"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS files_run ON files (run)")
+
+    def begin_run(self, run: str) -> set[str]:
+        """
+        Start a run, or resume it if it did not finish. Returns the files the
+        run already committed.
+        """
+        with self._lock, self._conn:
+            self._conn.execute("INSERT OR IGNORE INTO runs (run) VALUES (?)", (run,))
+            rows = self._conn.execute(
+                "SELECT file FROM files WHERE run = ? AND state = ?", (run, COMMITTED)
+            ).fetchall()
+        return {file for (file,) in rows}
+
+    def finish_run(self, run: str):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "DELETE FROM files WHERE run = ? AND state = ?", (run, COMMITTED)
+            )
+            self._conn.execute("DELETE FROM runs WHERE run = ?", (run,))
+
+    def plan(self, file: str, run: str, owner: str, chunk_ids: Iterable[str]):
+        """Journal a file about to be re-indexed and the chunks it refers to now."""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO files (file, run, owner, state)"
+                " VALUES (?, ?, ?, ?)",
+                (file, run, owner, PLANNED),
+            )
+            self._conn.execute("DELETE FROM chunks WHERE file = ?", (file,))
+            self._insert_chunks_locked(file, chunk_ids)
+
+    def embedded(self, file: str, chunk_ids: Iterable[str]):
+        """Journal chunks about to be stored for a file."""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE files SET state = ? WHERE file = ?", (EMBEDDED, file)
+            )
+            self._insert_chunks_locked(file, chunk_ids)
+
+    def commit(self, file: str):
+        """The file's chunks were replaced and cleaned up."""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM chunks WHERE file = ?", (file,))
+            self._conn.execute(
+                "UPDATE files SET state = ? WHERE file = ? AND run != ''",
+                (COMMITTED, file),
+            )
+            self._conn.execute("DELETE FROM files WHERE file = ? AND run = ''", (file,))
+
+    def incomplete(self) -> list[tuple[str, str]]:
+        """(file, owner) of every file whose indexing did not finish."""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT file, owner FROM files WHERE state != ? ORDER BY file",
+                (COMMITTED,),
+            ).fetchall()
+
+    def chunk_ids(self, file: str) -> list[str]:
+        """The chunks journaled for a file whose indexing did not finish."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT chunk_id FROM chunks WHERE file = ? ORDER BY chunk_id",
+                (file,),
+            ).fetchall()
+        return [chunk_id for (chunk_id,) in rows]
+
+    def discard(self, file: str):
+        """Forget an incomplete file once it has been cleaned up."""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM chunks WHERE file = ?", (file,))
+            self._conn.execute("DELETE FROM files WHERE file = ?", (file,))
+
+    def close(self):
+        self._conn.close()
+
+    def _insert_chunks_locked(self, file: str, chunk_ids: Iterable[str]):
+        self._conn.executemany(
+            "INSERT OR IGNORE INTO chunks (file, chunk_id) VALUES (?, ?)",
+            ((file, chunk_id) for chunk_id in chunk_ids),
+        )
@@ -1,10 +1,134 @@
+import asyncio
 from abc import ABC, abstractmethod
+from collections.abc import AsyncIterator
+
+
+class LangModelError(Exception):
+    """Raised when a language model backend fails to produce a response."""
+
+    def __init__(
+        self,
+        backend: str,
+        message: str,
+        status_code: int | None = None,
+        retryable: bool = False,
+    ):
+        super().__init__(f"{backend} error: {message}")
+        self.backend = backend
+        self.message = message
+        self.status_code = status_code
+        self.retryable = retryable
+
+    def to_dict(self) -> dict:
+        return {
+            "backend": self.backend,
+            "message": self.message,
+            "status_code": self.status_code,
+            "retryable": self.retryable,
+        }
 
 
 class LangModel(ABC):
-    """Abstract base class for language models."""
+    """
+    Abstract base class for language models.
+    All generation methods accept optional limits:
+    max_tokens: cap on the number of tokens to generate
+    timeout: seconds the call may take before it is abandoned
+    Chat methods take a list of {"role": ..., "content": ...} messages, with
+    roles "system", "user" and "assistant".
+    """
 
     @abstractmethod
-    def generate(self, prompt: str) -> str:
-        """Generate a response based on the given prompt."""
-        pass
+    def generate(
+        self,
+        prompt: str,
+        max_tokens: int | None = None,
+        timeout: float | None = None,
+    ) -> str:
+        """
+        Generate a response based on the given prompt.
+        Raises LangModelError if the backend fails.
+        """
+
+    async def agenerate(
+        self,
+        prompt: str,
+        max_tokens: int | None = None,
+        timeout: float | None = None,
+    ) -> str:
+        """
+        Asynchronously generate a response based on the given prompt.
+        Backends with a native async client should override this; the default
+        runs generate() in a worker thread.
+        """
+        return await asyncio.to_thread(
+            self.generate, prompt, max_tokens=max_tokens, timeout=timeout
+        )
+
+    async def astream(
+        self,
+        prompt: str,
+        max_tokens: int | None = None,
+        timeout: float | None = None,
+    ) -> AsyncIterator[str]:
+        """
+        Asynchronously stream the response as it is generated.
+        The default yields the complete response from agenerate() at once.
+        """
+        yield await self.agenerate(prompt, max_tokens=max_tokens, timeout=timeout)
+
+    def chat(
+        self,
+        messages: list[dict[str, str]],
+        max_tokens: int | None = None,
+        timeout: float | None = None,
+    ) -> str:
+        """
+        Generate the next assistant message of a conversation.
+        Backends with a native chat API should override this; the default
+        flattens the conversation into a single prompt.
+        """
+        return self.generate(
+            format_messages(messages), max_tokens=max_tokens, timeout=timeout
+        )
+
+    async def achat(
+        self,
+        messages: list[dict[str, str]],
+        max_tokens: int | None = None,
+        timeout: float | None = None,
+    ) -> str:
+        """Asynchronously generate the next assistant message of a conversation."""
+        return await self.agenerate(
+            format_messages(messages), max_tokens=max_tokens, timeout=timeout
+        )
+
+    def generate_json(
+        self,
+        prompt: str,
+        schema: dict | None = None,
+        max_tokens: int | None = None,
+        timeout: float | None = None,
+    ) -> str:
+        """
+        Generate a response constrained to JSON, matching the JSON schema if
+        one is given. Backends with a structured output mode should override
+        this; the default relies on the prompt alone.
+        """
+        return self.generate(prompt, max_tokens=max_tokens, timeout=timeout)
+
+    async def agenerate_json(
+        self,
+        prompt: str,
+        schema: dict | None = None,
+        max_tokens: int | None = None,
+        timeout: float | None = None,
+    ) -> str:
+        """Asynchronously generate a response constrained to JSON."""
+        return await self.agenerate(prompt, max_tokens=max_tokens, timeout=timeout)
+
+
+def format_messages(messages: list[dict[str, str]]) -> str:
+    """Flatten chat messages into a single prompt for completion-style models."""
+    turns = [f"{m['role'].capitalize()}: {m['content']}" for m in messages]
+    return "\n\n".join(turns + ["Assistant:"])
@@ -0,0 +1,231 @@
+import re
+import sqlite3
+import threading
+from collections.abc import Iterable, Sequence
+
+from vector_store import Metadata, stored_metadata
+
+# Reciprocal-rank fusion constant: the larger, the less the top few ranks
+# of each ranking dominate
+RRF_K = 60
+# A query whose exact terms all occur together in at most this many chunks
+# has those chunks ranked by their vectors too, and fused with the rest
+SELECTIVE_MAX_CHUNKS = 64
+# Query terms in more than this share of the chunks are left out of the
+# lexical search, unless every term is
+COMMON_TERM_RATIO = 0.5
+# Metadata fields a lexical search can be filtered on
+TIME_FIELDS = ("created_at", "modified_at", "event_date")
+
+# Tokens as the FTS5 tokenizer below makes them: "-" and "_" are part of
+# words, so "PROJ-1234" and "auth_service" are one term each
+_TOKENIZER = "unicode61 remove_diacritics 0 tokenchars '-_'"
+_TOKEN = re.compile(r"[\w-]+")
+# Tokens with a letter that still read as a count or time, not a name:
+# ordinals, clock times, quarters and numbers with a one-letter unit
+_MEASURE = re.compile(r"q[1-4]|\d+(?:st|nd|rd|th|am|pm|[a-z])", re.IGNORECASE)
+
+
+def tokenize(text: str) -> list[str]:
+    return [token.lower() for token in _TOKEN.findall(text)]
+
+
+def exact_terms(query: str) -> list[str]:
+    """
+    Terms of a query that name something rather than describe it: ticket
+    ids, acronyms and identifiers like "PROJ-1234", "MTTR" or "auth-service",
+    written with a letter and a digit, an inner "-" or "_", or two capitals.
+    Numbers, dates, and counts like "2nd" or "10am" are not exact terms.
+    """
+    return [
+        token.lower()
+        for token in _TOKEN.findall(query)
+        if re.search(r"[^\W\d_]", token)
+        and not _MEASURE.fullmatch(token)
+        and (re.search(r"\d|\w[-_]\w", token) or sum(c.isupper() for c in token) >= 2)
+    ]
+
+
+def reciprocal_rank_fusion(
+    rankings: Iterable[Sequence[str]], k: int = RRF_K
+) -> list[str]:
+    """
+    Merge rankings of ids by the sum of 1 / (k + rank) over the rankings
+    each id is in. Ties keep the order ids were first seen in.
+    """
+    scores: dict[str, float] = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking, start=1):
+            scores[item] = scores.get(item, 0.0) + 1 / (k + rank)
+    return sorted(scores, key=lambda item: -scores[item])
+
+
+class LexicalIndex:
+    """
+    SQLite FTS5 inverted index of chunk texts, kept next to the Chroma data
+    and ranked with BM25. Chunks are keyed by id, with the timestamps
+    queries filter on.
+    """
+
+    def __init__(self, path: str = ":memory:"):
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS chunks ("
+                " rowid INTEGER PRIMARY KEY,"
+                " chunk_id TEXT NOT NULL UNIQUE,"
+                " created_at REAL,"
+                " modified_at REAL,"
+                " event_date REAL)"
+            )
+            self._conn.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS chunk_text"
+                f' USING fts5(text, tokenize="{_TOKENIZER}")'
+            )
+            # Document frequency of every term
+            self._conn.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS chunk_terms"
+                " USING fts5vocab(chunk_text, 'row')"
+            )
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+
+    def add(
+        self,
+        ids: Sequence[str],
+        documents: Sequence[str],
+        metadatas: Sequence[Metadata | dict],
+    ):
+        """Index chunks; chunks already indexed are left as they are."""
+        with self._lock, self._conn:
+            for chunk_id, document, metadata in zip(ids, documents, metadatas):
+                metadata = stored_metadata(metadata) if metadata else {}
+                cursor = self._conn.execute(
+                    "INSERT INTO chunks (chunk_id, created_at, modified_at, event_date)"
+                    " VALUES (?, ?, ?, ?) ON CONFLICT (chunk_id) DO NOTHING",
+                    (chunk_id, *(metadata.get(f) for f in TIME_FIELDS)),
+                )
+                if cursor.rowcount:
+                    self._conn.execute(
+                        "INSERT INTO chunk_text (rowid, text) VALUES (?, ?)",
+                        (cursor.lastrowid, document or ""),
+                    )
+
+    def delete(self, ids: Iterable[str]):
+        with self._lock, self._conn:
+            for chunk_id in ids:
+                row = self._conn.execute(
+                    "SELECT rowid FROM chunks WHERE chunk_id = ?", (chunk_id,)
+                ).fetchone()
+                if row:
+                    self._conn.execute("DELETE FROM chunk_text WHERE rowid = ?", row)
+                    self._conn.execute("DELETE FROM chunks WHERE rowid = ?", row)
+
+    def existing_ids(self, ids: Iterable[str]) -> set:
+        """The subset of ids that are indexed."""
+        with self._lock:
+            return {
+                chunk_id
+                for chunk_id in ids
+                if self._conn.execute(
+                    "SELECT 1 FROM chunks WHERE chunk_id = ?", (chunk_id,)
+                ).fetchone()
+            }
+
+    def document_frequencies(self, terms: Iterable[str]) -> dict[str, int]:
+        """Chunks each term occurs in; terms in none are left out."""
+        with self._lock:
+            return {
+                term: row[0]
+                for term in set(terms)
+                for row in self._conn.execute(
+                    "SELECT doc FROM chunk_terms WHERE term = ?", (term,)
+                )
+            }
+
+    def search(
+        self,
+        query: str,
+        limit: int,
+        start_time: float | None = None,
+        end_time: float | None = None,
+        time_field: str = "created_at",
+    ) -> list[str]:
+        """
+        Ids of the limit chunks containing any of the query's terms, best
+        BM25 score first, within the time range if given.
+        """
+        frequencies = self.document_frequencies(tokenize(query))
+        if not frequencies:
+            return []
+        common = COMMON_TERM_RATIO * len(self)
+        terms = [t for t, count in frequencies.items() if count <= common]
+        return self._match(
+            " OR ".join(_quoted(t) for t in sorted(terms or frequencies)),
+            limit,
+            start_time,
+            end_time,
+            time_field,
+        )
+
+    def selective_ids(
+        self,
+        query: str,
+        start_time: float | None = None,
+        end_time: float | None = None,
+        time_field: str = "created_at",
+        max_chunks: int = SELECTIVE_MAX_CHUNKS,
+    ) -> list[str] | None:
+        """
+        The chunks containing every exact term of the query, if it has any
+        and they occur together in at most max_chunks chunks; else None.
+        """
+        terms = sorted(set(exact_terms(query)))
+        if not terms:
+            return None
+        ids = self._match(
+            " AND ".join(_quoted(t) for t in terms),
+            max_chunks + 1,
+            start_time,
+            end_time,
+            time_field,
+        )
+        return ids if 0 < len(ids) <= max_chunks else None
+
+    def close(self):
+        self._conn.close()
+
+    def _match(
+        self,
+        expression: str,
+        limit: int,
+        start_time: float | None,
+        end_time: float | None,
+        time_field: str,
+    ) -> list[str]:
+        if time_field not in TIME_FIELDS:
+            raise ValueError(f"Cannot filter lexical search on {time_field}")
+        sql = (
+            "SELECT chunks.chunk_id FROM chunk_text"
+            " JOIN chunks ON chunks.rowid = chunk_text.rowid"
+            " WHERE chunk_text MATCH ?"
+        )
+        params: list = [expression]
+        if start_time is not None:
+            sql += f" AND chunks.{time_field} >= ?"
+            params.append(start_time)
+        if end_time is not None:
+            sql += f" AND chunks.{time_field} <= ?"
+            params.append(end_time)
+        sql += " ORDER BY bm25(chunk_text) LIMIT ?"
+        params.append(limit)
+        with self._lock:
+            return [chunk_id for (chunk_id,) in self._conn.execute(sql, params)]
+
+
+def _quoted(term: str) -> str:
+    """An FTS5 string, matching the term literally."""
+    return '"' + term.replace('"', '""') + '"'
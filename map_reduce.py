@@ -0,0 +1,160 @@
+import asyncio
+import logging
+import threading
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+
+from lang_model import LangModel
+
+# Called with (stage, completed, total) as groups are summarized, where stage
+# is "map" for the first pass over the chunks and "reduce" for later passes.
+ProgressCallback = Callable[[str, int, int], None]
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count; about four characters per token for English text."""
+    return len(text) // 4 + 1
+
+
+def partition(texts: list[str], max_tokens: int) -> list[list[str]]:
+    """
+    Split texts, in order, into groups of at most max_tokens estimated tokens.
+    A text larger than max_tokens gets a group of its own.
+    """
+    groups = []
+    group, group_tokens = [], 0
+    for text in texts:
+        tokens = estimate_tokens(text)
+        if group and group_tokens + tokens > max_tokens:
+            groups.append(group)
+            group, group_tokens = [], 0
+        group.append(text)
+        group_tokens += tokens
+    if group:
+        groups.append(group)
+    return groups
+
+
+class MapReduceSummarizer:
+    """
+    Condenses more notes than fit in a single prompt into a few partial
+    summaries. The notes are partitioned into token-bounded groups that are
+    summarized concurrently (map); while the summaries still do not fit in one
+    group they are grouped and summarized again (reduce). The caller builds
+    the final answer from the summaries that remain.
+    """
+
+    MAP_PROMPT = (
+        "The following notes are one part of a larger set of notes. Extract the "
+        "information relevant to the question as a concise bulleted list. Keep "
+        "dates. Omit procedural or reference material. If nothing is relevant, "
+        "output nothing.\n\nNotes:\n{notes}\n\nQuestion: {query}\nRelevant information:"
+    )
+    REDUCE_PROMPT = (
+        "The following are partial summaries of notes. Merge them into a single "
+        "concise bulleted list of the information relevant to the question, "
+        "removing duplicates and keeping dates.\n\nSummaries:\n{notes}\n\n"
+        "Question: {query}\nRelevant information:"
+    )
+
+    def __init__(
+        self,
+        lang_model: LangModel,
+        max_group_tokens: int = 3000,
+        fan_out: int = 4,
+        progress: ProgressCallback | None = None,
+    ):
+        self.lang_model = lang_model
+        self.max_group_tokens = max_group_tokens
+        self.fan_out = fan_out
+        self.progress = progress
+
+    def condense(
+        self, query: str, texts: list[str], timeout: float | None = None
+    ) -> list[str]:
+        """Summarize texts until the summaries fit in a single group."""
+        stage = "map"
+        with ThreadPoolExecutor(
+            max_workers=self.fan_out, thread_name_prefix="map-reduce"
+        ) as executor:
+            while self._needs_pass(texts, stage):
+                groups = partition(texts, self.max_group_tokens)
+                tracker = _Progress(self, stage, len(groups))
+                prompts = [self._prompt(stage, query, group) for group in groups]
+
+                def summarize(prompt: str, tracker: _Progress) -> str:
+                    summary = self.lang_model.generate(prompt, timeout=timeout)
+                    tracker.advance()
+                    return summary
+
+                texts = self._kept(
+                    executor.map(summarize, prompts, [tracker] * len(prompts))
+                )
+                stage = "reduce"
+        return texts
+
+    async def acondense(
+        self, query: str, texts: list[str], timeout: float | None = None
+    ) -> list[str]:
+        """Async variant of condense(), bounded by a semaphore of fan_out."""
+        semaphore = asyncio.Semaphore(self.fan_out)
+        stage = "map"
+        while self._needs_pass(texts, stage):
+            groups = partition(texts, self.max_group_tokens)
+            tracker = _Progress(self, stage, len(groups))
+
+            async def summarize(prompt: str, tracker: _Progress) -> str:
+                async with semaphore:
+                    summary = await self.lang_model.agenerate(prompt, timeout=timeout)
+                tracker.advance()
+                return summary
+
+            texts = self._kept(
+                await asyncio.gather(
+                    *(
+                        summarize(self._prompt(stage, query, group), tracker)
+                        for group in groups
+                    )
+                )
+            )
+            stage = "reduce"
+        return texts
+
+    def _needs_pass(self, texts: list[str], stage: str) -> bool:
+        # Always map once; reduce while more than one group remains and a
+        # pass would still merge something.
+        if not texts:
+            return False
+        if stage == "map":
+            return True
+        return 1 < len(partition(texts, self.max_group_tokens)) < len(texts)
+
+    def _prompt(self, stage: str, query: str, group: list[str]) -> str:
+        template = self.MAP_PROMPT if stage == "map" else self.REDUCE_PROMPT
+        return template.format(notes="\n\n".join(group), query=query)
+
+    @staticmethod
+    def _kept(summaries) -> list[str]:
+        return [s.strip() for s in summaries if s and s.strip()]
+
+
+class _Progress:
+    """Thread-safe completion counter for one pass."""
+
+    def __init__(self, summarizer: MapReduceSummarizer, stage: str, total: int):
+        self.summarizer = summarizer
+        self.stage = stage
+        self.total = total
+        self.completed = 0
+        self._lock = threading.Lock()
+        logging.getLogger(__name__).debug(f"Starting {stage} over {total} group(s)")
+
+    def advance(self):
+        # Report under the lock so progress is never seen going backwards
+        with self._lock:
+            self.completed += 1
+            logging.getLogger(__name__).debug(
+                f"Summarized {self.completed}/{self.total} group(s) ({self.stage})"
+            )
+            if self.summarizer.progress:
+                self.summarizer.progress(self.stage, self.completed, self.total)
@@ -0,0 +1,199 @@
+import sqlite3
+import threading
+from collections.abc import Iterable
+from dataclasses import dataclass
+
+
+@dataclass
+class FileRecord:
+    """State of a completely indexed file."""
+
+    file: str
+    file_hash: str
+    modified_at: float
+    file_size: int  # -1 if the file changed too recently for its stat to be trusted
+
+
+class MembershipStore:
+    """
+    SQLite-backed mapping from files to the chunks they are made of.
+    Chunks are stored once per unique content and may belong to several
+    files; a chunk is orphaned once no file refers to it any more.
+    """
+
+    def __init__(self, path: str = ":memory:"):
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS files ("
+                " file TEXT PRIMARY KEY,"
+                " file_hash TEXT NOT NULL,"
+                " modified_at REAL NOT NULL,"
+                " file_size INTEGER NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS members ("
+                " file TEXT NOT NULL,"
+                " chunk_index INTEGER NOT NULL,"
+                " chunk_id TEXT NOT NULL,"
+                " PRIMARY KEY (file, chunk_index))"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS members_chunk_id ON members (chunk_id)"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS files_file_size ON files (file_size)"
+            )
+
+    def get_file(self, file: str) -> FileRecord | None:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT file, file_hash, modified_at, file_size FROM files"
+                " WHERE file = ?",
+                (file,),
+            ).fetchone()
+        return FileRecord(*row) if row else None
+
+    def files(self, prefix: str = "") -> list[FileRecord]:
+        """Every indexed file whose path starts with prefix."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT file, file_hash, modified_at, file_size FROM files"
+                " WHERE substr(file, 1, ?) = ? ORDER BY file",
+                (len(prefix), prefix),
+            ).fetchall()
+        return [FileRecord(*row) for row in rows]
+
+    def files_of_size(self, file_size: int) -> list[FileRecord]:
+        """Indexed files of this size, or whose size was not recorded."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT file, file_hash, modified_at, file_size FROM files"
+                " WHERE file_size IN (?, -1) ORDER BY file",
+                (file_size,),
+            ).fetchall()
+        return [FileRecord(*row) for row in rows]
+
+    def is_file_unchanged(self, file: str, modified_at: float, file_size: int) -> bool:
+        """True if the file was indexed with this modification time and size."""
+        record = self.get_file(file)
+        return (
+            record is not None
+            and record.file_size >= 0
+            and record.file_size == file_size
+            and record.modified_at == modified_at
+        )
+
+    def touch_file(self, file: str, modified_at: float, file_size: int):
+        """Record a new stat for a file whose content did not change."""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE files SET modified_at = ?, file_size = ? WHERE file = ?",
+                (modified_at, file_size, file),
+            )
+
+    def chunk_ids(self, file: str) -> list[str]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT chunk_id FROM members WHERE file = ? ORDER BY chunk_index",
+                (file,),
+            ).fetchall()
+        return [chunk_id for (chunk_id,) in rows]
+
+    def replace_file(self, record: FileRecord, chunk_ids: Iterable[str]) -> list[str]:
+        """
+        Make a file consist of chunk_ids, in order, in one transaction.
+        Returns the chunks it referred to before that no file refers to now.
+        """
+        with self._lock, self._conn:
+            old = self._chunk_ids_locked(record.file)
+            self._conn.execute("DELETE FROM members WHERE file = ?", (record.file,))
+            self._conn.executemany(
+                "INSERT INTO members (file, chunk_index, chunk_id) VALUES (?, ?, ?)",
+                ((record.file, i, chunk_id) for i, chunk_id in enumerate(chunk_ids)),
+            )
+            self._conn.execute(
+                "INSERT OR REPLACE INTO files (file, file_hash, modified_at, file_size)"
+                " VALUES (?, ?, ?, ?)",
+                (record.file, record.file_hash, record.modified_at, record.file_size),
+            )
+            return self._orphans_locked(old)
+
+    def rename_file(self, old: str, record: FileRecord):
+        """Move old's chunks to record.file, which takes old's place."""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM members WHERE file = ?", (record.file,))
+            self._conn.execute(
+                "UPDATE members SET file = ? WHERE file = ?", (record.file, old)
+            )
+            self._conn.execute("DELETE FROM files WHERE file = ?", (old,))
+            self._conn.execute(
+                "INSERT OR REPLACE INTO files (file, file_hash, modified_at, file_size)"
+                " VALUES (?, ?, ?, ?)",
+                (record.file, record.file_hash, record.modified_at, record.file_size),
+            )
+
+    def remove_file(self, file: str) -> list[str]:
+        """
+        Forget a file. Returns the chunks it referred to that no file refers
+        to now.
+        """
+        return self.remove_files([file])
+
+    def remove_files(self, files: Iterable[str]) -> list[str]:
+        """
+        Forget several files in one transaction. Returns the chunks they
+        referred to that no file refers to now.
+        """
+        with self._lock, self._conn:
+            old = set()
+            for file in files:
+                old |= self._chunk_ids_locked(file)
+                self._conn.execute("DELETE FROM members WHERE file = ?", (file,))
+                self._conn.execute("DELETE FROM files WHERE file = ?", (file,))
+            return self._orphans_locked(old)
+
+    def referenced(self, chunk_ids: Iterable[str]) -> set:
+        """The subset of chunk_ids that some file refers to."""
+        chunk_ids = list(set(chunk_ids))
+        found = set()
+        with self._lock:
+            # Stay under SQLite's limit on the number of query parameters
+            for i in range(0, len(chunk_ids), 500):
+                batch = chunk_ids[i : i + 500]
+                rows = self._conn.execute(
+                    "SELECT DISTINCT chunk_id FROM members WHERE chunk_id IN"
+                    f" ({', '.join('?' * len(batch))})",
+                    batch,
+                ).fetchall()
+                found.update(chunk_id for (chunk_id,) in rows)
+        return found
+
+    def files_of(self, chunk_id: str) -> list[str]:
+        """The files that refer to a chunk."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT DISTINCT file FROM members WHERE chunk_id = ? ORDER BY file",
+                (chunk_id,),
+            ).fetchall()
+        return [file for (file,) in rows]
+
+    def close(self):
+        self._conn.close()
+
+    def _chunk_ids_locked(self, file: str) -> set:
+        rows = self._conn.execute(
+            "SELECT chunk_id FROM members WHERE file = ?", (file,)
+        ).fetchall()
+        return {chunk_id for (chunk_id,) in rows}
+
+    def _orphans_locked(self, chunk_ids: set) -> list[str]:
+        return sorted(
+            chunk_id
+            for chunk_id in chunk_ids
+            if self._conn.execute(
+                "SELECT 1 FROM members WHERE chunk_id = ? LIMIT 1", (chunk_id,)
+            ).fetchone()
+            is None
+        )
@@ -1,44 +1,299 @@
-import requests
-import os
 import json
-from typing import Optional
-from lang_model import LangModel
+import logging
+import os
+import threading
+import time
+from collections.abc import AsyncIterator
+
+import requests
 
+from http_client import (
+    AsyncSession,
+    RetryPolicy,
+    Timeouts,
+    aiter_lines,
+    build_session,
+    send_with_retries,
+    to_lang_model_error,
+)
+from lang_model import LangModel, LangModelError
 
 OLLAMA_URL_ENV = "OLLAMA_URL"
 OLLAMA_MODEL_ENV = "OLLAMA_MODEL"
+# How long Ollama keeps the model (and its prompt cache) loaded after a request
+OLLAMA_KEEP_ALIVE_ENV = "OLLAMA_KEEP_ALIVE"
+# Seconds between keep-warm pings while the daemon is serving
+OLLAMA_KEEP_WARM_INTERVAL_ENV = "OLLAMA_KEEP_WARM_INTERVAL"
 
 
 class OllamaLangModel(LangModel):
-    def __init__(self, url: Optional[str] = None, model: Optional[str] = None):
+    def __init__(
+        self,
+        url: str | None = None,
+        model: str | None = None,
+        timeouts: Timeouts | None = None,
+        retry_policy: RetryPolicy | None = None,
+        session: requests.Session | None = None,
+        keep_alive: str | None = None,
+    ):
         self.url = url or os.environ.get(OLLAMA_URL_ENV, "http://localhost:11434")
         self.model = model or os.environ.get(OLLAMA_MODEL_ENV, "llama2")
+        self.keep_alive = keep_alive or os.environ.get(OLLAMA_KEEP_ALIVE_ENV, "30m")
+        self.timeouts = timeouts or Timeouts()
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.session = session or build_session(self.retry_policy)
+        self.async_session = AsyncSession(self.timeouts)
+        self.last_preloaded: float | None = None  # time.time() of last preload
+        self._keep_warm_stopped = threading.Event()
+        self._keep_warm_thread = None
+
+    def generate(
+        self,
+        prompt: str,
+        max_tokens: int | None = None,
+        timeout: float | None = None,
+    ) -> str:
+        return self.chat(self._messages(prompt), max_tokens, timeout)
+
+    def chat(
+        self,
+        messages: list[dict[str, str]],
+        max_tokens: int | None = None,
+        timeout: float | None = None,
+    ) -> str:
+        # Ollama reuses its cache for the longest common prefix of consecutive
+        # prompts, so sending a conversation with an unchanged system message
+        # and history only prefills the new turn.
+        return self._chat(messages, max_tokens, timeout)
+
+    def generate_json(
+        self,
+        prompt: str,
+        schema: dict | None = None,
+        max_tokens: int | None = None,
+        timeout: float | None = None,
+    ) -> str:
+        return self._chat(
+            self._messages(prompt), max_tokens, timeout, json_format=schema or "json"
+        )
 
-    def generate(self, prompt: str) -> str:
+    def _chat(
+        self,
+        messages: list[dict[str, str]],
+        max_tokens: int | None = None,
+        timeout: float | None = None,
+        json_format: str | dict | None = None,
+    ) -> str:
+        expires_at = time.monotonic() + timeout if timeout is not None else None
         try:
-            response = requests.post(
+            response = self.session.post(
                 f"{self.url}/api/chat",
-                json={
-                    "model": self.model,
-                    "messages": [
-                        {"role": "system", "content": "You are a helpful assistant."},
-                        {"role": "user", "content": prompt},
-                    ],
-                },
-                timeout=60,
+                json=self._request_body(messages, max_tokens, json_format),
+                timeout=self.timeouts.capped(timeout).as_tuple(),
                 stream=True,
             )
-            response.raise_for_status()
-            answer = ""
-            for line in response.iter_lines():
-                if not line:
-                    continue
-                try:
-                    data = json.loads(line.decode("utf-8"))
-                    if "message" in data and "content" in data["message"]:
-                        answer += data["message"]["content"]
-                except json.JSONDecodeError:
-                    continue  # skip malformed lines
+            with response:
+                response.raise_for_status()
+                answer = ""
+                for line in response.iter_lines():
+                    answer += self._parse_line(line)
+                    # The read timeout applies per line, so enforce the
+                    # overall limit here.
+                    if expires_at is not None and time.monotonic() > expires_at:
+                        raise LangModelError(
+                            "Ollama", f"timed out after {timeout:.1f}s"
+                        )
             return answer.strip()
-        except requests.exceptions.HTTPError as e:
-            return f"Ollama API responded with {response.status_code}: {response.text}: {e}"
+        except requests.exceptions.RequestException as e:
+            raise to_lang_model_error("Ollama", e) from e
+
+    async def agenerate(
+        self,
+        prompt: str,
+        max_tokens: int | None = None,
+        timeout: float | None = None,
+    ) -> str:
+        return await self.achat(self._messages(prompt), max_tokens, timeout)
+
+    async def achat(
+        self,
+        messages: list[dict[str, str]],
+        max_tokens: int | None = None,
+        timeout: float | None = None,
+    ) -> str:
+        answer = ""
+        async for token in self._astream_chat(messages, max_tokens, timeout):
+            answer += token
+        return answer.strip()
+
+    async def agenerate_json(
+        self,
+        prompt: str,
+        schema: dict | None = None,
+        max_tokens: int | None = None,
+        timeout: float | None = None,
+    ) -> str:
+        answer = ""
+        async for token in self._astream_chat(
+            self._messages(prompt), max_tokens, timeout, json_format=schema or "json"
+        ):
+            answer += token
+        return answer.strip()
+
+    async def astream(
+        self,
+        prompt: str,
+        max_tokens: int | None = None,
+        timeout: float | None = None,
+    ) -> AsyncIterator[str]:
+        async for token in self._astream_chat(
+            self._messages(prompt), max_tokens, timeout
+        ):
+            yield token
+
+    async def _astream_chat(
+        self,
+        messages: list[dict[str, str]],
+        max_tokens: int | None = None,
+        timeout: float | None = None,
+        json_format: str | dict | None = None,
+    ) -> AsyncIterator[str]:
+        expires_at = time.monotonic() + timeout if timeout is not None else None
+        response = await send_with_retries(
+            self.async_session,
+            "Ollama",
+            f"{self.url}/api/chat",
+            json=self._request_body(messages, max_tokens, json_format),
+            retry_policy=self.retry_policy,
+            timeouts=self.timeouts.capped(timeout),
+        )
+        try:
+            async for line in aiter_lines(response, "Ollama"):
+                token = self._parse_line(line)
+                if token:
+                    yield token
+                # The read timeout applies per line, so enforce the overall
+                # limit here, as _chat() does.
+                if expires_at is not None and time.monotonic() > expires_at:
+                    raise LangModelError("Ollama", f"timed out after {timeout:.1f}s")
+        finally:
+            await response.aclose()
+
+    def preload(self) -> bool:
+        """
+        Load the model into memory, or reset its keep_alive timer if it is
+        already loaded. Returns False if Ollama could not be reached.
+        """
+        try:
+            # A generate request without a prompt only loads the model
+            response = self.session.post(
+                f"{self.url}/api/generate",
+                json={"model": self.model, "keep_alive": self.keep_alive},
+                timeout=self.timeouts.as_tuple(),
+            )
+            response.raise_for_status()
+        except requests.exceptions.RequestException as e:
+            logging.getLogger(__name__).warning(
+                f"Failed to preload Ollama model {self.model}: {e}"
+            )
+            return False
+        self.last_preloaded = time.time()
+        return True
+
+    def is_resident(self) -> bool:
+        """True if Ollama currently has the model loaded in memory."""
+        try:
+            response = self.session.get(
+                f"{self.url}/api/ps", timeout=self.timeouts.as_tuple()
+            )
+            response.raise_for_status()
+            models = response.json().get("models") or []
+        except (requests.exceptions.RequestException, ValueError) as e:
+            logging.getLogger(__name__).warning(f"Failed to list Ollama models: {e}")
+            return False
+        names = {self.model, f"{self.model}:latest"}
+        return any(m.get("name") in names or m.get("model") in names for m in models)
+
+    def start_keep_warm(self, interval: float | None = None):
+        """
+        Preload the model now, then ping it every interval seconds on a daemon
+        thread so it is never unloaded while the daemon is serving.
+        """
+        if self._keep_warm_thread is not None:
+            return
+        if interval is None:
+            interval = float(os.environ.get(OLLAMA_KEEP_WARM_INTERVAL_ENV, "240"))
+        self._keep_warm_stopped.clear()
+        self._keep_warm_thread = threading.Thread(
+            target=self._keep_warm,
+            args=(interval,),
+            name="ollama-keep-warm",
+            daemon=True,
+        )
+        self._keep_warm_thread.start()
+
+    def stop_keep_warm(self):
+        self._keep_warm_stopped.set()
+        if self._keep_warm_thread is not None:
+            self._keep_warm_thread.join()
+            self._keep_warm_thread = None
+
+    def status(self) -> dict:
+        return {
+            "model": self.model,
+            "resident": self.is_resident(),
+            "keep_alive": self.keep_alive,
+            "last_preloaded": self.last_preloaded,
+        }
+
+    def _keep_warm(self, interval: float):
+        while not self._keep_warm_stopped.is_set():
+            if self.preload():
+                logging.getLogger(__name__).debug(f"Ollama model {self.model} is warm")
+                self._keep_warm_stopped.wait(interval)
+            else:
+                # Ollama may still be starting up; try again soon
+                self._keep_warm_stopped.wait(min(interval, 5.0))
+
+    def _request_body(
+        self,
+        messages: list[dict[str, str]],
+        max_tokens: int | None = None,
+        json_format: str | dict | None = None,
+    ) -> dict:
+        body = {
+            "model": self.model,
+            "messages": messages,
+            "keep_alive": self.keep_alive,
+        }
+        if max_tokens is not None:
+            body["options"] = {"num_predict": max_tokens}
+        if json_format is not None:
+            # "json", or a JSON schema the output must follow
+            body["format"] = json_format
+            body.setdefault("options", {})["temperature"] = 0
+        return body
+
+    @staticmethod
+    def _messages(prompt: str) -> list[dict[str, str]]:
+        return [
+            {"role": "system", "content": "You are a helpful assistant."},
+            {"role": "user", "content": prompt},
+        ]
+
+    @staticmethod
+    def _parse_line(line) -> str:
+        """Return the content of one line of Ollama's streamed chat response."""
+        if not line:
+            return ""
+        if isinstance(line, bytes):
+            line = line.decode("utf-8")
+        try:
+            data = json.loads(line)
+        except json.JSONDecodeError:
+            return ""  # skip malformed lines
+        if "error" in data:
+            raise LangModelError("Ollama", str(data["error"]))
+        if "message" in data and "content" in data["message"]:
+            return data["message"]["content"]
+        return ""
@@ -1,8 +1,20 @@
+import json
 import logging
 import os
+from collections.abc import AsyncIterator
+
 import requests
-from typing import Optional
-from lang_model import LangModel
+
+from http_client import (
+    AsyncSession,
+    RetryPolicy,
+    Timeouts,
+    aiter_lines,
+    build_session,
+    send_with_retries,
+    to_lang_model_error,
+)
+from lang_model import LangModel, LangModelError
 
 OPENROUTER_API_KEY_ENV = "OPENROUTER_API_KEY"
 OPENROUTER_MODEL_ENV = "OPENROUTER_MODEL"
@@ -10,7 +22,14 @@ OPENROUTER_URL = "https://openrouter.ai/api/v1/chat/completions"
 
 
 class OpenRouterLangModel(LangModel):
-    def __init__(self, api_key: Optional[str] = None, model: Optional[str] = None):
+    def __init__(
+        self,
+        api_key: str | None = None,
+        model: str | None = None,
+        timeouts: Timeouts | None = None,
+        retry_policy: RetryPolicy | None = None,
+        session: requests.Session | None = None,
+    ):
         self.api_key = api_key or os.environ.get(OPENROUTER_API_KEY_ENV)
         self.model = model or os.environ.get(
             OPENROUTER_MODEL_ENV, "openai/gpt-3.5-turbo"
@@ -19,31 +38,199 @@ class OpenRouterLangModel(LangModel):
             raise ValueError(
                 "OpenRouter API key must be set in the environment variable 'OPENROUTER_API_KEY' or passed to the constructor."
             )
-        logging.getLogger(__name__).debug(
-            f"Initialized OpenRouterLangModel with model: {self.model}"
-        )
-
-    def generate(self, prompt: str) -> str:
         headers = {
             "Authorization": f"Bearer {self.api_key}",
             "Content-Type": "application/json",
         }
-        data = {
-            "model": self.model,
-            "messages": [
-                {"role": "system", "content": "You are a helpful assistant."},
-                {"role": "user", "content": prompt},
-            ],
-        }
+        self.timeouts = timeouts or Timeouts()
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.session = session or build_session(self.retry_policy)
+        self.session.headers.update(headers)
+        self.async_session = AsyncSession(self.timeouts, headers=headers)
+        logging.getLogger(__name__).debug(
+            f"Initialized OpenRouterLangModel with model: {self.model}"
+        )
+
+    def generate(
+        self,
+        prompt: str,
+        max_tokens: int | None = None,
+        timeout: float | None = None,
+    ) -> str:
+        return self.chat(self._messages(prompt), max_tokens, timeout)
+
+    def chat(
+        self,
+        messages: list[dict[str, str]],
+        max_tokens: int | None = None,
+        timeout: float | None = None,
+    ) -> str:
+        return self._chat(messages, max_tokens, timeout)
+
+    def generate_json(
+        self,
+        prompt: str,
+        schema: dict | None = None,
+        max_tokens: int | None = None,
+        timeout: float | None = None,
+    ) -> str:
+        return self._chat(
+            self._messages(prompt),
+            max_tokens,
+            timeout,
+            response_format=self._response_format(schema),
+        )
+
+    def _chat(
+        self,
+        messages: list[dict[str, str]],
+        max_tokens: int | None = None,
+        timeout: float | None = None,
+        response_format: dict | None = None,
+    ) -> str:
         try:
-            response = requests.post(
-                OPENROUTER_URL, headers=headers, json=data, timeout=60
+            response = self.session.post(
+                OPENROUTER_URL,
+                json=self._request_body(
+                    messages, max_tokens, response_format=response_format
+                ),
+                timeout=self.timeouts.capped(timeout).as_tuple(),
             )
             response.raise_for_status()
             result = response.json()
-            # OpenRouter returns OpenAI-compatible format
+        except requests.exceptions.RequestException as e:
+            raise to_lang_model_error("OpenRouter", e) from e
+        return self._parse_result(result)
+
+    async def agenerate(
+        self,
+        prompt: str,
+        max_tokens: int | None = None,
+        timeout: float | None = None,
+    ) -> str:
+        return await self.achat(self._messages(prompt), max_tokens, timeout)
+
+    async def achat(
+        self,
+        messages: list[dict[str, str]],
+        max_tokens: int | None = None,
+        timeout: float | None = None,
+    ) -> str:
+        return await self._achat(messages, max_tokens, timeout)
+
+    async def agenerate_json(
+        self,
+        prompt: str,
+        schema: dict | None = None,
+        max_tokens: int | None = None,
+        timeout: float | None = None,
+    ) -> str:
+        return await self._achat(
+            self._messages(prompt),
+            max_tokens,
+            timeout,
+            response_format=self._response_format(schema),
+        )
+
+    async def _achat(
+        self,
+        messages: list[dict[str, str]],
+        max_tokens: int | None = None,
+        timeout: float | None = None,
+        response_format: dict | None = None,
+    ) -> str:
+        response = await send_with_retries(
+            self.async_session,
+            "OpenRouter",
+            OPENROUTER_URL,
+            json=self._request_body(
+                messages, max_tokens, response_format=response_format
+            ),
+            retry_policy=self.retry_policy,
+            timeouts=self.timeouts.capped(timeout),
+        )
+        try:
+            body = await response.aread()
+        finally:
+            await response.aclose()
+        try:
+            result = json.loads(body)
+        except json.JSONDecodeError as e:
+            raise LangModelError("OpenRouter", f"invalid JSON response: {e}") from e
+        return self._parse_result(result)
+
+    async def astream(
+        self,
+        prompt: str,
+        max_tokens: int | None = None,
+        timeout: float | None = None,
+    ) -> AsyncIterator[str]:
+        response = await send_with_retries(
+            self.async_session,
+            "OpenRouter",
+            OPENROUTER_URL,
+            json=self._request_body(self._messages(prompt), max_tokens, stream=True),
+            retry_policy=self.retry_policy,
+            timeouts=self.timeouts.capped(timeout),
+        )
+        try:
+            # Server-sent events in the OpenAI-compatible streaming format
+            async for line in aiter_lines(response, "OpenRouter"):
+                if not line.startswith("data:"):
+                    continue  # skip keep-alive comments and blank lines
+                payload = line[len("data:") :].strip()
+                if payload == "[DONE]":
+                    break
+                try:
+                    data = json.loads(payload)
+                except json.JSONDecodeError:
+                    continue
+                if "error" in data:
+                    raise LangModelError("OpenRouter", str(data["error"]))
+                choices = data.get("choices") or [{}]
+                token = (choices[0].get("delta") or {}).get("content")
+                if token:
+                    yield token
+        finally:
+            await response.aclose()
+
+    def _request_body(
+        self,
+        messages: list[dict[str, str]],
+        max_tokens: int | None = None,
+        stream: bool = False,
+        response_format: dict | None = None,
+    ) -> dict:
+        body = {"model": self.model, "messages": messages}
+        if max_tokens is not None:
+            body["max_tokens"] = max_tokens
+        if stream:
+            body["stream"] = True
+        if response_format is not None:
+            body["response_format"] = response_format
+            body["temperature"] = 0
+        return body
+
+    @staticmethod
+    def _response_format(schema: dict | None) -> dict:
+        if schema is None:
+            return {"type": "json_object"}
+        return {
+            "type": "json_schema",
+            "json_schema": {"name": "response", "strict": True, "schema": schema},
+        }
+
+    @staticmethod
+    def _messages(prompt: str) -> list[dict[str, str]]:
+        return [
+            {"role": "system", "content": "You are a helpful assistant."},
+            {"role": "user", "content": prompt},
+        ]
+
+    @staticmethod
+    def _parse_result(result: dict) -> str:
+        # OpenRouter returns OpenAI-compatible format
+        try:
             return result["choices"][0]["message"]["content"].strip()
-        except requests.exceptions.HTTPError as e:
-            return f"OpenRouter API responded with {response.status_code}: {response.text}: {e}"
-        except Exception as e:
-            return f"OpenRouter API error: {e}"
+        except (KeyError, IndexError, TypeError) as e:
+            raise LangModelError("OpenRouter", f"unexpected response: {result}") from e
@@ -1,31 +1,78 @@
-from dataclasses import dataclass
-from typing import List, Any, Optional
-from embeddings import Embedder
-from time_range import TimeRangeExtractor
-from vector_store import VectorStore
-from datetime import datetime
+import asyncio
 import logging
-from ollama import OllamaLangModel
+from concurrent.futures import Executor, ThreadPoolExecutor
+from dataclasses import dataclass, field, replace
+from datetime import datetime
+from typing import Any
+
+from chat_session import ChatSession, cosine_similarity
+from chunker import note_text
+from deadline import Deadline, DeadlineExceeded
+from embeddings import Embedder
 from lang_model import LangModel
+from lexical import LexicalIndex, reciprocal_rank_fusion
+from map_reduce import MapReduceSummarizer
+from ollama import OllamaLangModel
+from rollups import RollupStore, rollup_context
+from singleflight import SingleFlight, normalize_text
+from time_range import TimeRangeExtractor, mentions_time
+from vector_store import VectorStore
+
+# Shared, bounded pool for the blocking embedding and vector store calls made
+# by the async query path.
+_retrieval_executor = ThreadPoolExecutor(
+    max_workers=4, thread_name_prefix="query-retrieval"
+)
 
 
 @dataclass
 class ContextChunk:
     id: str
-    text: Optional[str]
-    metadata: Optional[Any]
-    distance: Optional[float]
+    text: str | None
+    metadata: Any | None
+    distance: float | None
 
 
 @dataclass
 class QueryResult:
     answer: str
-    context: List[ContextChunk]
+    context: list[ContextChunk]
+    degradations: list[str] = field(default_factory=list)
+    # For chat turns: whether the session's previous context was reused
+    reused_context: bool = False
+
+
+# Degradations applied when a query is running out of time
+SKIPPED_TIME_EXTRACTION = "skipped_time_extraction"
+REDUCED_CONTEXT = "reduced_context"
+CAPPED_GENERATION_TOKENS = "capped_generation_tokens"
+SKIPPED_MAP_REDUCE = "skipped_map_reduce"
+
+# Ids of the context chunks that are rollups rather than stored chunks
+ROLLUP_ID_PREFIX = "rollup::"
 
 
 class QueryEngine:
     """Query engine generates a helpful response for user queries."""
 
+    # When a query has a deadline, stages are degraded once the remaining time
+    # (in seconds) drops below these thresholds.
+    SKIP_TIME_EXTRACTION_BELOW = 20.0
+    SKIP_MAP_REDUCE_BELOW = 30.0
+    REDUCE_CONTEXT_BELOW = 15.0
+    CAP_TOKENS_BELOW = 10.0
+    CAPPED_MAX_TOKENS = 256
+    # Share of the remaining time the time range extraction may use
+    TIME_EXTRACTION_SHARE = 0.25
+    # A chat follow-up reuses the session's context unless its cosine
+    # similarity to the query that context was retrieved for is lower.
+    TOPIC_SIMILARITY_THRESHOLD = 0.5
+    # Messages of chat history sent with each turn
+    MAX_CHAT_MESSAGES = 20
+    # Similar chunks are over-fetched by this factor so that enough remain
+    # once (near) duplicates are collapsed
+    DUPLICATE_OVERFETCH = 2
+
     def __init__(
         self,
         embedder=None,
@@ -33,34 +80,378 @@ class QueryEngine:
         lang_model: LangModel = None,
         max_context: int = 10,
         with_time_aware_filtering: bool = True,
+        executor: Executor | None = None,
+        rollups: RollupStore | None = None,
+        rollup_min_days: int = 3,
+        map_reducer: MapReduceSummarizer | None = None,
+        map_reduce_min_days: int = 14,
+        time_range_lang_model: LangModel | None = None,
+        time_field: str = "event_date",
+        lexical: LexicalIndex | None = None,
     ):
         self.embedder = embedder or Embedder()
         self.vector_store = vector_store or VectorStore()
         self.lang_model = lang_model or OllamaLangModel()
-        self.time_range_extractor = TimeRangeExtractor(lang_model=self.lang_model)
+        # Time range extraction can use a smaller, faster model than answers
+        self.time_range_extractor = TimeRangeExtractor(
+            lang_model=time_range_lang_model or self.lang_model
+        )
         self.with_time_aware_filtering = with_time_aware_filtering
         self.max_context = max_context
+        # Metadata field time ranges are matched against
+        self.time_field = time_field
+        # BM25 index of chunk texts, fused with vector search when given
+        self.lexical = lexical
+        self.executor = executor or _retrieval_executor
+        self.rollups = rollups
+        self.rollup_min_days = rollup_min_days
+        self.map_reducer = map_reducer or MapReduceSummarizer(self.lang_model)
+        self.map_reduce_min_days = map_reduce_min_days
+        self._inflight = SingleFlight()
 
-    def query(self, query_string: str) -> QueryResult:
+    def query(self, query_string: str, deadline: Deadline | None = None) -> QueryResult:
         """
         Retrieve top matching chunks and use LangModel to answer the query using those chunks as context.
         Returns a QueryResult with the answer and the context used.
+        If a deadline is given, stages are degraded as it approaches and the
+        degradations applied are listed in the result.
+        Concurrent identical queries share a single retrieval and generation.
         """
+        degradations = []
         time_range = None
-        if self.with_time_aware_filtering:
-            time_range = self.time_range_extractor.extract(query_string)
-        context = self._find_similar_context(
+        if self._should_extract_time_range(deadline, degradations):
+            time_range = self.time_range_extractor.extract(
+                query_string, timeout=self._time_extraction_timeout(deadline)
+            )
+        result = self._inflight.do(
+            self._coalescing_key(query_string, time_range),
+            lambda: self._answer(query_string, time_range, deadline),
+        )
+        return replace(result, degradations=degradations + result.degradations)
+
+    async def aquery(
+        self, query_string: str, deadline: Deadline | None = None
+    ) -> QueryResult:
+        """
+        Async variant of query(). LLM calls are awaited on the event loop while
+        embedding and vector store calls run in the bounded retrieval executor.
+        Cancelling the returned coroutine cancels the in-flight LLM calls.
+        """
+        degradations = []
+        time_range = None
+        if self._should_extract_time_range(deadline, degradations):
+            time_range = await self.time_range_extractor.aextract(
+                query_string, timeout=self._time_extraction_timeout(deadline)
+            )
+        result = await self._inflight.ado(
+            self._coalescing_key(query_string, time_range),
+            lambda: self._aanswer(query_string, time_range, deadline),
+        )
+        return replace(result, degradations=degradations + result.degradations)
+
+    def chat(
+        self, session: ChatSession, message: str, deadline: Deadline | None = None
+    ) -> QueryResult:
+        """
+        Answer the next message of a chat session. Follow-ups reuse the
+        session's retrieved context, and only run time range extraction and
+        retrieval again when they change the time range or the topic. Turns of
+        one session must not run concurrently; achat() serializes them.
+        """
+        degradations = []
+        time_range = session.time_range
+        if self._should_extract_chat_time_range(
+            session, message, deadline, degradations
+        ):
+            time_range = self._chat_time_range(
+                session,
+                self.time_range_extractor.extract(
+                    message, timeout=self._time_extraction_timeout(deadline)
+                ),
+            )
+        embedding = self.embedder.embed([message])[0]
+        reused = self._update_chat_topic(session, message, time_range, embedding)
+        if not reused:
+            context = self._retrieve_context(
+                session.topic_query,
+                time_range,
+                self._context_budget(deadline, degradations),
+            )
+            self._set_chat_context(session, context, time_range)
+        max_tokens, timeout = self._generation_budget(deadline, degradations)
+        answer = self.lang_model.chat(
+            self._chat_messages(session, message),
+            max_tokens=max_tokens,
+            timeout=timeout,
+        )
+        session.add_turn(message, answer, self.MAX_CHAT_MESSAGES)
+        return QueryResult(
+            answer=answer,
+            context=session.context,
+            degradations=degradations,
+            reused_context=reused,
+        )
+
+    async def achat(
+        self, session: ChatSession, message: str, deadline: Deadline | None = None
+    ) -> QueryResult:
+        """Async variant of chat()."""
+        async with session.lock:
+            degradations = []
+            time_range = session.time_range
+            if self._should_extract_chat_time_range(
+                session, message, deadline, degradations
+            ):
+                time_range = self._chat_time_range(
+                    session,
+                    await self.time_range_extractor.aextract(
+                        message, timeout=self._time_extraction_timeout(deadline)
+                    ),
+                )
+            loop = asyncio.get_running_loop()
+            embedding = (
+                await loop.run_in_executor(
+                    self.executor, self.embedder.embed, [message]
+                )
+            )[0]
+            reused = self._update_chat_topic(session, message, time_range, embedding)
+            if not reused:
+                context = await loop.run_in_executor(
+                    self.executor,
+                    self._retrieve_context,
+                    session.topic_query,
+                    time_range,
+                    self._context_budget(deadline, degradations),
+                )
+                self._set_chat_context(session, context, time_range)
+            max_tokens, timeout = self._generation_budget(deadline, degradations)
+            try:
+                answer = await asyncio.wait_for(
+                    self.lang_model.achat(
+                        self._chat_messages(session, message),
+                        max_tokens=max_tokens,
+                        timeout=timeout,
+                    ),
+                    timeout,
+                )
+            except TimeoutError as e:
+                raise DeadlineExceeded(
+                    f"Deadline of {deadline.seconds:.1f}s exceeded during generation"
+                ) from e
+            session.add_turn(message, answer, self.MAX_CHAT_MESSAGES)
+            return QueryResult(
+                answer=answer,
+                context=session.context,
+                degradations=degradations,
+                reused_context=reused,
+            )
+
+    def _should_extract_chat_time_range(
+        self,
+        session: ChatSession,
+        message: str,
+        deadline: Deadline | None,
+        degradations: list[str],
+    ) -> bool:
+        # Follow-ups that do not mention a time keep the session's time range
+        if session.topic_query is not None and not mentions_time(message):
+            return False
+        return self._should_extract_time_range(deadline, degradations)
+
+    @staticmethod
+    def _chat_time_range(session: ChatSession, time_range):
+        # A follow-up without a time range of its own keeps the session's one
+        if session.time_range and not (time_range.start or time_range.end):
+            return session.time_range
+        return time_range
+
+    def _update_chat_topic(
+        self, session: ChatSession, message: str, time_range, embedding: list[float]
+    ) -> bool:
+        """
+        Move the session to a new topic if the message drifts from the current
+        one. Returns True if the session's context can be reused as is.
+        """
+        same_topic = (
+            session.topic_embedding is not None
+            and cosine_similarity(embedding, session.topic_embedding)
+            >= self.TOPIC_SIMILARITY_THRESHOLD
+        )
+        if not same_topic:
+            session.topic_query = message
+            session.topic_embedding = embedding
+        return (
+            same_topic
+            and time_range == session.time_range
+            and session.index_version == getattr(self.vector_store, "version", None)
+        )
+
+    def _set_chat_context(
+        self, session: ChatSession, context: list[ContextChunk], time_range
+    ):
+        session.context = context
+        session.time_range = time_range
+        session.index_version = getattr(self.vector_store, "version", None)
+        context_texts = [self.ensure_str(c.text) for c in context if c.text]
+        session.system_prompt = self.CHAT_SYSTEM_TEMPLATE.format(
+            context="\n\n".join(context_texts),
+            today=datetime.now().strftime("%A, %B %d, %Y"),
+        )
+
+    def _chat_messages(self, session: ChatSession, message: str) -> list[dict]:
+        # The system message and history come first and stay unchanged between
+        # turns that reuse the context, so backends can reuse the prompt prefix.
+        return (
+            [{"role": "system", "content": session.system_prompt}]
+            + session.messages
+            + [{"role": "user", "content": message}]
+        )
+
+    def _answer(
+        self, query_string: str, time_range, deadline: Deadline | None
+    ) -> QueryResult:
+        degradations = []
+        max_results = self._context_budget(deadline, degradations)
+        map_reduce = self._should_map_reduce(time_range, deadline, degradations)
+        context = self._retrieve_context(
+            query_string, time_range, max_results, map_reduce
+        )
+        summaries = context
+        if self._needs_condensing(context, max_results):
+            summaries = self._summary_chunks(
+                self.map_reducer.condense(
+                    query_string,
+                    self._chunk_texts(context),
+                    timeout=deadline.remaining() if deadline else None,
+                )
+            )
+        prompt = self._build_prompt(query_string, summaries)
+        max_tokens, timeout = self._generation_budget(deadline, degradations)
+        answer = self.lang_model.generate(
+            prompt, max_tokens=max_tokens, timeout=timeout
+        )
+        return QueryResult(answer=answer, context=context, degradations=degradations)
+
+    async def _aanswer(
+        self, query_string: str, time_range, deadline: Deadline | None
+    ) -> QueryResult:
+        degradations = []
+        max_results = self._context_budget(deadline, degradations)
+        map_reduce = self._should_map_reduce(time_range, deadline, degradations)
+        loop = asyncio.get_running_loop()
+        context = await loop.run_in_executor(
+            self.executor,
+            self._retrieve_context,
             query_string,
-            max_results=self.max_context,
-            start_time=time_range.start if time_range else None,
-            end_time=time_range.end if time_range else None,
+            time_range,
+            max_results,
+            map_reduce,
+        )
+        try:
+            summaries = context
+            if self._needs_condensing(context, max_results):
+                timeout = deadline.remaining() if deadline else None
+                summaries = self._summary_chunks(
+                    await asyncio.wait_for(
+                        self.map_reducer.acondense(
+                            query_string, self._chunk_texts(context), timeout=timeout
+                        ),
+                        timeout,
+                    )
+                )
+            prompt = self._build_prompt(query_string, summaries)
+            max_tokens, timeout = self._generation_budget(deadline, degradations)
+            answer = await asyncio.wait_for(
+                self.lang_model.agenerate(
+                    prompt, max_tokens=max_tokens, timeout=timeout
+                ),
+                timeout,
+            )
+        except TimeoutError as e:
+            raise DeadlineExceeded(
+                f"Deadline of {deadline.seconds:.1f}s exceeded during generation"
+            ) from e
+        return QueryResult(answer=answer, context=context, degradations=degradations)
+
+    @staticmethod
+    def _needs_condensing(context: list[ContextChunk], max_results: int) -> bool:
+        """
+        Whether context is too long to prompt with as is and is condensed by
+        map-reduce first. Rollups are summaries already, one per day or week
+        of a range, so they are not.
+        """
+        if len(context) <= max_results:
+            return False
+        return not any(chunk.id.startswith(ROLLUP_ID_PREFIX) for chunk in context)
+
+    def _should_extract_time_range(
+        self, deadline: Deadline | None, degradations: list[str]
+    ) -> bool:
+        if not self.with_time_aware_filtering:
+            return False
+        if deadline and deadline.remaining() < self.SKIP_TIME_EXTRACTION_BELOW:
+            degradations.append(SKIPPED_TIME_EXTRACTION)
+            return False
+        return True
+
+    def _should_map_reduce(
+        self, time_range, deadline: Deadline | None, degradations: list[str]
+    ) -> bool:
+        """
+        Wide time ranges are answered from every chunk in the range, condensed
+        by map-reduce, rather than from the top max_context matches.
+        """
+        if not (time_range and time_range.start and time_range.end):
+            return False
+        end = min(time_range.end, datetime.now())
+        if (end - time_range.start).days + 1 < self.map_reduce_min_days:
+            return False
+        if deadline and deadline.remaining() < self.SKIP_MAP_REDUCE_BELOW:
+            degradations.append(SKIPPED_MAP_REDUCE)
+            return False
+        return True
+
+    def _time_extraction_timeout(self, deadline: Deadline | None) -> float | None:
+        if not deadline:
+            return None
+        return deadline.remaining() * self.TIME_EXTRACTION_SHARE
+
+    def _context_budget(
+        self, deadline: Deadline | None, degradations: list[str]
+    ) -> int:
+        if deadline:
+            deadline.check("retrieval")
+            if deadline.remaining() < self.REDUCE_CONTEXT_BELOW:
+                degradations.append(REDUCED_CONTEXT)
+                return max(1, self.max_context // 2)
+        return self.max_context
+
+    def _generation_budget(
+        self, deadline: Deadline | None, degradations: list[str]
+    ) -> tuple[int | None, float | None]:
+        """Return the (max_tokens, timeout) to generate the answer with."""
+        if not deadline:
+            return None, None
+        deadline.check("generation")
+        if deadline.remaining() < self.CAP_TOKENS_BELOW:
+            degradations.append(CAPPED_GENERATION_TOKENS)
+            return self.CAPPED_MAX_TOKENS, deadline.remaining()
+        return None, deadline.remaining()
+
+    def _coalescing_key(self, query_string: str, time_range):
+        """
+        Queries are coalesced when their normalized text, time range and the
+        version of the index they would read all match.
+        """
+        return (
+            normalize_text(query_string),
+            time_range.start if time_range else None,
+            time_range.end if time_range else None,
+            getattr(self.vector_store, "version", None),
         )
-        prompt = self._build_prompt(query_string, context)
-        answer = self.lang_model.generate(prompt)
-        return QueryResult(answer=answer, context=context)
 
     def _build_prompt(
-        self, query_string: str, similar_context: List[ContextChunk]
+        self, query_string: str, similar_context: list[ContextChunk]
     ) -> str:
         """Build a prompt for the LLM to generate a response."""
         context_texts = [
@@ -77,48 +468,204 @@ class QueryEngine:
             logger.debug(f"Built prompt: {self._format_log_message(prompt)}")
         return prompt
 
+    def _retrieve_context(
+        self,
+        query_string: str,
+        time_range,
+        max_results: int,
+        map_reduce: bool = False,
+    ) -> list[ContextChunk]:
+        """
+        Retrieve the context for a query. Ranges of at least rollup_min_days
+        are answered from precomputed rollups when they cover the whole range.
+        Otherwise, with map_reduce, every chunk in the range is returned.
+        """
+        if time_range and time_range.start and time_range.end and self.rollups:
+            start = time_range.start.date()
+            end = min(time_range.end.date(), datetime.now().date())
+            if (end - start).days + 1 >= self.rollup_min_days:
+                rollups = rollup_context(self.rollups, start, end)
+                if rollups is not None:
+                    logging.getLogger(__name__).debug(
+                        f"Answering from {len(rollups)} rollup(s) for {start} to {end}"
+                    )
+                    return [
+                        ContextChunk(
+                            id=f"{ROLLUP_ID_PREFIX}{r.period}::{r.start.isoformat()}",
+                            text=f"Summary of {r.label()}:\n{r.summary}",
+                            metadata={"period": r.period, "start": r.start.isoformat()},
+                            distance=None,
+                        )
+                        for r in rollups
+                    ]
+        if map_reduce:
+            return self._range_context(time_range.start, time_range.end)
+        return self._find_similar_context(
+            query_string,
+            max_results=max_results,
+            start_time=time_range.start if time_range else None,
+            end_time=time_range.end if time_range else None,
+        )
+
     def _find_similar_context(
         self,
         query: str,
         max_results: int = 10,
-        start_time: Optional[datetime] = None,
-        end_time: Optional[datetime] = None,
-    ) -> List[ContextChunk]:
+        start_time: datetime | None = None,
+        end_time: datetime | None = None,
+    ) -> list[ContextChunk]:
         """
         Retrieve top matching context chunks for a single query.
         NOTE: This implementation only supports single-query (one embedding at a time).
+        With a lexical index, chunks matching the query's terms are fused
+        with the vector matches by reciprocal rank. When the query names
+        something only a few chunks mention, those chunks are also ranked
+        by their vectors, as a third ranking in the fusion.
         """
         logging.getLogger(__name__).debug(
             f"Finding similar context for query: {query}, start_time: {start_time}, end_time: {end_time} max_results: {max_results}"
         )
 
         query_embedding = self.embedder.embed([query])[0]
-        results = self.vector_store.query(
-            query_embedding,
-            max_results=max_results,
-            start_time=start_time.timestamp() if start_time else None,
-            end_time=end_time.timestamp() if end_time else None,
+        start = start_time.timestamp() if start_time else None
+        end = end_time.timestamp() if end_time else None
+        candidates = max_results * self.DUPLICATE_OVERFETCH
+        lexical_ids, selective = [], None
+        if self.lexical is not None:
+            lexical_ids = self.lexical.search(
+                query, candidates, start, end, self.time_field
+            )
+            selective = self.lexical.selective_ids(query, start, end, self.time_field)
+        chunks = {}
+
+        def vector_search(ids: list[str] | None = None) -> list[str]:
+            results = self.vector_store.query(
+                query_embedding,
+                max_results=candidates,
+                start_time=start,
+                end_time=end,
+                time_field=self.time_field,
+                ids=ids,
+            )
+            return self._add_context_chunks(results, chunks)
+
+        # The full vector search always runs, so chunks that match the
+        # query's meaning rather than its words are never cut
+        rankings = [vector_search()]
+        if selective is not None:
+            logging.getLogger(__name__).debug(
+                f"Also ranking the {len(selective)} chunk(s) naming the query's terms"
+            )
+            rankings.append(vector_search(selective))
+        if lexical_ids:
+            rankings.append(lexical_ids)
+        ranked = rankings[0]
+        if len(rankings) > 1:
+            ranked = reciprocal_rank_fusion(rankings)
+            # Lexical matches the vector search did not return
+            missing = [i for i in ranked if i not in chunks]
+            if missing:
+                found = self.vector_store.get_by_ids(
+                    missing, include=["documents", "metadatas"]
+                )
+                for i, chunk_id in enumerate(found["ids"]):
+                    chunks[chunk_id] = ContextChunk(
+                        id=chunk_id,
+                        text=note_text(found["documents"][i], found["metadatas"][i]),
+                        metadata=found["metadatas"][i],
+                        distance=None,
+                    )
+        similar_context = [chunks[i] for i in ranked if i in chunks]
+        similar_context = self._collapse_duplicates(similar_context)[:max_results]
+
+        logging.getLogger(__name__).debug(
+            f"Found {len(similar_context)} similar context chunks"
         )
+        return similar_context
 
+    def _add_context_chunks(self, results, chunks: dict) -> list[str]:
+        """Add the chunks of vector query results to chunks; returns their ids."""
         ids = self.get_first_list("ids", results)
         documents = self.get_first_list("documents", results)
         metadatas = self.get_first_list("metadatas", results)
         distances = self.get_first_list("distances", results)
-
-        similar_context = []
         for i in range(len(ids)):
-            chunk = ContextChunk(
+            metadata = metadatas[i] if i < len(metadatas) else None
+            chunks[ids[i]] = ContextChunk(
                 id=ids[i],
-                text=documents[i] if i < len(documents) else None,
-                metadata=metadatas[i] if i < len(metadatas) else None,
+                text=note_text(documents[i], metadata) if i < len(documents) else None,
+                metadata=metadata,
                 distance=distances[i] if i < len(distances) else None,
             )
-            similar_context.append(chunk)
+        return ids
 
+    def _range_context(
+        self, start_time: datetime, end_time: datetime
+    ) -> list[ContextChunk]:
+        """All chunks dated within [start_time, end_time], oldest first."""
+        results = self.vector_store.get_by_time_range(
+            start_time.timestamp(), end_time.timestamp(), time_field=self.time_field
+        )
+        ids = results.get("ids") or []
+        documents = results.get("documents") or []
+        metadatas = results.get("metadatas") or []
+        context = [
+            ContextChunk(
+                id=ids[i],
+                text=(
+                    note_text(
+                        documents[i], metadatas[i] if i < len(metadatas) else None
+                    )
+                    if i < len(documents)
+                    else None
+                ),
+                metadata=metadatas[i] if i < len(metadatas) else None,
+                distance=None,
+            )
+            for i in range(len(ids))
+        ]
+        context.sort(
+            key=lambda c: (c.metadata or {}).get(self.time_field)
+            or (c.metadata or {}).get("created_at", 0)
+        )
+        # Copies from different days are kept, so summaries cover every day
+        context = self._collapse_duplicates(context, self.time_field)
         logging.getLogger(__name__).debug(
-            f"Found {len(similar_context)} similar context chunks"
+            f"Found {len(context)} chunks between {start_time} and {end_time}"
         )
-        return similar_context
+        return context
+
+    @staticmethod
+    def _collapse_duplicates(
+        context: list[ContextChunk], per_day_of: str | None = None
+    ) -> list[ContextChunk]:
+        """
+        Keep only the first of each group of (near) duplicate chunks, or of
+        each group dated the same day by the per_day_of time field.
+        """
+        seen, collapsed = set(), []
+        for chunk in context:
+            key = chunk.metadata.get("dedup_key") if chunk.metadata else None
+            if key and per_day_of:
+                timestamp = chunk.metadata.get(per_day_of)
+                day = datetime.fromtimestamp(timestamp).date() if timestamp else None
+                key = (key, day)
+            if key:
+                if key in seen:
+                    continue
+                seen.add(key)
+            collapsed.append(chunk)
+        return collapsed
+
+    def _chunk_texts(self, context: list[ContextChunk]) -> list[str]:
+        return [self.ensure_str(chunk.text) for chunk in context if chunk.text]
+
+    @staticmethod
+    def _summary_chunks(summaries: list[str]) -> list[ContextChunk]:
+        return [
+            ContextChunk(id=f"summary::{i}", text=summary, metadata=None, distance=None)
+            for i, summary in enumerate(summaries)
+        ]
 
     @staticmethod
     def _current_date_context():
@@ -152,6 +699,20 @@ class QueryEngine:
             "..." if len(single_line) > max_length else ""
         )
 
+    CHAT_SYSTEM_TEMPLATE = (
+        "You answer the user's questions about their own notes in a conversation.\n"
+        "\n"
+        "Instructions:\n"
+        "- Only include work that the user personally completed, led, or contributed to.\n"
+        "- Ignore notes that are procedural, instructional, or reference material.\n"
+        "- Answer with a single sentence stating the time period, followed by a concise, high-level bulleted list.\n"
+        "- Follow-up questions refer to the earlier conversation; answer them from the same notes.\n"
+        "- Do not reference the context or say things like 'Based on the information provided...'.\n"
+        "- Today's date is {today}.\n"
+        "\n"
+        "Notes:\n{context}"
+    )
+
     PROMPT_TEMPLATE = (
         "Given the following context and question, generate a helpful response to the user's question.\n"
         "\n"
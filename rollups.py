@@ -0,0 +1,357 @@
+import hashlib
+import logging
+import sqlite3
+import threading
+from collections.abc import Iterable
+from dataclasses import dataclass
+from datetime import date, datetime, time, timedelta
+
+from chunker import note_text
+from lang_model import LangModel
+
+DAY = "day"
+WEEK = "week"
+
+
+@dataclass
+class Rollup:
+    """A precomputed summary of the notes for one day or one week."""
+
+    period: str  # DAY or WEEK
+    start: date  # The day, or the Monday of the week
+    summary: str
+    fingerprint: str = ""
+    stale: bool = False
+    generation: int = 0  # Bumped on every invalidation
+
+    @property
+    def end(self) -> date:
+        return self.start + timedelta(days=6 if self.period == WEEK else 0)
+
+    def label(self) -> str:
+        if self.period == WEEK:
+            return f"the week of {self.start.strftime('%A, %B %d, %Y')}"
+        return self.start.strftime("%A, %B %d, %Y")
+
+
+def week_start(day: date) -> date:
+    """The Monday of the week containing day."""
+    return day - timedelta(days=day.weekday())
+
+
+class RollupStore:
+    """
+    SQLite-backed store of daily and weekly rollups.
+    A row exists for every day that has (or had) notes; rows are marked stale
+    when a contributing chunk changes and are rebuilt by a RollupBuilder.
+    """
+
+    def __init__(self, path: str = ":memory:"):
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS rollups ("
+                " period TEXT NOT NULL,"
+                " start TEXT NOT NULL,"
+                " summary TEXT NOT NULL DEFAULT '',"
+                " fingerprint TEXT NOT NULL DEFAULT '',"
+                " stale INTEGER NOT NULL DEFAULT 1,"
+                " generation INTEGER NOT NULL DEFAULT 0,"
+                " PRIMARY KEY (period, start))"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS rollup_state ("
+                " key TEXT PRIMARY KEY, value TEXT NOT NULL)"
+            )
+
+    def get(self, period: str, start: date) -> Rollup | None:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT period, start, summary, fingerprint, stale, generation"
+                " FROM rollups WHERE period = ? AND start = ?",
+                (period, start.isoformat()),
+            ).fetchone()
+        return self._to_rollup(row) if row else None
+
+    def get_range(self, period: str, start: date, end: date) -> list[Rollup]:
+        """All rollups of the given period starting within [start, end]."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT period, start, summary, fingerprint, stale, generation"
+                " FROM rollups WHERE period = ? AND start >= ? AND start <= ?"
+                " ORDER BY start",
+                (period, start.isoformat(), end.isoformat()),
+            ).fetchall()
+        return [self._to_rollup(row) for row in rows]
+
+    def put(self, rollup: Rollup):
+        """
+        Store a rebuilt rollup. It stays stale if it was invalidated again
+        since rollup.generation was read.
+        """
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO rollups"
+                " (period, start, summary, fingerprint, stale, generation)"
+                " VALUES (?, ?, ?, ?, 0, ?)"
+                " ON CONFLICT (period, start) DO UPDATE SET"
+                " summary = excluded.summary,"
+                " fingerprint = excluded.fingerprint,"
+                " stale = (rollups.generation != excluded.generation)",
+                (
+                    rollup.period,
+                    rollup.start.isoformat(),
+                    rollup.summary,
+                    rollup.fingerprint,
+                    rollup.generation,
+                ),
+            )
+
+    def invalidate(self, days: Iterable[date]) -> int:
+        """
+        Mark the rollups of the given days, and of the weeks containing them,
+        as stale. Creates stale rows for days not seen before.
+        Returns the number of rollups marked.
+        """
+        keys = set()
+        for day in days:
+            keys.add((DAY, day.isoformat()))
+            keys.add((WEEK, week_start(day).isoformat()))
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT INTO rollups (period, start) VALUES (?, ?)"
+                " ON CONFLICT (period, start) DO UPDATE"
+                " SET stale = 1, generation = generation + 1",
+                sorted(keys),
+            )
+        return len(keys)
+
+    def stale(self) -> list[tuple[str, date]]:
+        """The (period, start) of every stale rollup, days before weeks."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT period, start FROM rollups WHERE stale = 1"
+                " ORDER BY period = 'week', start"
+            ).fetchall()
+        return [(period, date.fromisoformat(start)) for period, start in rows]
+
+    def is_backfilled(self) -> bool:
+        """True once every day already in the index has been registered."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM rollup_state WHERE key = 'backfilled'"
+            ).fetchone()
+        return row is not None
+
+    def mark_backfilled(self):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO rollup_state (key, value) VALUES ('backfilled', ?)",
+                (datetime.now().isoformat(),),
+            )
+
+    def close(self):
+        self._conn.close()
+
+    @staticmethod
+    def _to_rollup(row) -> Rollup:
+        period, start, summary, fingerprint, stale, generation = row
+        return Rollup(
+            period=period,
+            start=date.fromisoformat(start),
+            summary=summary,
+            fingerprint=fingerprint,
+            stale=bool(stale),
+            generation=generation,
+        )
+
+
+class RollupBuilder:
+    """
+    Generates daily and weekly rollups from the indexed chunks using a LangModel.
+    Rebuilds can run on demand (build_stale) or on a background thread that
+    wakes up shortly after the Indexer invalidates some days.
+    """
+
+    DAY_PROMPT = (
+        "Summarize the following notes from {day} as a concise bulleted list of the work "
+        "the user completed, led or contributed to. Omit procedural or reference material. "
+        "Output only the bullets.\n\nNotes:\n{notes}\n\nSummary:"
+    )
+    WEEK_PROMPT = (
+        "Combine the following daily summaries from {week} into a concise bulleted list "
+        "of the user's work that week, merging duplicates. Output only the bullets.\n\n"
+        "Daily summaries:\n{summaries}\n\nSummary:"
+    )
+
+    def __init__(
+        self,
+        vector_store,
+        lang_model: LangModel,
+        store: RollupStore | None = None,
+        time_field: str = "event_date",
+    ):
+        self.vector_store = vector_store
+        self.lang_model = lang_model
+        self.store = store or RollupStore(vector_store.sidecar_path("rollups.sqlite"))
+        self.time_field = time_field
+        self._pending = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def invalidate(self, days: Iterable[date]):
+        """Mark the rollups covering these days stale and wake the background job."""
+        days = set(days)
+        if days and self.store.invalidate(days):
+            self._pending.set()
+
+    def backfill(self):
+        """
+        Register every day that already has chunks in the index, as found
+        in the collection's catalog rather than by reading every chunk.
+        """
+        self.invalidate(self.vector_store.catalog.days(self.time_field))
+        self.store.mark_backfilled()
+
+    def build_stale(self) -> int:
+        """Rebuild every stale rollup. Returns the number rebuilt."""
+        stale = self.store.stale()
+        for period, start in stale:
+            self.build(period, start)
+        return len(stale)
+
+    def build(self, period: str, start: date) -> Rollup:
+        if period == WEEK:
+            return self.build_week(start)
+        return self.build_day(start)
+
+    def build_day(self, day: date) -> Rollup:
+        # Read the generation before the chunks so a concurrent invalidation
+        # leaves the rebuilt rollup stale.
+        existing = self.store.get(DAY, day)
+        generation = existing.generation if existing else 0
+        results = self.vector_store.get_by_time_range(
+            datetime.combine(day, time.min).timestamp(),
+            datetime.combine(day, time.max).timestamp(),
+            time_field=self.time_field,
+        )
+        ids = results.get("ids") or []
+        documents = results.get("documents") or []
+        metadatas = results.get("metadatas") or [None] * len(documents)
+        fingerprint = _fingerprint(sorted(ids))
+        if existing and existing.fingerprint == fingerprint and existing.summary:
+            summary = existing.summary
+        elif documents:
+            logging.getLogger(__name__).debug(
+                f"Building rollup for {day} from {len(documents)} chunk(s)"
+            )
+            prompt = self.DAY_PROMPT.format(
+                day=day.strftime("%A, %B %d, %Y"),
+                notes="\n\n".join(map(note_text, documents, metadatas)),
+            )
+            summary = self.lang_model.generate(prompt).strip()
+        else:
+            summary = ""
+        rollup = Rollup(DAY, day, summary, fingerprint, generation=generation)
+        self.store.put(rollup)
+        return rollup
+
+    def build_week(self, start: date) -> Rollup:
+        start = week_start(start)
+        existing = self.store.get(WEEK, start)
+        generation = existing.generation if existing else 0
+        days = []
+        for i in range(7):
+            day = self.store.get(DAY, start + timedelta(days=i))
+            if day is None:
+                continue  # No notes that day
+            days.append(self.build_day(day.start) if day.stale else day)
+        fingerprint = _fingerprint(d.fingerprint for d in days)
+        summaries = [f"{d.label()}:\n{d.summary}" for d in days if d.summary]
+        if existing and existing.fingerprint == fingerprint and existing.summary:
+            summary = existing.summary
+        elif summaries:
+            prompt = self.WEEK_PROMPT.format(
+                week=Rollup(WEEK, start, "").label(), summaries="\n\n".join(summaries)
+            )
+            summary = self.lang_model.generate(prompt).strip()
+        else:
+            summary = ""
+        rollup = Rollup(WEEK, start, summary, fingerprint, generation=generation)
+        self.store.put(rollup)
+        return rollup
+
+    def start_background(self, debounce: float = 5.0):
+        """
+        Start a daemon thread that rebuilds stale rollups. It waits for
+        `debounce` seconds after being woken so a burst of indexing results in
+        a single rebuild.
+        """
+        if self._thread is not None:
+            return
+        self._stopped.clear()
+        self._pending.set()  # Pick up anything left stale by a previous run
+        self._thread = threading.Thread(
+            target=self._run, args=(debounce,), name="rollups", daemon=True
+        )
+        self._thread.start()
+
+    def stop_background(self):
+        self._stopped.set()
+        self._pending.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self, debounce: float):
+        while not self._stopped.is_set():
+            self._pending.wait()
+            if self._stopped.wait(debounce):
+                return
+            self._pending.clear()
+            try:
+                if not self.store.is_backfilled():
+                    self.backfill()
+                    self._pending.clear()
+                rebuilt = self.build_stale()
+                logging.getLogger(__name__).debug(f"Rebuilt {rebuilt} rollup(s)")
+            except Exception:
+                # Logged and retried on the next wake-up rather than ending
+                # the thread, whatever the lang model or store raised
+                logging.getLogger(__name__).exception("Failed to build rollups")
+
+
+def rollup_context(store: RollupStore, start: date, end: date) -> list[Rollup] | None:
+    """
+    Cover [start, end] with rollups, using weekly rollups for whole weeks and
+    daily rollups for the remaining days. Returns None if the store cannot
+    answer for the range: it has not been backfilled yet, or a rollup in the
+    range is still waiting to be rebuilt.
+    """
+    if not store.is_backfilled():
+        return None
+    covering = []
+    day = start
+    while day <= end:
+        if day.weekday() == 0 and day + timedelta(days=6) <= end:
+            rollup = store.get(WEEK, day)
+            step = 7
+        else:
+            rollup = store.get(DAY, day)
+            step = 1
+        if rollup is not None:
+            if rollup.stale:
+                return None
+            if rollup.summary:
+                covering.append(rollup)
+        day += timedelta(days=step)
+    return covering
+
+
+def _fingerprint(parts: Iterable[str]) -> str:
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
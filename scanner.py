@@ -0,0 +1,225 @@
+import logging
+import os
+import re
+from collections.abc import Iterable, Iterator
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+
+# Files larger than this many bytes are not indexed; 0 for no limit
+MAX_FILE_SIZE_ENV = "WHISPER_NOTE_MAX_FILE_SIZE"
+DEFAULT_MAX_FILE_SIZE = 16 << 20
+# Directories that are never scanned, wherever they are
+IGNORED_DIRS = frozenset({".git", ".obsidian", ".trash", "node_modules"})
+# Files of .gitignore-style patterns, applying to their directory's subtree
+IGNORE_FILES = (".gitignore", ".whisperignore")
+# Threads listing directories in parallel
+SCAN_THREADS = 8
+
+
+@dataclass
+class ScanEntry:
+    path: str
+    stat: os.stat_result
+
+
+class IgnoreRule:
+    """One line of a .gitignore-style file."""
+
+    def __init__(self, base: str, pattern: str):
+        self.base = base  # Directory of the ignore file, relative to the scan root
+        self.negated = pattern.startswith("!")
+        if self.negated:
+            pattern = pattern[1:]
+        self.dir_only = pattern.endswith("/")
+        pattern = pattern.rstrip("/")
+        # A pattern containing a slash is relative to the ignore file's
+        # directory; otherwise it matches a name at any depth
+        self.anchored = "/" in pattern
+        self.regex = re.compile(_translate(pattern.lstrip("/")))
+
+    def matches(self, rel_path: str, name: str, is_dir: bool) -> bool:
+        if self.dir_only and not is_dir:
+            return False
+        if not self.anchored:
+            return self.regex.fullmatch(name) is not None
+        if self.base:
+            if not rel_path.startswith(self.base + "/"):
+                return False
+            rel_path = rel_path[len(self.base) + 1 :]
+        return self.regex.fullmatch(rel_path) is not None
+
+
+def parse_ignore_file(path: str, base: str = "") -> list[IgnoreRule]:
+    """The rules of an ignore file; base is its directory relative to the scan root."""
+    rules = []
+    with open(path, encoding="utf-8", errors="replace") as f:
+        for line in f:
+            line = line.rstrip("\n")
+            if line.endswith("\\ "):
+                line = line[:-2] + " "  # Escaped trailing space
+            else:
+                line = line.rstrip()
+            if not line or line.startswith("#"):
+                continue
+            rules.append(IgnoreRule(base, line))
+    return rules
+
+
+def is_ignored(
+    rules: Iterable[IgnoreRule], rel_path: str, name: str, is_dir: bool
+) -> bool:
+    """The last matching rule decides, as in git."""
+    ignored = False
+    for rule in rules:
+        if rule.matches(rel_path, name, is_dir):
+            ignored = not rule.negated
+    return ignored
+
+
+class Scanner:
+    """
+    Finds the files to index under a directory. Subdirectories are listed
+    in parallel with os.scandir and files are yielded, with their stat
+    results, as soon as their directory has been listed. Directories in
+    IGNORED_DIRS and paths matched by ignore files are skipped, as are
+    files larger than max_file_size.
+    """
+
+    def __init__(
+        self,
+        file_exts: Iterable[str] | None = None,
+        max_file_size: int | None = None,
+        threads: int = SCAN_THREADS,
+    ):
+        self.file_exts = (
+            {(ext if ext.startswith(".") else "." + ext).lower() for ext in file_exts}
+            if file_exts
+            else None
+        )
+        if max_file_size is None:
+            max_file_size = int(
+                os.environ.get(MAX_FILE_SIZE_ENV, str(DEFAULT_MAX_FILE_SIZE))
+            )
+        self.max_file_size = max_file_size
+        self.threads = max(1, threads)
+        # Directories the last scan could not list, so may have missed files in
+        self.unreadable: list[str] = []
+
+    def scan(self, directory: str) -> Iterator[ScanEntry]:
+        self.unreadable = []
+        with ThreadPoolExecutor(self.threads, thread_name_prefix="scan") as executor:
+            pending = {executor.submit(self._scan_dir, directory, "", [])}
+            try:
+                while pending:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        files, subdirs = future.result()
+                        for path, rel_path, rules in subdirs:
+                            pending.add(
+                                executor.submit(self._scan_dir, path, rel_path, rules)
+                            )
+                        yield from files
+            finally:
+                for future in pending:
+                    future.cancel()
+
+    def _scan_dir(
+        self, path: str, rel_path: str, rules: list[IgnoreRule]
+    ) -> tuple[list[ScanEntry], list[tuple[str, str, list[IgnoreRule]]]]:
+        """List one directory. Returns its files and the subdirectories to scan."""
+        try:
+            with os.scandir(path) as it:
+                entries = sorted(it, key=lambda entry: entry.name)
+        except OSError as e:
+            logging.getLogger(__name__).warning(f"Cannot scan {path}: {e}")
+            self.unreadable.append(path)
+            return [], []
+        names = {entry.name for entry in entries}
+        for ignore_file in IGNORE_FILES:
+            if ignore_file in names:
+                try:
+                    rules = rules + parse_ignore_file(
+                        os.path.join(path, ignore_file), rel_path
+                    )
+                except OSError as e:
+                    logging.getLogger(__name__).warning(
+                        f"Cannot read {os.path.join(path, ignore_file)}: {e}"
+                    )
+
+        files, subdirs = [], []
+        for entry in entries:
+            entry_rel_path = f"{rel_path}/{entry.name}" if rel_path else entry.name
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    if entry.name in IGNORED_DIRS or is_ignored(
+                        rules, entry_rel_path, entry.name, True
+                    ):
+                        continue
+                    subdirs.append((entry.path, entry_rel_path, rules))
+                elif entry.is_file():
+                    if not self.matches_ext(entry.name) or is_ignored(
+                        rules, entry_rel_path, entry.name, False
+                    ):
+                        continue
+                    stat = entry.stat()
+                    if self.max_file_size and stat.st_size > self.max_file_size:
+                        logging.getLogger(__name__).info(
+                            f"Skipping {entry.path}: {stat.st_size} bytes is over"
+                            f" the {self.max_file_size} byte limit"
+                        )
+                        continue
+                    files.append(ScanEntry(entry.path, stat))
+            except OSError as e:
+                logging.getLogger(__name__).warning(f"Cannot stat {entry.path}: {e}")
+        return files, subdirs
+
+    def matches_ext(self, name: str) -> bool:
+        if self.file_exts is None:
+            return True
+        lowered = name.lower()
+        dot = lowered.find(".")
+        # Every suffix starting at a dot, so ".tar.gz"-style extensions match too
+        while dot != -1:
+            if lowered[dot:] in self.file_exts:
+                return True
+            dot = lowered.find(".", dot + 1)
+        return False
+
+
+def _translate(pattern: str) -> str:
+    """Regex for a gitignore glob, matched against a slash-separated path."""
+    out = []
+    i, n = 0, len(pattern)
+    while i < n:
+        c = pattern[i]
+        if c == "*":
+            if pattern.startswith("**/", i):
+                out.append("(?:.*/)?")
+                i += 3
+                continue
+            if pattern.startswith("**", i):
+                out.append(".*")
+                i += 2
+                continue
+            out.append("[^/]*")
+        elif c == "?":
+            out.append("[^/]")
+        elif c == "[":
+            end = pattern.find("]", i + 2)
+            if end == -1:
+                out.append(re.escape(c))
+            else:
+                body = pattern[i + 1 : end]
+                if body.startswith("!"):
+                    body = "^" + body[1:]
+                out.append(f"[{body}]")
+                i = end + 1
+                continue
+        elif c == "\\" and i + 1 < n:
+            out.append(re.escape(pattern[i + 1]))
+            i += 2
+            continue
+        else:
+            out.append(re.escape(c))
+        i += 1
+    return "".join(out)
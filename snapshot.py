@@ -0,0 +1,348 @@
+import json
+import logging
+import mmap
+import os
+import struct
+import tempfile
+import zlib
+from collections.abc import Iterable, Iterator
+from contextlib import closing, contextmanager
+from dataclasses import dataclass
+from datetime import datetime
+from typing import IO
+
+import chromadb
+import numpy as np
+
+from dedup import FingerprintIndex
+from embeddings import DEFAULT_MODEL_NAME
+from lexical import LexicalIndex
+from membership import FileRecord, MembershipStore
+from vector_store import VectorStore
+
+MAGIC = b"WNSNAP\x00\x01"
+FORMAT_VERSION = 1
+# Sections start at multiples of this, so the embedding matrix can be
+# memory-mapped and read as aligned float32
+ALIGNMENT = 64
+# Rows read from, or written to, the vector store at a time
+SNAPSHOT_BATCH_SIZE = 1024
+_TRAILER = struct.Struct("<QQ8s")  # manifest offset, manifest length, MAGIC
+
+
+@dataclass
+class SnapshotInfo:
+    path: str
+    count: int  # Chunks
+    dimension: int
+    embedding_model: str
+    file_count: int
+
+
+class SnapshotError(ValueError):
+    pass
+
+
+def export_snapshot(
+    vector_store: VectorStore,
+    path: str,
+    membership: MembershipStore | None = None,
+    fingerprints: FingerprintIndex | None = None,
+    embedding_model: str = DEFAULT_MODEL_NAME,
+) -> SnapshotInfo:
+    """
+    Write a collection, with the file membership and fingerprints the
+    Indexer keeps next to it, to a single snapshot file:
+
+        MAGIC
+        embeddings    count x dimension little-endian float32, row-major
+        records       zlib-compressed JSON lines: id, document, metadata
+        membership    zlib-compressed JSON lines: file record and chunk ids
+        fingerprints  zlib-compressed JSON lines: chunk id, file, signature,
+                      body hash
+        manifest      JSON: format, model, counts and section offsets
+        trailer       manifest offset and length, MAGIC
+
+    The file is written next to path and moved into place when complete.
+    """
+    with _sidecars(vector_store, membership, fingerprints) as stores:
+        return _export(vector_store, path, *stores, embedding_model)
+
+
+def _export(
+    vector_store: VectorStore,
+    path: str,
+    membership: MembershipStore,
+    fingerprints: FingerprintIndex,
+    embedding_model: str,
+) -> SnapshotInfo:
+    tmp_path = f"{path}.tmp"
+    count, dimension = 0, 0
+    sections = {}
+    with open(tmp_path, "wb") as out, tempfile.TemporaryFile() as records:
+        out.write(MAGIC)
+        _align(out)
+        start = out.tell()
+        compressor = zlib.compressobj()
+        # One pass over the collection: embeddings go straight to the file,
+        # the rest is compressed aside and appended after them
+        for page in vector_store.iter_rows(
+            SNAPSHOT_BATCH_SIZE, include=["embeddings", "documents", "metadatas"]
+        ):
+            embeddings = np.asarray(page["embeddings"], dtype="<f4")
+            if embeddings.size:
+                if dimension and embeddings.shape[1] != dimension:
+                    raise SnapshotError("Embeddings of different dimensions")
+                dimension = embeddings.shape[1]
+            out.write(embeddings.tobytes())
+            count += len(page["ids"])
+            records.write(
+                compressor.compress(
+                    _json_lines(
+                        {"id": i, "document": d, "metadata": m}
+                        for i, d, m in zip(
+                            page["ids"], page["documents"], page["metadatas"]
+                        )
+                    )
+                )
+            )
+        records.write(compressor.flush())
+        sections["embeddings"] = _section(start, out.tell() - start, dtype="<f4")
+
+        records.seek(0)
+        sections["records"] = _write_section(out, records)
+        file_records = membership.files()
+        sections["membership"] = _write_compressed(
+            out,
+            (
+                {**record.__dict__, "chunk_ids": membership.chunk_ids(record.file)}
+                for record in file_records
+            ),
+        )
+        sections["fingerprints"] = _write_compressed(
+            out,
+            (
+                {
+                    "chunk_id": chunk_id,
+                    "file": file,
+                    "signature": list(signature),
+                    "body_hash": body_hash,
+                }
+                for chunk_id, file, signature, body_hash in fingerprints.items()
+            ),
+        )
+
+        manifest = {
+            "format": FORMAT_VERSION,
+            "collection": vector_store.collection.name,
+            "created_at": datetime.now().isoformat(),
+            "chroma_version": chromadb.__version__,
+            "embedding_model": embedding_model,
+            "count": count,
+            "dimension": dimension,
+            "file_count": len(file_records),
+            "sections": sections,
+        }
+        manifest_offset = out.tell()
+        encoded = json.dumps(manifest, indent=1).encode("utf-8")
+        out.write(encoded)
+        out.write(_TRAILER.pack(manifest_offset, len(encoded), MAGIC))
+        out.flush()
+        os.fsync(out.fileno())
+    os.replace(tmp_path, path)
+    logging.getLogger(__name__).info(f"Exported {count} chunk(s) to {path}")
+    return SnapshotInfo(path, count, dimension, embedding_model, len(file_records))
+
+
+def read_manifest(path: str) -> dict:
+    with open(path, "rb") as f:
+        return _read_manifest(f)
+
+
+def import_snapshot(
+    vector_store: VectorStore,
+    path: str,
+    membership: MembershipStore | None = None,
+    fingerprints: FingerprintIndex | None = None,
+    embedding_model: str = DEFAULT_MODEL_NAME,
+    force: bool = False,
+    lexical: LexicalIndex | None = None,
+) -> SnapshotInfo:
+    """
+    Bulk-load a snapshot into vector_store and its sidecars, without
+    embedding anything. Chunks already in the collection are kept. Refuses
+    a snapshot made with another embedding model unless force is set, as
+    its vectors would not be comparable with query embeddings. The lexical
+    index is rebuilt from the chunks' text rather than stored.
+    """
+    with _sidecars(vector_store, membership, fingerprints) as stores:
+        args = (vector_store, path, *stores, embedding_model, force)
+        if lexical is not None:
+            return _import(*args, lexical)
+        with closing(LexicalIndex(vector_store.sidecar_path("lexical.sqlite"))) as lex:
+            return _import(*args, lex)
+
+
+def _import(
+    vector_store: VectorStore,
+    path: str,
+    membership: MembershipStore,
+    fingerprints: FingerprintIndex,
+    embedding_model: str,
+    force: bool,
+    lexical: LexicalIndex,
+) -> SnapshotInfo:
+    with open(path, "rb") as f:
+        manifest = _read_manifest(f)
+        if manifest["format"] != FORMAT_VERSION:
+            raise SnapshotError(f"Unsupported snapshot format {manifest['format']}")
+        if manifest["embedding_model"] != embedding_model and not force:
+            raise SnapshotError(
+                f"Snapshot was embedded with {manifest['embedding_model']},"
+                f" not {embedding_model}"
+            )
+        count, dimension = manifest["count"], manifest["dimension"]
+        sections = manifest["sections"]
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            embeddings = np.frombuffer(
+                mm,
+                dtype=sections["embeddings"]["dtype"],
+                count=count * dimension,
+                offset=sections["embeddings"]["offset"],
+            ).reshape(count, dimension)
+            try:
+                writer = vector_store.writer(max_count=SNAPSHOT_BATCH_SIZE)
+                batch = []
+                for i, record in enumerate(_read_compressed(mm, sections["records"])):
+                    batch.append((i, record))
+                    if len(batch) == SNAPSHOT_BATCH_SIZE:
+                        _add_batch(writer, lexical, embeddings, batch)
+                        batch = []
+                _add_batch(writer, lexical, embeddings, batch)
+                writer.close()
+            finally:
+                del embeddings  # The map cannot be closed while viewed
+
+            # The membership last, so the Indexer never refers to chunks
+            # that are not loaded yet
+            for line in _read_compressed(mm, sections["fingerprints"]):
+                fingerprints.add(
+                    line["chunk_id"],
+                    line["file"],
+                    tuple(line["signature"]),
+                    line.get("body_hash", ""),
+                )
+            for line in _read_compressed(mm, sections["membership"]):
+                chunk_ids = line.pop("chunk_ids")
+                membership.replace_file(FileRecord(**line), chunk_ids)
+    logging.getLogger(__name__).info(f"Imported {count} chunk(s) from {path}")
+    return SnapshotInfo(
+        path, count, dimension, manifest["embedding_model"], manifest["file_count"]
+    )
+
+
+@contextmanager
+def _sidecars(
+    vector_store: VectorStore,
+    membership: MembershipStore | None,
+    fingerprints: FingerprintIndex | None,
+) -> Iterator[tuple[MembershipStore, FingerprintIndex]]:
+    """
+    The given stores, or the Indexer's default ones for vector_store: its
+    shared membership, and a fingerprint index that is closed on exit.
+    """
+    if membership is None:
+        membership = vector_store.membership
+    if fingerprints is not None:
+        yield membership, fingerprints
+        return
+    with closing(
+        FingerprintIndex(vector_store.sidecar_path("fingerprints.sqlite"))
+    ) as opened:
+        yield membership, opened
+
+
+def _add_batch(writer, lexical: LexicalIndex, embeddings: np.ndarray, batch: list):
+    """Add the rows of a batch that the store does not have yet."""
+    if not batch:
+        return
+    existing = writer.existing_ids([record["id"] for _, record in batch])
+    batch = [(i, record) for i, record in batch if record["id"] not in existing]
+    if batch:
+        lexical.add(
+            [record["id"] for _, record in batch],
+            [record["document"] for _, record in batch],
+            [record["metadata"] for _, record in batch],
+        )
+        writer.add(
+            [record["id"] for _, record in batch],
+            [embeddings[i].tolist() for i, _ in batch],
+            [record["document"] for _, record in batch],
+            [record["metadata"] for _, record in batch],
+        )
+
+
+def _read_manifest(f: IO[bytes]) -> dict:
+    if f.read(len(MAGIC)) != MAGIC:
+        raise SnapshotError("Not a snapshot file")
+    f.seek(-_TRAILER.size, os.SEEK_END)
+    offset, length, magic = _TRAILER.unpack(f.read(_TRAILER.size))
+    if magic != MAGIC:
+        raise SnapshotError("Truncated snapshot file")
+    f.seek(offset)
+    return json.loads(f.read(length))
+
+
+def _json_lines(items: Iterable[dict]) -> bytes:
+    return b"".join(
+        json.dumps(item, separators=(",", ":")).encode("utf-8") + b"\n"
+        for item in items
+    )
+
+
+def _align(out: IO[bytes]):
+    out.write(b"\0" * (-out.tell() % ALIGNMENT))
+
+
+def _section(offset: int, length: int, **extra) -> dict:
+    return {"offset": offset, "length": length, **extra}
+
+
+def _write_section(out: IO[bytes], source: IO[bytes]) -> dict:
+    """Copy an already compressed section into the snapshot."""
+    _align(out)
+    start = out.tell()
+    while block := source.read(1 << 20):
+        out.write(block)
+    return _section(start, out.tell() - start, encoding="zlib+jsonl")
+
+
+def _write_compressed(out: IO[bytes], items: Iterable[dict]) -> dict:
+    _align(out)
+    start = out.tell()
+    compressor = zlib.compressobj()
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == SNAPSHOT_BATCH_SIZE:
+            out.write(compressor.compress(_json_lines(batch)))
+            batch = []
+    out.write(compressor.compress(_json_lines(batch)))
+    out.write(compressor.flush())
+    return _section(start, out.tell() - start, encoding="zlib+jsonl")
+
+
+def _read_compressed(mm: mmap.mmap, section: dict) -> Iterator[dict]:
+    """Stream the JSON lines of a compressed section."""
+    decompressor = zlib.decompressobj()
+    start, end = section["offset"], section["offset"] + section["length"]
+    pending = b""
+    for offset in range(start, end, 1 << 20):
+        pending += decompressor.decompress(mm[offset : min(offset + (1 << 20), end)])
+        *lines, pending = pending.split(b"\n")
+        for line in lines:
+            yield json.loads(line)
+    pending += decompressor.flush()
+    for line in pending.split(b"\n"):
+        if line:
+            yield json.loads(line)
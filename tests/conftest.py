@@ -1,9 +1,11 @@
-import pytest
-from testcontainers.ollama import OllamaContainer
-from ollama import OLLAMA_URL_ENV, OLLAMA_MODEL_ENV
 import os
 import tempfile
+
+import pytest
 from dotenv import load_dotenv
+from testcontainers.ollama import OllamaContainer
+
+from ollama import OLLAMA_MODEL_ENV, OLLAMA_URL_ENV
 
 load_dotenv()
 
@@ -22,3 +24,13 @@ def ollama_container(model="llama2:7b"):
         os.environ[OLLAMA_URL_ENV] = endpoint
         os.environ[OLLAMA_MODEL_ENV] = model
         yield endpoint
+
+
+@pytest.fixture(scope="session", autouse=True)
+def chroma_dir(tmp_path_factory):
+    # The default Chroma client persists under ./chroma and caches itself by
+    # that relative path, so move the whole session out of the tree once
+    workdir = tmp_path_factory.mktemp("workdir")
+    with pytest.MonkeyPatch.context() as mp:
+        mp.chdir(workdir)
+        yield workdir / "chroma"
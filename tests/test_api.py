@@ -1,9 +1,13 @@
 import os
 import tempfile
 import uuid
-from fastapi.testclient import TestClient
-from api import app, get_collection_name
+
 import pytest
+from fastapi.testclient import TestClient
+
+from api import app, get_collection_name, get_query_engine
+from deadline import DeadlineExceeded
+from query import QueryResult
 
 
 @pytest.fixture
@@ -83,3 +87,73 @@ def test_query(temp_dir_with_files):
     answer = data["answer"]
     assert "login bug" in answer.lower() or "fixed" in answer.lower()
     clear_override()
+
+
+def test_query_route_is_async():
+    class AsyncEngine:
+        async def aquery(self, query_string, deadline=None):
+            return QueryResult(answer=f"answer to {query_string}", context=[])
+
+    app.dependency_overrides[get_query_engine] = lambda: AsyncEngine()
+    client = TestClient(app)
+    resp = client.post("/api/v1/query", json={"query": "hello"})
+    assert resp.status_code == 200
+    assert resp.json()["answer"] == "answer to hello"
+    clear_override()
+
+
+def test_query_route_passes_deadline_and_reports_degradations():
+    class DegradingEngine:
+        async def aquery(self, query_string, deadline=None):
+            assert 0 < deadline.remaining() <= 5
+            return QueryResult(
+                answer="short answer",
+                context=[],
+                degradations=["skipped_time_extraction"],
+            )
+
+    app.dependency_overrides[get_query_engine] = lambda: DegradingEngine()
+    client = TestClient(app)
+    resp = client.post("/api/v1/query", json={"query": "hello", "timeout": 5})
+    assert resp.status_code == 200
+    assert resp.json()["degradations"] == ["skipped_time_extraction"]
+    clear_override()
+
+
+def test_query_route_deadline_exceeded():
+    class SlowEngine:
+        async def aquery(self, query_string, deadline=None):
+            raise DeadlineExceeded("too slow")
+
+    app.dependency_overrides[get_query_engine] = lambda: SlowEngine()
+    client = TestClient(app)
+    resp = client.post("/api/v1/query", json={"query": "hello", "timeout": 1})
+    assert resp.status_code == 504
+    clear_override()
+
+
+def test_chat_session_routes():
+    class ChatEngine:
+        async def achat(self, session, message, deadline=None):
+            reused = bool(session.messages)
+            session.add_turn(message, f"answer to {message}", 20)
+            return QueryResult(
+                answer=f"answer to {message}", context=[], reused_context=reused
+            )
+
+    app.dependency_overrides[get_query_engine] = lambda: ChatEngine()
+    client = TestClient(app)
+    session_id = client.post("/api/v1/sessions").json()["session_id"]
+    url = f"/api/v1/sessions/{session_id}/messages"
+
+    resp = client.post(url, json={"message": "hello"})
+    assert resp.status_code == 200
+    assert resp.json()["answer"] == "answer to hello"
+    assert not resp.json()["reused_context"]
+    resp = client.post(url, json={"message": "and then?"})
+    assert resp.json()["reused_context"]
+    assert resp.json()["session_id"] == session_id
+
+    assert client.delete(f"/api/v1/sessions/{session_id}").status_code == 200
+    assert client.post(url, json={"message": "hello"}).status_code == 404
+    clear_override()
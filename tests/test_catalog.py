@@ -0,0 +1,52 @@
+import pytest
+
+from catalog import CatalogCounts, ChunkCatalog
+
+
+def test_catalog_looks_up_files_and_folders():
+    catalog = ChunkCatalog()
+    catalog.add(
+        ["a0", "a1", "b0", "c0", "x"],
+        [
+            {"file": "/v/a.md", "file_hash": "h1", "event_date": 1.0},
+            {"file": "/v/a.md", "file_hash": "h1", "event_date": 2.0},
+            {"file": "/v/sub/b.md", "file_hash": "h2"},
+            {"file": "/v_2/c.md", "file_hash": "h3", "duplicate_of": "a0"},
+            None,
+        ],
+    )
+    assert len(catalog) == 5
+    assert sorted(catalog.ids_of_file("/v/a.md")) == ["a0", "a1"]
+    assert catalog.ids_of_file("/v/a.md", "h2") == []
+    assert sorted(catalog.ids_under("/v/")) == ["a0", "a1", "b0"]
+    assert sorted(catalog.files("/v/")) == ["/v/a.md", "/v/sub/b.md"]
+    assert catalog.has_file_hash("/v/a.md", "h1")
+    # Chunks without an event date do not count
+    assert not catalog.has_file_hash("/v/sub/b.md", "h2")
+    assert catalog.counts() == CatalogCounts(3, 4, 1)
+
+    catalog.update(["b0"], [{"file": "/w/b.md", "text": "ignored"}])
+    assert catalog.ids_under("/w/") == ["b0"]
+    catalog.delete(["a0", "a1", "missing"])
+    assert catalog.ids_of_file("/v/a.md") == []
+    assert catalog.counts() == CatalogCounts(2, 2, 1)
+
+
+def test_catalog_days():
+    from datetime import date, datetime
+
+    catalog = ChunkCatalog()
+    noon = datetime(2025, 5, 5, 12).timestamp()
+    catalog.add(
+        ["a", "b", "c", "d"],
+        [
+            {"event_date": noon, "created_at": noon},
+            {"event_date": noon + 3600, "created_at": noon},
+            {"event_date": noon - 7 * 86400, "created_at": noon},
+            {"event_date": 0.0},  # No date
+        ],
+    )
+    assert catalog.days() == [date(2025, 4, 28), date(2025, 5, 5)]
+    assert catalog.days("created_at") == [date(2025, 5, 5)]
+    with pytest.raises(ValueError):
+        catalog.days("file")
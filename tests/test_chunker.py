@@ -1,6 +1,8 @@
-from chunker import Chunker
+import os
 import re
 
+from chunker import Chunker, note_text
+
 
 def test_chunk_by_size_basic(tmp_path):
     chunker = Chunker(chunk_size=5)
@@ -16,6 +18,42 @@ def test_chunk_by_size_basic(tmp_path):
     assert any(date_pattern.search(chunk) for chunk in chunks)
 
 
+def test_header_is_not_part_of_the_content(tmp_path):
+    from chunker import MarkdownChunker
+
+    for name in ("a.md", "b.md"):
+        (tmp_path / name).write_text("# Plan\n\nShip it.", encoding="utf-8")
+    (a,) = MarkdownChunker().iter_chunks(str(tmp_path / "a.md"))
+    (b,) = MarkdownChunker().iter_chunks(str(tmp_path / "b.md"))
+    assert a.text.startswith("User note: title 'a.md', created at '")
+    assert a.content == b.content == "# Plan\nShip it."
+    assert a.id == b.id == a.content_hash
+
+    # note_text() puts the header back from the stored metadata
+    metadata = {
+        "file": str(tmp_path / "a.md"),
+        "created_at": os.path.getctime(tmp_path / "a.md"),
+        "modified_at": os.path.getmtime(tmp_path / "a.md"),
+    }
+    metadata["event_date"] = metadata["created_at"]
+    assert note_text(a.content, metadata) == a.text
+    # Texts stored with their header are kept as they are
+    assert note_text(a.text, metadata) == a.text
+
+
+def test_dated_chunks_are_stored_per_date(tmp_path):
+    from chunker import MarkdownChunker
+
+    (tmp_path / "2024-05-01.md").write_text("Standup.", encoding="utf-8")
+    (tmp_path / "2024-05-02.md").write_text("Standup.", encoding="utf-8")
+    (first,) = MarkdownChunker().iter_chunks(str(tmp_path / "2024-05-01.md"))
+    (second,) = MarkdownChunker().iter_chunks(str(tmp_path / "2024-05-02.md"))
+    # The same text is embedded once, but each date gets its own row
+    assert first.content_hash == second.content_hash
+    assert first.id != second.id
+    assert "dated 'Wednesday, May 01, 2024'" in first.text
+
+
 def test_chunk_by_size_overlap(tmp_path):
     chunker = Chunker(chunk_size=5, overlap=2)
     file_path = tmp_path / "testfile.txt"
@@ -73,3 +111,154 @@ def test_overlap_greater_than_chunk_size(tmp_path):
     chunks = chunker.chunk_file(str(file_path))
     assert any("abcde" in chunk for chunk in chunks)
     assert any("fghij" in chunk for chunk in chunks)
+
+
+def test_markdown_chunker_splits_on_headings_and_dates_sections(tmp_path):
+    from datetime import datetime
+
+    from chunker import MarkdownChunker
+
+    file_path = tmp_path / "Week 18.md"
+    file_path.write_text(
+        "---\ntitle: Week 18\ndate: 2024-04-29\n---\n"
+        "Planning for the week.\n\n"
+        "## Monday, April 29\n- Fixed the login bug\n- Reviewed PR\n\n"
+        "### Meetings\nSynced with design.\n\n"
+        "## May 1st, 2024\nShipped the button.\n",
+        encoding="utf-8",
+    )
+    chunks = MarkdownChunker().chunk_file_with_dates(str(file_path))
+    by_text = {c.text.split("': ", 1)[1]: c.event_date for c in chunks}
+
+    assert by_text["Planning for the week."] == datetime(2024, 4, 29)
+    monday = "## Monday, April 29\n- Fixed the login bug\n- Reviewed PR"
+    assert by_text[monday] == datetime(2024, 4, 29)
+    # Nested sections inherit the date and carry their headings
+    assert by_text[
+        "## Monday, April 29 > ### Meetings\nSynced with design."
+    ] == datetime(2024, 4, 29)
+    assert by_text["## May 1st, 2024\nShipped the button."] == datetime(2024, 5, 1)
+    assert "dated 'Wednesday, May 01, 2024'" in chunks[-1].text
+    assert not any("title: Week 18" in c.text for c in chunks)
+
+
+def test_markdown_chunker_dates_daily_notes_by_file_name(tmp_path):
+    from datetime import datetime
+
+    from chunker import MarkdownChunker
+
+    file_path = tmp_path / "2024-05-02.md"
+    file_path.write_text("Para one.\n\n" + "x" * 30 + "\n\n- a\n- b", encoding="utf-8")
+    chunks = MarkdownChunker(chunk_size=25).chunk_file_with_dates(str(file_path))
+    assert all(c.event_date == datetime(2024, 5, 2) for c in chunks)
+    assert any(c.text.endswith("- a\n- b") for c in chunks)  # List kept together
+    assert MarkdownChunker().chunk_file(str(file_path)) == [
+        c.text for c in MarkdownChunker().chunk_file_with_dates(str(file_path))
+    ]
+
+
+def test_markdown_chunker_undated_note(tmp_path):
+    from chunker import MarkdownChunker
+
+    file_path = tmp_path / "ideas.md"
+    file_path.write_text("# Ideas\nBuild a thing.", encoding="utf-8")
+    (chunk,) = MarkdownChunker().chunk_file_with_dates(str(file_path))
+    assert chunk.event_date is None
+    assert "# Ideas\nBuild a thing." in chunk.text
+
+
+class WhitespaceTokenizer:
+    """Stands in for a Hugging Face tokenizer: one token per word."""
+
+    def __call__(self, text, add_special_tokens=False, **kwargs):
+        offsets = [m.span() for m in re.finditer(r"\S+", text)]
+        return {"input_ids": list(range(len(offsets))), "offset_mapping": offsets}
+
+
+def test_chunk_by_tokens_with_overlap():
+    chunker = Chunker(
+        chunk_size=4, overlap=1, split_on=None, tokenizer=WhitespaceTokenizer()
+    )
+    chunks = chunker._chunk_text("one two three four five six seven")
+    assert chunks == ["one two three four", "four five six seven", "seven"]
+
+
+def test_token_chunks_include_headings_in_budget(tmp_path):
+    from chunker import MarkdownChunker
+
+    tokenizer = WhitespaceTokenizer()
+    file_path = tmp_path / "2024-05-02.md"
+    file_path.write_text(
+        "# Daily log\n\n" + " ".join(f"w{i}" for i in range(200)), encoding="utf-8"
+    )
+
+    class Embedder:
+        max_seq_length = 64 + Chunker.SPECIAL_TOKENS
+
+    Embedder.tokenizer = tokenizer
+    chunker = MarkdownChunker.for_embedder(Embedder(), overlap=8)
+    # What is embedded is the content: the header is not
+    chunks = [c.content for c in chunker.iter_chunks(str(file_path))]
+    assert all(c.startswith("# Daily log\n") for c in chunks)
+    assert all(len(tokenizer(c)["input_ids"]) <= 64 for c in chunks)
+    # Chunks are filled up to the budget
+    assert len(tokenizer(chunks[0])["input_ids"]) == 64
+    # and nothing is dropped
+    assert "w199" in chunks[-1]
+
+
+def test_streamed_chunks_match_whole_file(tmp_path, monkeypatch):
+    import hashlib
+
+    text = "\r\n\r\n".join(f"Paragraph {i} " + "word " * (i % 7) for i in range(200))
+    file_path = tmp_path / "notes.txt"
+    file_path.write_bytes(text.encode("utf-8"))
+    chunker = Chunker(chunk_size=40)
+    whole = chunker.chunk_file(str(file_path))
+
+    # Hold only a few paragraphs in memory at a time, read in tiny blocks
+    monkeypatch.setattr(Chunker, "STREAM_BUFFER", 100)
+    monkeypatch.setattr("chunker.READ_BLOCK_SIZE", 7)
+    hasher = hashlib.sha256()
+    streamed = list(chunker.iter_file(str(file_path), hasher))
+    assert streamed == whole
+    assert hasher.hexdigest() == hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def test_markdown_streaming_splits_long_sections(tmp_path, monkeypatch):
+    from chunker import MarkdownChunker
+
+    paragraphs = [f"Entry {i} with some text." for i in range(50)]
+    file_path = tmp_path / "log.md"
+    file_path.write_text(
+        "---\ndate: 2024-05-03\n---\n# Log\n\n" + "\n\n".join(paragraphs),
+        encoding="utf-8",
+    )
+    monkeypatch.setattr(MarkdownChunker, "STREAM_BUFFER", 64)
+    chunks = list(MarkdownChunker(chunk_size=80).iter_chunks(str(file_path)))
+    assert len(chunks) > 1
+    # Every part keeps its heading and date, and no paragraph is split
+    assert all("# Log\n" in c.text for c in chunks)
+    assert {c.event_date.day for c in chunks} == {3}
+    joined = "\n".join(c.text for c in chunks)
+    assert all(p in joined for p in paragraphs)
+
+
+def test_chunks_are_offsets_into_the_file(tmp_path):
+    from chunker import MarkdownChunker
+
+    text = (
+        "---\ndate: 2024-05-03\n---\nIntro.\n\n# Monday\n\nFirst entry.\n\n\n"
+        "Second entry.\n\n## Later\n\n" + "long " * 30
+    )
+    file_path = tmp_path / "week.md"
+    file_path.write_text(text, encoding="utf-8")
+    chunks = list(MarkdownChunker(chunk_size=40).iter_chunks(str(file_path)))
+    assert len(chunks) > 3
+    for chunk in chunks:
+        body = text[chunk.file_start : chunk.file_end]
+        assert body.strip() and chunk.content == chunk.prefix + body
+        assert not hasattr(chunk, "__dict__")
+    # Blocks packed together keep the text between them
+    assert "First entry.\n\n\nSecond entry." in chunks[1].text
+    assert chunks[0].content_hash != chunks[1].content_hash
@@ -1,4 +1,11 @@
 from typer.testing import CliRunner
+
+from api import (
+    HnswConfigResponse,
+    SnapshotResponse,
+    TuneResponse,
+    TuningResultResponse,
+)
 from cli import app
 
 runner = CliRunner()
@@ -31,6 +38,23 @@ def test_cli_chat_handles_exit(monkeypatch):
     assert "Exiting chat." in result.output
 
 
+def test_cli_chat_uses_a_session(monkeypatch):
+    questions = iter(["What did I do?", "And then?", "q"])
+    monkeypatch.setattr("cli.Console.input", lambda self, prompt: next(questions))
+    monkeypatch.setattr("cli.submit_post_session", lambda: "s1")
+    sent = []
+
+    def submit_post_message(session_id, message):
+        sent.append((session_id, message))
+        return type("MockResp", (), {"answer": f"re: {message}", "context": []})()
+
+    monkeypatch.setattr("cli.submit_post_message", submit_post_message)
+    result = runner.invoke(app, ["chat"])
+    assert result.exit_code == 0
+    assert sent == [("s1", "What did I do?"), ("s1", "And then?")]
+    assert "re: And then?" in result.output
+
+
 def test_cli_status_shows_index_metrics(monkeypatch):
     class MockMetrics:
         file_count = 5
@@ -62,3 +86,58 @@ def test_cli_index_shows_index_metrics(monkeypatch, tmp_path):
     assert "2" in result.output
     assert "Indexed chunks" in result.output
     assert "4" in result.output
+
+
+def test_cli_export_and_import_show_snapshot(monkeypatch, tmp_path):
+    calls = []
+
+    def submit(action, path, force=False):
+        calls.append((action, force))
+        return SnapshotResponse(
+            path=path,
+            count=42,
+            dimension=384,
+            embedding_model="all-MiniLM-L6-v2",
+            file_count=7,
+        )
+
+    monkeypatch.setattr("cli.submit_post_snapshot", submit)
+    path = tmp_path / "notes.snapshot"
+    result = runner.invoke(app, ["export", str(path)])
+    assert result.exit_code == 0
+    assert "42" in result.output and "all-MiniLM-L6-v2" in result.output
+
+    path.write_bytes(b"")
+    result = runner.invoke(app, ["import", str(path), "--force"])
+    assert result.exit_code == 0
+    assert calls == [("export", False), ("import", True)]
+
+
+def test_cli_tune_shows_results(monkeypatch):
+    payloads = []
+    result = TuningResultResponse(
+        m=16,
+        construction_ef=100,
+        search_ef=50,
+        recall=0.973,
+        latency_ms=1.25,
+        p95_latency_ms=2.5,
+        build_seconds=3.0,
+    )
+
+    def submit(payload):
+        payloads.append(payload)
+        return TuneResponse(
+            config=HnswConfigResponse(
+                space="cosine", m=16, construction_ef=100, search_ef=100
+            ),
+            results=[result],
+            recommended=result,
+            applied=True,
+        )
+
+    monkeypatch.setattr("cli.submit_post_tune", submit)
+    result = runner.invoke(app, ["tune", "--query", "what did I do", "--apply"])
+    assert result.exit_code == 0
+    assert "0.973" in result.output and "search_ef set to 50" in result.output
+    assert payloads[0]["queries"] == ["what did I do"] and payloads[0]["apply"]
@@ -0,0 +1,21 @@
+import time
+
+import pytest
+
+from deadline import Deadline, DeadlineExceeded
+
+
+def test_remaining_counts_down():
+    deadline = Deadline(10)
+    assert 9 < deadline.remaining() <= 10
+    assert not deadline.expired()
+    assert deadline.timeout(cap=2) == 2
+
+
+def test_expired_deadline():
+    deadline = Deadline(0.01)
+    time.sleep(0.02)
+    assert deadline.remaining() == 0
+    assert deadline.expired()
+    with pytest.raises(DeadlineExceeded):
+        deadline.check("generation")
@@ -0,0 +1,64 @@
+from dedup import (
+    NEAR_DUPLICATE_SIMILARITY,
+    FingerprintIndex,
+    min_similarity,
+    minhash,
+    signature_key,
+    similarity,
+)
+
+TEMPLATE = (
+    "Daily standup checklist: review yesterday's work, list today's goals, "
+    "flag blockers to the team, update the sprint board and check the on-call "
+    "rotation before lunch."
+)
+
+
+def test_minhash_estimates_similarity():
+    edited = TEMPLATE.replace("before lunch", "before noon")
+    other = "Fixed the login redirect bug and shipped the new billing page to staging."
+    assert minhash(TEMPLATE) == minhash(TEMPLATE.upper())
+    assert similarity(minhash(TEMPLATE), minhash(edited)) >= NEAR_DUPLICATE_SIMILARITY
+    assert similarity(minhash(TEMPLATE), minhash(other)) < 0.2
+
+
+def test_short_texts_only_match_exactly():
+    assert min_similarity("Buy milk") == 1.0
+    assert min_similarity(TEMPLATE) == NEAR_DUPLICATE_SIMILARITY
+
+
+def test_fingerprint_index_finds_most_similar():
+    index = FingerprintIndex()
+    signature = minhash(TEMPLATE)
+    index.add("a::chunk0", "a.md", signature)
+    index.add("b::chunk0", "b.md", minhash("Something else entirely"))
+
+    edited = minhash(TEMPLATE.replace("the team", "the whole team"))
+    assert index.find(signature) == ("a::chunk0", signature)
+    assert index.find(edited) == ("a::chunk0", signature)
+    assert index.find(edited, min_similarity=1.0) is None
+    assert index.find(minhash("Planned the offsite agenda with the team.")) is None
+    assert len(signature_key(signature)) == 16
+
+    index.delete_file("a.md")
+    assert index.find(signature) is None
+    assert len(index) == 1
+
+
+def test_fingerprint_index_finds_exact_duplicates(tmp_path):
+    import sqlite3
+
+    # An index made before body hashes were recorded
+    path = str(tmp_path / "fingerprints.sqlite")
+    bands = ", ".join(f"b{i} INTEGER NOT NULL" for i in range(8))
+    with sqlite3.connect(path) as conn:
+        conn.execute(
+            "CREATE TABLE fingerprints (chunk_id TEXT PRIMARY KEY,"
+            f" file TEXT NOT NULL, signature BLOB NOT NULL, {bands})"
+        )
+    index = FingerprintIndex(path)
+    signature = minhash(TEMPLATE)
+    index.add("a::chunk0", "a.md", signature, "h1")
+    assert index.find_exact("h1") == ("a::chunk0", signature)
+    assert index.find_exact("h2") is None
+    assert index.items() == [("a::chunk0", "a.md", signature, "h1")]
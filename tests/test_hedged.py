@@ -0,0 +1,178 @@
+import asyncio
+import time
+
+import pytest
+
+from hedged import Backend, HedgedLangModel, LatencyHistogram
+from lang_model import LangModel, LangModelError
+
+
+class DelayedLangModel(LangModel):
+    """Produces its answer after a fixed delay, or fails if asked to."""
+
+    def __init__(self, answer, delay=0.0, fail=False):
+        self.answer = answer
+        self.delay = delay
+        self.fail = fail
+        self.calls = 0
+        self.cancelled = False
+
+    def generate(self, prompt, max_tokens=None, timeout=None):
+        self.calls += 1
+        time.sleep(self.delay)
+        if self.fail:
+            raise LangModelError("Delayed", "unavailable", status_code=503)
+        return self.answer
+
+    async def astream(self, prompt, max_tokens=None, timeout=None):
+        self.calls += 1
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+        if self.fail:
+            raise LangModelError("Delayed", "unavailable", status_code=503)
+        for token in self.answer.split(" "):
+            yield token + " "
+
+
+def test_primary_answers_within_deadline():
+    primary = DelayedLangModel("primary answer")
+    secondary = DelayedLangModel("secondary answer")
+    lang_model = HedgedLangModel(
+        [Backend(primary, first_token_deadline=1.0), Backend(secondary)]
+    )
+    assert asyncio.run(lang_model.agenerate("prompt")) == "primary answer"
+    assert secondary.calls == 0
+
+
+def test_hedges_to_secondary_and_cancels_primary():
+    primary = DelayedLangModel("primary answer", delay=5.0)
+    secondary = DelayedLangModel("secondary answer")
+    lang_model = HedgedLangModel(
+        [
+            Backend(primary, first_token_deadline=0.05, name="primary"),
+            Backend(secondary, name="secondary"),
+        ]
+    )
+    started = time.monotonic()
+    assert asyncio.run(lang_model.agenerate("prompt")) == "secondary answer"
+    assert time.monotonic() - started < 1.0
+    assert primary.cancelled
+    assert lang_model.stats["secondary"].hedges == 1
+    assert lang_model.stats["secondary"].wins == 1
+    assert lang_model.stats["secondary"].first_token.count == 1
+
+
+def test_falls_back_when_primary_fails():
+    primary = DelayedLangModel("primary answer", fail=True)
+    secondary = DelayedLangModel("secondary answer")
+    lang_model = HedgedLangModel(
+        [Backend(primary, name="primary"), Backend(secondary, name="secondary")]
+    )
+    assert asyncio.run(lang_model.agenerate("prompt")) == "secondary answer"
+    assert lang_model.stats["primary"].errors == 1
+
+
+def test_raises_when_all_backends_fail():
+    lang_model = HedgedLangModel(
+        [
+            Backend(DelayedLangModel("a", fail=True)),
+            Backend(DelayedLangModel("b", fail=True)),
+        ]
+    )
+    with pytest.raises(LangModelError) as exc_info:
+        asyncio.run(lang_model.agenerate("prompt"))
+    assert exc_info.value.status_code == 503
+
+
+def test_sync_generate_hedges_and_falls_back():
+    slow = DelayedLangModel("slow answer", delay=1.0)
+    fast = DelayedLangModel("fast answer")
+    lang_model = HedgedLangModel(
+        [Backend(slow, first_token_deadline=0.05), Backend(fast)]
+    )
+    assert lang_model.generate("prompt") == "fast answer"
+
+    failing = DelayedLangModel("failing answer", fail=True)
+    lang_model = HedgedLangModel([Backend(failing), Backend(fast)])
+    assert lang_model.generate("prompt") == "fast answer"
+
+
+class RecordingLangModel(DelayedLangModel):
+    """Records the timeout of each call, and how it was asked."""
+
+    def __init__(self, answer, delay=0.0):
+        super().__init__(answer, delay)
+        self.timeouts = []
+        self.methods = []
+
+    def generate(self, prompt, max_tokens=None, timeout=None):
+        self.timeouts.append(timeout)
+        return super().generate(prompt, max_tokens, timeout)
+
+    async def astream(self, prompt, max_tokens=None, timeout=None):
+        self.timeouts.append(timeout)
+        async for token in super().astream(prompt, max_tokens, timeout):
+            yield token
+
+    def chat(self, messages, max_tokens=None, timeout=None):
+        self.methods.append("chat")
+        return self.generate(messages[-1]["content"], max_tokens, timeout)
+
+    def generate_json(self, prompt, schema=None, max_tokens=None, timeout=None):
+        self.methods.append(("generate_json", schema))
+        return self.generate(prompt, max_tokens, timeout)
+
+    async def achat(self, messages, max_tokens=None, timeout=None):
+        self.methods.append("achat")
+        return self.generate(messages[-1]["content"], max_tokens, timeout)
+
+    async def agenerate_json(self, prompt, schema=None, max_tokens=None, timeout=None):
+        self.methods.append(("agenerate_json", schema))
+        return self.generate(prompt, max_tokens, timeout)
+
+
+def test_every_backend_gets_the_callers_timeout():
+    def hedged():
+        slow = RecordingLangModel("slow answer", delay=0.3)
+        fast = RecordingLangModel("fast answer")
+        backends = [Backend(slow, first_token_deadline=0.05), Backend(fast)]
+        return HedgedLangModel(backends), slow, fast
+
+    lang_model, slow, fast = hedged()
+    assert lang_model.generate("prompt", timeout=30.0) == "fast answer"
+    assert slow.timeouts == [30.0] and fast.timeouts == [30.0]
+
+    lang_model, slow, fast = hedged()
+    assert asyncio.run(lang_model.agenerate("prompt", timeout=30.0)) == "fast answer"
+    assert slow.timeouts == [30.0] and fast.timeouts == [30.0]
+
+
+def test_chat_and_json_are_delegated_to_the_backends():
+    primary = RecordingLangModel("answer")
+    lang_model = HedgedLangModel([Backend(primary)])
+    messages = [{"role": "user", "content": "hi"}]
+    schema = {"type": "object"}
+    assert lang_model.chat(messages, timeout=5.0) == "answer"
+    assert lang_model.generate_json("prompt", schema, timeout=5.0) == "answer"
+    assert asyncio.run(lang_model.achat(messages, timeout=5.0)) == "answer"
+    assert asyncio.run(lang_model.agenerate_json("prompt", schema)) == "answer"
+    assert primary.methods == [
+        "chat",
+        ("generate_json", schema),
+        "achat",
+        ("agenerate_json", schema),
+    ]
+    assert primary.timeouts == [5.0, 5.0, 5.0, None]
+
+
+def test_latency_histogram():
+    histogram = LatencyHistogram(buckets=(0.1, 1.0, float("inf")))
+    for seconds in [0.05, 0.05, 0.5, 3.0]:
+        histogram.record(seconds)
+    assert histogram.count == 4
+    assert histogram.quantile(0.5) == 0.1
+    assert histogram.quantile(0.99) == float("inf")
+    assert histogram.to_dict()["buckets"] == {"0.1": 2, "1.0": 1, "+Inf": 1}
@@ -0,0 +1,202 @@
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from http_client import AsyncSession, RetryPolicy, build_session
+from lang_model import LangModelError
+from ollama import OllamaLangModel
+
+
+@pytest.fixture
+def flaky_ollama():
+    """A fake Ollama server that fails with 503 before answering."""
+    state = {"requests": 0, "failures": 2, "bodies": []}
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers["Content-Length"]))
+            state["bodies"].append(json.loads(body))
+            state["requests"] += 1
+            if state["requests"] <= state["failures"]:
+                body = b"busy"
+                self.send_response(503)
+            else:
+                body = b"".join(
+                    json.dumps({"message": {"content": token}}).encode() + b"\n"
+                    for token in ["hel", "lo"]
+                )
+                self.send_response(200)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}", state
+    server.shutdown()
+
+
+def test_backoff_grows_and_is_capped():
+    policy = RetryPolicy(backoff_factor=1.0, backoff_max=3.0, jitter=0.0)
+    assert policy.backoff(1) == 1.0
+    assert policy.backoff(2) == 2.0
+    assert policy.backoff(3) == 3.0
+
+
+def test_backoff_adds_jitter():
+    policy = RetryPolicy(backoff_factor=1.0, jitter=0.5)
+    delays = [policy.backoff(1) for _ in range(20)]
+    assert all(1.0 <= d <= 1.5 for d in delays)
+
+
+def test_session_retries_transient_errors(flaky_ollama):
+    url, state = flaky_ollama
+    policy = RetryPolicy(max_retries=3, backoff_factor=0, jitter=0)
+    lang_model = OllamaLangModel(url=url, session=build_session(policy))
+    assert lang_model.generate("say hello") == "hello"
+    assert state["requests"] == 3
+
+
+def test_session_raises_structured_error_after_retries(flaky_ollama):
+    url, state = flaky_ollama
+    state["failures"] = 10
+    policy = RetryPolicy(max_retries=1, backoff_factor=0, jitter=0)
+    lang_model = OllamaLangModel(url=url, session=build_session(policy))
+    with pytest.raises(LangModelError) as exc_info:
+        lang_model.generate("say hello")
+    assert exc_info.value.backend == "Ollama"
+    assert exc_info.value.status_code == 503
+    assert exc_info.value.retryable
+    assert state["requests"] == 2
+
+
+def test_async_stream_retries_transient_errors(flaky_ollama):
+    url, state = flaky_ollama
+    policy = RetryPolicy(max_retries=3, backoff_factor=0, jitter=0)
+    lang_model = OllamaLangModel(url=url, retry_policy=policy)
+
+    async def collect():
+        return [token async for token in lang_model.astream("say hello")]
+
+    assert asyncio.run(collect()) == ["hel", "lo"]
+    assert state["requests"] == 3
+
+
+def test_async_generate_raises_structured_error(flaky_ollama):
+    url, state = flaky_ollama
+    state["failures"] = 10
+    policy = RetryPolicy(max_retries=1, backoff_factor=0, jitter=0)
+    lang_model = OllamaLangModel(url=url, retry_policy=policy)
+    with pytest.raises(LangModelError) as exc_info:
+        asyncio.run(lang_model.agenerate("say hello"))
+    assert exc_info.value.status_code == 503
+    assert state["requests"] == 2
+
+
+def test_chat_sends_history_and_keep_alive(flaky_ollama):
+    url, state = flaky_ollama
+    state["failures"] = 0
+    lang_model = OllamaLangModel(url=url)
+    messages = [
+        {"role": "system", "content": "notes"},
+        {"role": "user", "content": "What did I do on Monday?"},
+        {"role": "assistant", "content": "You fixed a bug."},
+        {"role": "user", "content": "And Tuesday?"},
+    ]
+    assert lang_model.chat(messages) == "hello"
+    assert asyncio.run(lang_model.achat(messages)) == "hello"
+    for body in state["bodies"]:
+        assert body["messages"] == messages
+        assert body["keep_alive"] == lang_model.keep_alive
+
+
+def test_generate_json_requests_structured_output(flaky_ollama):
+    url, state = flaky_ollama
+    state["failures"] = 0
+    lang_model = OllamaLangModel(url=url)
+    schema = {"type": "object", "properties": {"start": {"type": "string"}}}
+    lang_model.generate_json("when?", schema=schema, max_tokens=16)
+    asyncio.run(lang_model.agenerate_json("when?"))
+    assert state["bodies"][0]["format"] == schema
+    assert state["bodies"][0]["options"] == {"num_predict": 16, "temperature": 0}
+    assert state["bodies"][1]["format"] == "json"
+
+
+@pytest.fixture
+def stalling_ollama():
+    """A fake Ollama server that streams its answer slowly, then drops it."""
+    state = {"delay": 0.0, "lines": 3, "truncate": False}
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers["Content-Length"]))
+            line = json.dumps({"message": {"content": "tok"}}).encode() + b"\n"
+            self.send_response(200)
+            # A truncated answer announces more than it sends
+            length = len(line) * (state["lines"] + state["truncate"])
+            self.send_header("Content-Length", str(length))
+            self.end_headers()
+            self.close_connection = True
+            for _ in range(state["lines"]):
+                try:
+                    self.wfile.write(line)
+                    self.wfile.flush()
+                except ConnectionError:
+                    return  # The client gave up
+                time.sleep(state["delay"])
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}", state
+    server.shutdown()
+
+
+def test_async_stream_error_is_structured(stalling_ollama):
+    url, state = stalling_ollama
+    state["truncate"] = True
+    lang_model = OllamaLangModel(url=url)
+    with pytest.raises(LangModelError) as exc_info:
+        asyncio.run(lang_model.agenerate("say hello"))
+    assert exc_info.value.backend == "Ollama"
+
+
+def test_async_stream_enforces_overall_timeout(stalling_ollama):
+    url, state = stalling_ollama
+    state.update(delay=0.2, lines=10)
+    lang_model = OllamaLangModel(url=url)
+    # Every line arrives well within the read timeout
+    with pytest.raises(LangModelError, match="timed out"):
+        asyncio.run(lang_model.agenerate("say hello", timeout=0.5))
+
+
+def test_async_session_closes_client_of_another_loop():
+    session = AsyncSession()
+
+    async def client():
+        return session.client()
+
+    loop = asyncio.new_event_loop()
+    try:
+        first = loop.run_until_complete(client())
+        second = asyncio.run(client())
+    finally:
+        loop.close()
+    assert first is not second
+    assert first.is_closed and not second.is_closed
+    asyncio.run(session.aclose())
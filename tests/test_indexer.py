@@ -1,11 +1,15 @@
 import os
-import tempfile
 import shutil
+import tempfile
+import time
+
+import chromadb
 import pytest
-import re
+
+import indexer as indexer_module
+from chunker import note_text
 from indexer import Indexer
 from vector_store import VectorStore
-import chromadb
 
 
 class DummyEmbedder:
@@ -14,6 +18,17 @@ class DummyEmbedder:
         return [[float(len(t))] for t in texts]
 
 
+class CountingEmbedder(DummyEmbedder):
+    """Records every text it embeds."""
+
+    def __init__(self):
+        self.texts = []
+
+    def embed(self, texts):
+        self.texts.extend(texts)
+        return super().embed(texts)
+
+
 class DummyChunker:
     def chunk_file(self, file_path):
         # Each line is a chunk
@@ -43,27 +58,31 @@ def test_indexer_basic(temp_dir_with_files):
     indexer = Indexer(
         embedder=DummyEmbedder(),
         chunker=DummyChunker(),
-        vector_store=VectorStore(collection_name="test_indexer"),
+        vector_store=VectorStore(
+            collection_name="test_indexer", chroma_client=chromadb.Client()
+        ),
     )
     metrics = indexer.index_dir(temp_dir_with_files, file_exts=[".txt"])
     assert metrics.file_count == 3
     assert metrics.chunk_count == 7  # 2 in a.txt, 3 in b.txt, 2 in c.txt
-    # Check that all chunks have modification_time metadata
-    for file in ["a.txt", "b.txt", "subdir/c.txt"]:
+    # Check that all chunks have modification time metadata
+    for file, count in [("a.txt", 2), ("b.txt", 3), ("subdir/c.txt", 2)]:
         abs_file = os.path.join(temp_dir_with_files, file)
-        results = indexer.vector_store.collection.get(where={"file": abs_file})
+        chunk_ids = indexer.membership.chunk_ids(abs_file)
+        assert len(chunk_ids) == count
+        results = indexer.vector_store.get_by_ids(chunk_ids)
+        assert len(results["metadatas"]) == count
         for md in results["metadatas"]:
-            assert "modification_time" in md
-            assert re.match(
-                r"^\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}", md["modification_time"]
-            )
+            assert isinstance(md["modified_at"], float)
 
 
 def test_get_index_metrics_endpoint(temp_dir_with_files):
     indexer = Indexer(
         embedder=DummyEmbedder(),
         chunker=DummyChunker(),
-        vector_store=VectorStore(collection_name="test_indexer_metrics"),
+        vector_store=VectorStore(
+            collection_name="test_indexer_metrics", chroma_client=chromadb.Client()
+        ),
     )
     metrics = indexer.index_dir(temp_dir_with_files, file_exts=[".txt"])
     assert metrics.file_count == 3
@@ -99,6 +118,32 @@ def test_indexer_skips_unchanged_file(tmp_path):
     assert count3 == 2  # Still two, but new content
 
 
+def test_indexer_reindexes_into_a_recreated_collection(tmp_path):
+    notes = tmp_path / "notes"
+    notes.mkdir()
+    (notes / "foo.txt").write_text("alpha\nbeta\n")
+    client = chromadb.PersistentClient(path=str(tmp_path / "db"))
+
+    def index():
+        indexer = Indexer(
+            embedder=DummyEmbedder(),
+            chunker=DummyChunker(),
+            vector_store=VectorStore(collection_name="recreated", chroma_client=client),
+        )
+        metrics = indexer.index_dir(str(notes), file_exts=[".txt"])
+        indexer.close()
+        return metrics, indexer.vector_store
+
+    assert index()[0].file_count == 1
+    client.delete_collection("recreated")
+    # The new collection does not inherit the old one's sidecars, which
+    # would have the file skipped as unchanged
+    metrics, store = index()
+    assert metrics.file_count == 1
+    assert store.collection.count() == 2
+    assert store.counts().file_count == 1
+
+
 def test_indexer_empty_dir(tmp_path):
     indexer = Indexer(
         embedder=DummyEmbedder(),
@@ -191,3 +236,538 @@ def test_indexer_file_non_txt_extension():
     metrics = indexer.index_dir(temp_dir, file_exts=[".md"])
     assert metrics.file_count == 1
     assert metrics.chunk_count == 2
+
+
+def test_indexer_records_event_dates(tmp_path):
+    from datetime import datetime
+
+    (tmp_path / "2024-05-01.md").write_text("Fixed the login bug.")
+    (tmp_path / "ideas.md").write_text("Build a thing.")
+    store = VectorStore(
+        collection_name="test_indexer_event_dates", chroma_client=chromadb.Client()
+    )
+    indexer = Indexer(embedder=DummyEmbedder(), vector_store=store)
+    indexer.index_dir(str(tmp_path))
+
+    dated = store.get_by_time_range(
+        datetime(2024, 5, 1).timestamp(),
+        datetime(2024, 5, 1, 23, 59).timestamp(),
+        time_field="event_date",
+    )
+    assert [m["file"] for m in dated["metadatas"]] == [str(tmp_path / "2024-05-01.md")]
+    # Undated notes fall back to the file's creation time
+    (undated,) = [m for m in store.get_all_metadata() if m.file.endswith("ideas.md")]
+    assert undated.event_date == undated.created_at
+
+
+def test_indexer_streams_large_files_in_batches(tmp_path, monkeypatch):
+    import hashlib
+
+    import indexer as indexer_module
+
+    class CountingEmbedder(DummyEmbedder):
+        def __init__(self):
+            self.batches = []
+
+        def embed(self, texts):
+            self.batches.append(len(texts))
+            return super().embed(texts)
+
+    monkeypatch.setattr(indexer_module, "EMBED_BATCH_SIZE", 4)
+    file_path = tmp_path / "big.md"
+    content = "\n\n".join(f"Paragraph {i}." for i in range(10))
+    file_path.write_text(content)
+    embedder = CountingEmbedder()
+    store = VectorStore(
+        collection_name="test_indexer_batches", chroma_client=chromadb.Client()
+    )
+    from chunker import MarkdownChunker
+
+    indexer = Indexer(
+        embedder=embedder, chunker=MarkdownChunker(chunk_size=20), vector_store=store
+    )
+    metrics = indexer.index_file(str(file_path))
+    assert metrics.chunk_count == 10
+    assert embedder.batches == [4, 4, 2]
+    # The hash computed while chunking is recorded for the file
+    expected = hashlib.sha256(content.encode("utf-8")).hexdigest()
+    assert indexer.membership.get_file(str(file_path)).file_hash == expected
+    # Chunks record where their text lies in the file
+    results = store.get_by_file_path(str(file_path))
+    for md in results["metadatas"]:
+        assert content[md["start_offset"] : md["end_offset"]].startswith("Paragraph")
+
+
+def test_indexer_skips_files_by_stat_without_reading(tmp_path, monkeypatch):
+    import indexer as indexer_module
+
+    file_path = tmp_path / "old.txt"
+    file_path.write_text("alpha\nbeta\n")
+    os.utime(file_path, (1_700_000_000, 1_700_000_000))
+    indexer = Indexer(
+        embedder=DummyEmbedder(),
+        chunker=DummyChunker(),
+        vector_store=VectorStore(
+            collection_name="test_indexer_stat_skip", chroma_client=chromadb.Client()
+        ),
+    )
+    assert indexer.index_file(str(file_path)).file_count == 1
+
+    def fail(*args, **kwargs):
+        raise AssertionError("file was read")
+
+    monkeypatch.setattr(indexer_module, "read_blocks", fail)
+    assert indexer.index_file(str(file_path)).file_count == 0
+
+    # Touching the file forces a hash check, but unchanged content is skipped
+    monkeypatch.undo()
+    os.utime(file_path, (1_700_000_100, 1_700_000_100))
+    assert indexer.index_file(str(file_path)).file_count == 0
+    monkeypatch.setattr(indexer_module, "read_blocks", fail)
+    assert indexer.index_file(str(file_path)).file_count == 0
+
+
+def test_indexer_reuses_embeddings_of_duplicate_chunks(tmp_path):
+    from datetime import datetime
+
+    from dedup import FingerprintIndex
+    from query import QueryEngine
+
+    template = (
+        "Meeting agenda: review action items from last week, walk through the "
+        "roadmap, discuss hiring and open questions, then agree on next steps."
+    )
+    (tmp_path / "2024-05-01.md").write_text(
+        f"# Agenda\n\n{template}\n\n# Log\n\nShipped the importer."
+    )
+    (tmp_path / "2024-05-02.md").write_text(
+        f"# Agenda\n\n{template.replace('next steps', 'the next steps')}"
+        "\n\n# Log\n\nFixed the search bug."
+    )
+    (tmp_path / "2024-05-03.md").write_text(
+        f"# Agenda\n\n{template}\n\n# Log\n\nReviewed the design."
+    )
+    embedder = CountingEmbedder()
+    store = VectorStore(
+        collection_name="test_indexer_duplicates", chroma_client=chromadb.Client()
+    )
+    indexer = Indexer(
+        embedder=embedder, vector_store=store, fingerprints=FingerprintIndex()
+    )
+    metrics = indexer.index_dir(str(tmp_path))
+    assert metrics.chunk_count == 6
+    # The exact copy of the agenda reuses its embedding; the near copy,
+    # whose text differs, gets its own
+    assert sum("Meeting agenda" in t for t in embedder.texts) == 2
+
+    results = store.collection.get(include=["metadatas", "embeddings"])
+    by_file = {
+        (os.path.basename(md["file"]), md["chunk_index"]): (md, embedding)
+        for md, embedding in zip(results["metadatas"], results["embeddings"])
+    }
+    original, original_embedding = by_file[("2024-05-01.md", 0)]
+    near, near_embedding = by_file[("2024-05-02.md", 0)]
+    exact, exact_embedding = by_file[("2024-05-03.md", 0)]
+    assert not original["duplicate_of"] and not near["duplicate_of"]
+    assert exact["duplicate_of"]
+    assert original["dedup_key"] == near["dedup_key"] == exact["dedup_key"]
+    assert list(near_embedding) != list(original_embedding)
+    assert list(exact_embedding) == list(original_embedding)
+    # Each copy keeps its own text and date
+    near_id = results["ids"][results["metadatas"].index(near)]
+    assert "the next steps" in store.collection.get(ids=[near_id])["documents"][0]
+    assert near["event_date"] != original["event_date"]
+
+    # Duplicates are collapsed in query results
+    engine = QueryEngine(embedder=embedder, vector_store=store, lang_model=object())
+    context = engine._find_similar_context("agenda", max_results=6)
+    keys = [c.metadata["dedup_key"] for c in context]
+    assert len(context) == 4 and len(set(keys)) == 4
+    # but not across days in a time range, which summaries cover day by day
+    context = engine._range_context(datetime(2024, 5, 1), datetime(2024, 5, 3, 23))
+    assert len(context) == 6
+
+
+def test_indexer_embeds_near_duplicates_that_differ_in_facts(tmp_path):
+    from dedup import FingerprintIndex, minhash, similarity
+
+    run = (
+        "Morning run along the river trail with the club, easy pace the whole"
+        " way, stretched afterwards and felt good all day. Ran {} km."
+    )
+    assert similarity(minhash(run.format(5)), minhash(run.format(12))) >= 0.7
+    (tmp_path / "2024-05-01.md").write_text(run.format(5))
+    (tmp_path / "2024-05-08.md").write_text(run.format(12))
+    store = VectorStore(
+        collection_name="test_indexer_near_duplicates",
+        chroma_client=chromadb.Client(),
+    )
+    indexer = Indexer(
+        embedder=DummyEmbedder(), vector_store=store, fingerprints=FingerprintIndex()
+    )
+    indexer.index_dir(str(tmp_path))
+
+    results = store.collection.get(include=["documents", "embeddings"])
+    embeddings = {
+        document.rsplit("Ran ", 1)[1]: list(embedding)
+        for document, embedding in zip(results["documents"], results["embeddings"])
+    }
+    assert embeddings["5 km."] != embeddings["12 km."]
+
+
+def test_indexer_stores_identical_content_once(tmp_path):
+    content = "# Plan\n\nShip the importer.\n\n# Notes\n\nThe demo went well."
+    for folder in ("vault", "synced"):
+        (tmp_path / folder).mkdir()
+        (tmp_path / folder / "2024-05-01.md").write_text(content)
+    embedder = CountingEmbedder()
+    store = VectorStore(
+        collection_name="test_indexer_shared", chroma_client=chromadb.Client()
+    )
+    indexer = Indexer(embedder=embedder, vector_store=store)
+    metrics = indexer.index_dir(str(tmp_path))
+    assert metrics.file_count == 2 and metrics.chunk_count == 4
+    assert len(embedder.texts) == 2
+    assert store.collection.count() == 2
+
+    # Editing one section only embeds the changed chunk
+    vault = str(tmp_path / "vault" / "2024-05-01.md")
+    (tmp_path / "vault" / "2024-05-01.md").write_text(
+        content.replace("went well", "went badly")
+    )
+    indexer.index_file(vault)
+    assert len(embedder.texts) == 3
+    assert store.collection.count() == 3
+
+    # Removing a file keeps the content other files still refer to
+    synced = str(tmp_path / "synced" / "2024-05-01.md")
+    assert indexer.remove_file(synced) == 1  # only "went well" is gone
+    assert store.collection.count() == 2
+    shared = store.get_by_ids(indexer.membership.chunk_ids(vault))
+    assert {md["file"] for md in shared["metadatas"]} == {vault}
+
+
+def test_indexer_keys_chunks_on_content_not_file_names_or_dates(tmp_path):
+    content = "# Plan\n\nShip the importer.\n\n# Notes\n\nThe demo went well."
+    for folder, name in (("vault", "note.md"), ("archive", "note (copy).md")):
+        (tmp_path / folder).mkdir()
+        (tmp_path / folder / name).write_text(content)
+    # The copy was renamed and last modified on another day
+    old = time.time() - 10 * 86400
+    os.utime(tmp_path / "archive" / "note (copy).md", (old, old))
+    embedder = CountingEmbedder()
+    store = VectorStore(
+        collection_name="test_indexer_content_keys", chroma_client=chromadb.Client()
+    )
+    indexer = Indexer(embedder=embedder, vector_store=store)
+    indexer.index_dir(str(tmp_path))
+    assert len(embedder.texts) == 2
+    assert store.collection.count() == 2
+
+    # An edit on a later day only re-embeds the section that changed
+    note = tmp_path / "vault" / "note.md"
+    note.write_text(content.replace("Ship the importer.", "Ship the exporter."))
+    later = time.time() + 86400
+    os.utime(note, (later, later))
+    indexer.index_file(str(note))
+    assert len(embedder.texts) == 3
+    assert store.collection.count() == 3
+    # The file's timestamps are added when the chunk is read
+    chunk = store.get_by_ids(
+        indexer.membership.chunk_ids(str(note))[:1], ["documents", "metadatas"]
+    )
+    assert chunk["documents"][0].startswith("# Plan")
+    text = note_text(chunk["documents"][0], chunk["metadatas"][0])
+    assert text.startswith("User note: title 'note.md', created at '")
+    assert "last modified" in text
+
+
+def test_indexer_ignores_fingerprints_of_replaced_chunks(tmp_path):
+    from dedup import FingerprintIndex
+
+    budget = (
+        "Hardware spend for the quarter is capped at 40000 euros, split across teams."
+    )
+    note = tmp_path / "budget.md"
+    note.write_text(f"# Budget\n\n{budget}")
+    embedder = CountingEmbedder()
+    store = VectorStore(
+        collection_name="test_indexer_replaced_fingerprints",
+        chroma_client=chromadb.Client(),
+    )
+    indexer = Indexer(
+        embedder=embedder, vector_store=store, fingerprints=FingerprintIndex()
+    )
+    indexer.index_file(str(note))
+    # A changed number is embedded anew
+    note.write_text(f"# Budget\n\n{budget.replace('40000', '95000')}")
+    indexer.index_file(str(note))
+    # The same text under a new heading is a new chunk, not a duplicate of
+    # the one it replaces
+    note.write_text(f"# Costs\n\n{budget.replace('40000', '95000')}")
+    indexer.index_file(str(note))
+    assert len(embedder.texts) == 3
+
+    results = store.collection.get(include=["documents", "metadatas"])
+    assert len(results["ids"]) == 1
+    assert "95000" in results["documents"][0]
+    assert results["metadatas"][0]["duplicate_of"] == ""
+
+
+class Crash(BaseException):
+    """Stands in for the process dying: not caught by the Indexer."""
+
+
+def _restarted(indexer, embedder):
+    """A new Indexer on the stores of one whose process died."""
+    indexer_module._live_owners.discard(indexer._owner)
+    return Indexer(
+        embedder=embedder,
+        chunker=DummyChunker(),
+        vector_store=indexer.vector_store,
+        fingerprints=indexer.fingerprints,
+        membership=indexer.membership,
+        journal=indexer.journal,
+        lexical=indexer.lexical,
+    )
+
+
+def test_indexer_close_releases_owner_and_opened_stores(temp_dir_with_files):
+    import sqlite3
+
+    from membership import MembershipStore
+
+    membership = MembershipStore()
+    store = VectorStore(collection_name="test_close", chroma_client=chromadb.Client())
+    with Indexer(
+        embedder=DummyEmbedder(),
+        chunker=DummyChunker(),
+        vector_store=store,
+        membership=membership,
+    ) as indexer:
+        indexer.index_dir(temp_dir_with_files, file_exts=[".txt"])
+        assert indexer._owner in indexer_module._live_owners
+    assert indexer._owner not in indexer_module._live_owners
+    with pytest.raises(sqlite3.ProgrammingError):
+        len(indexer.lexical)
+    # Stores it was given stay open for their owner
+    assert len(membership.files()) == 3
+
+
+def test_indexer_recovers_from_crash_mid_file(tmp_path):
+    path = tmp_path / "a.txt"
+    path.write_text("one\ntwo\n")
+    store = VectorStore(
+        collection_name="test_indexer_crash", chroma_client=chromadb.Client()
+    )
+    indexer = Indexer(
+        embedder=DummyEmbedder(), chunker=DummyChunker(), vector_store=store
+    )
+    indexer.index_file(str(path))
+
+    # The process dies after the edited file's new chunks are stored but
+    # before the file is switched over to them
+    path.write_text("one\nthree\n")
+
+    def crash(*args):
+        raise Crash()
+
+    indexer.membership.replace_file = crash
+    with pytest.raises(Crash):
+        indexer.index_file(str(path))
+    assert store.collection.count() == 3
+    assert indexer.journal.incomplete()
+
+    restarted = _restarted(indexer, DummyEmbedder())
+    del restarted.membership.replace_file
+    metrics = restarted.index_dir(str(tmp_path), file_exts=[".txt"])
+    assert metrics.file_count == 1 and not metrics.failed_files
+    assert not restarted.journal.incomplete()
+    assert sorted(store.collection.get()["documents"]) == ["one", "three"]
+
+
+def test_indexer_resumes_interrupted_run(tmp_path):
+    for name in ["a.txt", "b.txt", "c.txt"]:
+        (tmp_path / name).write_text(f"{name} line one\n{name} line two\n")
+
+    class CrashingEmbedder(DummyEmbedder):
+        calls = 0
+
+        def embed(self, texts):
+            CrashingEmbedder.calls += 1
+            if CrashingEmbedder.calls == 2:
+                raise Crash()
+            return super().embed(texts)
+
+    indexer = Indexer(
+        embedder=CrashingEmbedder(),
+        chunker=DummyChunker(),
+        vector_store=VectorStore(
+            collection_name="test_indexer_resume", chroma_client=chromadb.Client()
+        ),
+    )
+    indexer.writer.max_count = 1  # Write each file before the next is read
+    with pytest.raises(Crash):
+        indexer.index_dir(str(tmp_path), file_exts=[".txt"])
+
+    indexed = []
+    restarted = _restarted(indexer, DummyEmbedder())
+    original = restarted.index_file
+    restarted.index_file = lambda path, *args, **kwargs: indexed.append(
+        path
+    ) or original(path, *args, **kwargs)
+    metrics = restarted.index_dir(str(tmp_path), file_exts=[".txt"])
+    # The file committed before the crash is not even looked at again
+    assert len(indexed) == 2 and metrics.file_count == 2
+    assert restarted.vector_store.collection.count() == 6
+    assert not restarted.journal.incomplete()
+
+
+def test_indexer_batches_writes_across_files(temp_dir_with_files, monkeypatch):
+    store = VectorStore(
+        collection_name="test_indexer_writes", chroma_client=chromadb.Client()
+    )
+    writes = []
+    add = store.add
+    monkeypatch.setattr(
+        store, "add", lambda ids, *args: writes.append(len(ids)) or add(ids, *args)
+    )
+    indexer = Indexer(
+        embedder=DummyEmbedder(), chunker=DummyChunker(), vector_store=store
+    )
+    metrics = indexer.index_dir(temp_dir_with_files, file_exts=[".txt"])
+    assert metrics.file_count == 3 and metrics.chunk_count == 7
+    assert writes == [7]
+    for file in ["a.txt", "b.txt", "subdir/c.txt"]:
+        path = os.path.join(temp_dir_with_files, file)
+        assert indexer.membership.get_file(path) is not None
+    assert not indexer.journal.incomplete()
+
+
+def test_indexer_keeps_chunks_moved_between_buffered_files(tmp_path):
+    for folder in ["d1", "d2"]:
+        (tmp_path / folder).mkdir()
+    (tmp_path / "d1" / "n.md").write_text("alpha\nbeta\n")
+    (tmp_path / "d2" / "n.md").write_text("gamma\n")
+    store = VectorStore(
+        collection_name="test_indexer_moved_chunks", chroma_client=chromadb.Client()
+    )
+    indexer = Indexer(
+        embedder=DummyEmbedder(), chunker=DummyChunker(), vector_store=store
+    )
+    indexer.index_dir(str(tmp_path))
+
+    # alpha moves from one file to the other and back. The file it leaves
+    # gains a new chunk, so both files are written in one batch, and it
+    # leaves a file before the file it moves to is switched over whichever
+    # order they are scanned in
+    text = {"d1": "beta\n", "d2": "gamma\n"}
+    for source, target in [("d1", "d2"), ("d2", "d1")]:
+        (tmp_path / source / "n.md").write_text(text[source] + f"{target} has it\n")
+        (tmp_path / target / "n.md").write_text(text[target] + "alpha\n")
+        metrics = indexer.index_dir(str(tmp_path))
+        assert metrics.file_count == 2 and not metrics.failed_files
+
+        path = str(tmp_path / target / "n.md")
+        results = store.collection.get()
+        assert sorted(results["documents"]) == [
+            "alpha",
+            "beta",
+            f"{target} has it",
+            "gamma",
+        ]
+        alpha = results["ids"][results["documents"].index("alpha")]
+        assert alpha in indexer.membership.chunk_ids(path)
+        assert store.get_by_ids([alpha])["metadatas"][0]["file"] == path
+        assert not indexer.journal.incomplete()
+
+
+def test_indexer_reports_files_whose_write_failed(temp_dir_with_files, monkeypatch):
+    store = VectorStore(
+        collection_name="test_indexer_write_fails", chroma_client=chromadb.Client()
+    )
+
+    def fail(*args):
+        raise RuntimeError("disk full")
+
+    monkeypatch.setattr(store, "add", fail)
+    indexer = Indexer(
+        embedder=DummyEmbedder(), chunker=DummyChunker(), vector_store=store
+    )
+    metrics = indexer.index_dir(temp_dir_with_files, file_exts=[".txt"])
+    assert metrics.file_count == 0 and metrics.chunk_count == 0
+    assert len(metrics.failed_files) == 3
+    assert not indexer.journal.incomplete()
+    assert (
+        indexer.membership.get_file(os.path.join(temp_dir_with_files, "a.txt")) is None
+    )
+
+
+def test_indexer_removes_deleted_and_relinks_moved_files(tmp_path):
+    (tmp_path / "notes").mkdir()
+    (tmp_path / "a.txt").write_text("alpha\nbeta\n")
+    (tmp_path / "b.txt").write_text("gamma\ndelta\n")
+    (tmp_path / "keep.md").write_text("not scanned for\n")
+    embedder = CountingEmbedder()
+    store = VectorStore(
+        collection_name="test_indexer_reconcile", chroma_client=chromadb.Client()
+    )
+    indexer = Indexer(embedder=embedder, chunker=DummyChunker(), vector_store=store)
+    indexer.index_dir(str(tmp_path))
+    assert store.collection.count() == 5
+
+    os.rename(tmp_path / "a.txt", tmp_path / "notes" / "moved.txt")
+    os.remove(tmp_path / "b.txt")
+    os.remove(tmp_path / "keep.md")
+    embedded = len(embedder.texts)
+    metrics = indexer.index_dir(str(tmp_path), file_exts=[".txt"])
+    assert metrics.renamed_count == 1 and metrics.removed_count == 1
+    assert metrics.file_count == 0 and len(embedder.texts) == embedded
+
+    moved = str(tmp_path / "notes" / "moved.txt")
+    results = store.collection.get()
+    assert sorted(results["documents"]) == ["alpha", "beta", "not scanned for"]
+    assert {md["file"] for md in results["metadatas"]} == {
+        moved,
+        str(tmp_path / "keep.md"),
+    }
+    assert len(indexer.membership.chunk_ids(moved)) == 2
+    assert indexer.membership.get_file(str(tmp_path / "a.txt")) is None
+    # Only files with the extensions scanned for are removed
+    assert indexer.membership.get_file(str(tmp_path / "keep.md")) is not None
+
+
+def test_indexer_maintains_lexical_index(tmp_path):
+    (tmp_path / "a.txt").write_text("Fixed PROJ-1234\nlunch\n")
+    (tmp_path / "b.txt").write_text("MTTR doc review\n")
+    store = VectorStore(
+        collection_name="test_indexer_lexical", chroma_client=chromadb.Client()
+    )
+    indexer = Indexer(
+        embedder=DummyEmbedder(), chunker=DummyChunker(), vector_store=store
+    )
+    indexer.index_dir(str(tmp_path))
+    assert len(indexer.lexical) == 3
+    [chunk_id] = indexer.lexical.search("proj-1234", 10)
+    assert store.get_by_ids([chunk_id], include=["documents"])["documents"] == [
+        "Fixed PROJ-1234"
+    ]
+
+    (tmp_path / "a.txt").write_text("lunch\n")
+    indexer.index_dir(str(tmp_path))
+    assert indexer.lexical.search("proj-1234", 10) == []
+    os.remove(tmp_path / "b.txt")
+    indexer.remove_file(str(tmp_path / "b.txt"))
+    assert indexer.lexical.search("mttr", 10) == []
+    assert len(indexer.lexical) == store.collection.count() == 1
+
+    # Chunks stored without it, e.g. imported, are added on the next run
+    fresh = Indexer(
+        embedder=DummyEmbedder(),
+        chunker=DummyChunker(),
+        vector_store=store,
+        membership=indexer.membership,
+    )
+    assert len(fresh.lexical) == 0
+    fresh.index_dir(str(tmp_path))
+    assert len(fresh.lexical) == 1 and fresh.lexical.search("lunch", 10)
@@ -0,0 +1,33 @@
+from journal import IndexJournal
+
+
+def test_journal_tracks_incomplete_files():
+    journal = IndexJournal()
+    journal.plan("a.md", "", "owner", ["old"])
+    journal.embedded("a.md", ["new1", "new2"])
+    assert journal.incomplete() == [("a.md", "owner")]
+    assert journal.chunk_ids("a.md") == ["new1", "new2", "old"]
+
+    journal.commit("a.md")
+    assert journal.incomplete() == []
+    assert journal.chunk_ids("a.md") == []
+
+    journal.plan("b.md", "", "owner", [])
+    journal.discard("b.md")
+    assert journal.incomplete() == []
+
+
+def test_journal_resumes_runs():
+    journal = IndexJournal()
+    assert journal.begin_run("run") == set()
+    journal.plan("a.md", "run", "owner", [])
+    journal.commit("a.md")
+    journal.plan("b.md", "run", "owner", [])
+
+    # Interrupted: a.md is done, b.md is not
+    assert journal.begin_run("run") == {"a.md"}
+    assert journal.incomplete() == [("b.md", "owner")]
+    journal.discard("b.md")
+
+    journal.finish_run("run")
+    assert journal.begin_run("run") == set()
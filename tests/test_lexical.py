@@ -0,0 +1,70 @@
+from lexical import LexicalIndex, exact_terms, reciprocal_rank_fusion
+from vector_store import Metadata
+
+
+def _index():
+    lexical = LexicalIndex()
+    documents = {
+        "a": "Fixed PROJ-1234 in auth-service",
+        "b": "Reviewed the MTTR doc with Alice",
+        "c": "Lunch with the team",
+        "d": "The project planning doc, the agenda and the notes",
+    }
+    lexical.add(
+        list(documents),
+        list(documents.values()),
+        [{"created_at": 100.0 * i, "event_date": 100.0 * i} for i in range(4)],
+    )
+    return lexical
+
+
+def test_search_ranks_by_bm25_and_filters_by_time():
+    lexical = _index()
+    assert len(lexical) == 4
+    assert lexical.search("What about PROJ-1234?", 10) == ["a"]
+    assert lexical.search("proj", 10) == []  # Identifiers are one term
+    assert lexical.search("mttr doc", 10) == ["b", "d"]
+    assert lexical.search("doc", 10, start_time=150, time_field="event_date") == ["d"]
+    # "the" is in most chunks, so does not make every chunk a match
+    assert lexical.search("the doc", 10) == ["b", "d"]
+    assert lexical.search("nothing matches", 10) == []
+
+
+def test_add_is_idempotent_and_delete_removes():
+    lexical = _index()
+    lexical.add(["a"], ["changed"], [Metadata("a.md")])
+    assert lexical.search("changed", 10) == []
+    lexical.delete(["a", "missing"])
+    assert len(lexical) == 3 and lexical.search("PROJ-1234", 10) == []
+    assert lexical.existing_ids(["a", "b"]) == {"b"}
+    assert lexical.document_frequencies(["doc", "proj-1234"]) == {"doc": 2}
+
+
+def test_selective_ids_need_rare_exact_terms():
+    lexical = _index()
+    assert exact_terms("Did I fix PROJ-1234 or the MTTR doc for auth_service v2?") == [
+        "proj-1234",
+        "mttr",
+        "auth_service",
+        "v2",
+    ]
+    assert lexical.selective_ids("What is the MTTR doc?") == ["b"]
+    assert lexical.selective_ids("What is the doc?") is None  # No exact terms
+    assert lexical.selective_ids("PROJ-9999") is None  # In no chunk
+    assert lexical.selective_ids("PROJ-1234 MTTR") is None  # Not together
+    assert lexical.selective_ids("MTTR", max_chunks=0) is None
+    # Numbers, dates and counts are not exact terms, even in few chunks
+    lexical.add(["e"], ["Planned the next 2 weeks"], [{"created_at": 400.0}])
+    assert exact_terms("What did I do in the last 2 weeks, since 2024-05-01?") == []
+    assert exact_terms("The 3rd meeting at 10am in Q3") == []
+    assert lexical.selective_ids("last 2 weeks") is None
+
+
+def test_reciprocal_rank_fusion():
+    assert reciprocal_rank_fusion([["a", "b", "c"], ["c", "d"]]) == [
+        "c",
+        "a",
+        "b",
+        "d",
+    ]
+    assert reciprocal_rank_fusion([["a", "b"], ["b", "a"]]) == ["a", "b"]
@@ -0,0 +1,81 @@
+import asyncio
+import threading
+import time
+
+from lang_model import LangModel
+from map_reduce import MapReduceSummarizer, estimate_tokens, partition
+
+
+class SummarizingLangModel(LangModel):
+    """Summarizes a prompt to a short, fixed-size line and tracks concurrency."""
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.prompts = []
+        self.active = 0
+        self.max_active = 0
+        self._lock = threading.Lock()
+
+    def _enter(self, prompt):
+        with self._lock:
+            self.prompts.append(prompt)
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+
+    def _exit(self):
+        with self._lock:
+            self.active -= 1
+        return f"- summary {len(self.prompts)}"
+
+    def generate(self, prompt, **kwargs):
+        self._enter(prompt)
+        time.sleep(self.delay)
+        return self._exit()
+
+    async def agenerate(self, prompt, **kwargs):
+        self._enter(prompt)
+        await asyncio.sleep(self.delay)
+        return self._exit()
+
+
+def test_partition_respects_token_budget():
+    texts = ["a" * 40, "b" * 40, "c" * 40, "d" * 400]
+    groups = partition(texts, max_tokens=25)
+    assert groups == [["a" * 40, "b" * 40], ["c" * 40], ["d" * 400]]
+    assert all(sum(estimate_tokens(t) for t in g) <= 25 for g in groups if len(g) > 1)
+
+
+def test_condense_maps_concurrently_and_reports_progress():
+    lang_model = SummarizingLangModel(delay=0.05)
+    progress = []
+    summarizer = MapReduceSummarizer(
+        lang_model,
+        max_group_tokens=12,
+        fan_out=3,
+        progress=lambda *args: progress.append(args),
+    )
+    texts = [f"note {i} " + "x" * 80 for i in range(9)]
+    summaries = summarizer.condense("What did I do?", texts)
+
+    # Reduced until the summaries fit in one group
+    assert len(partition(summaries, 12)) == 1
+    map_prompts = [p for p in lang_model.prompts if "Notes:" in p]
+    assert len(map_prompts) == 9
+    assert lang_model.max_active == 3
+    assert [p for p in progress if p[0] == "map"][-1] == ("map", 9, 9)
+    assert progress[-1][0] == "reduce"
+
+
+def test_acondense_bounds_fan_out():
+    lang_model = SummarizingLangModel(delay=0.01)
+    summarizer = MapReduceSummarizer(lang_model, max_group_tokens=12, fan_out=2)
+    texts = [f"note {i} " + "x" * 80 for i in range(6)]
+    summaries = asyncio.run(summarizer.acondense("What did I do?", texts))
+    assert len(partition(summaries, 12)) == 1
+    assert lang_model.max_active == 2
+
+
+def test_condense_empty():
+    lang_model = SummarizingLangModel()
+    assert MapReduceSummarizer(lang_model).condense("q", []) == []
+    assert lang_model.prompts == []
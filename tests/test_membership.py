@@ -0,0 +1,53 @@
+from membership import FileRecord, MembershipStore
+
+
+def record(file, file_hash="h"):
+    return FileRecord(file=file, file_hash=file_hash, modified_at=1.0, file_size=10)
+
+
+def test_shared_chunks_are_orphaned_only_when_unreferenced():
+    store = MembershipStore()
+    assert store.replace_file(record("a.md"), ["x", "y"]) == []
+    assert store.replace_file(record("b.md"), ["y", "z"]) == []
+    assert store.referenced(["x", "y", "w"]) == {"x", "y"}
+    assert store.files_of("y") == ["a.md", "b.md"]
+
+    # a.md no longer contains x, which nothing else refers to
+    assert store.replace_file(record("a.md", "h2"), ["y"]) == ["x"]
+    assert store.chunk_ids("a.md") == ["y"]
+    assert store.get_file("a.md").file_hash == "h2"
+
+    assert store.remove_file("a.md") == []  # b.md still has y
+    assert store.remove_file("b.md") == ["y", "z"]
+    assert store.get_file("b.md") is None
+
+
+def test_untrusted_stat_never_matches():
+    store = MembershipStore()
+    store.replace_file(record("a.md"), [])
+    assert store.is_file_unchanged("a.md", 1.0, 10)
+    assert not store.is_file_unchanged("a.md", 2.0, 10)
+    store.touch_file("a.md", 2.0, -1)
+    assert not store.is_file_unchanged("a.md", 2.0, -1)
+
+
+def test_membership_renames_and_removes_files_in_bulk():
+    store = MembershipStore()
+    store.replace_file(FileRecord("/v/a.md", "h1", 1.0, 10), ["x", "y"])
+    store.replace_file(FileRecord("/v/b.md", "h2", 1.0, 20), ["y", "z"])
+    store.replace_file(FileRecord("/w/c.md", "h3", 1.0, 10), ["z"])
+    store.replace_file(FileRecord("/w/d.md", "h4", 1.0, -1), [])
+    assert [r.file for r in store.files("/v/")] == ["/v/a.md", "/v/b.md"]
+    assert [r.file for r in store.files_of_size(10)] == [
+        "/v/a.md",
+        "/w/c.md",
+        "/w/d.md",
+    ]
+
+    store.rename_file("/v/a.md", FileRecord("/v/sub/a.md", "h1", 2.0, 10))
+    assert store.get_file("/v/a.md") is None
+    assert store.chunk_ids("/v/sub/a.md") == ["x", "y"]
+    assert store.get_file("/v/sub/a.md").modified_at == 2.0
+
+    assert store.remove_files(["/v/sub/a.md", "/v/b.md"]) == ["x", "y"]
+    assert [r.file for r in store.files()] == ["/w/c.md", "/w/d.md"]
@@ -1,7 +1,73 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
 import pytest
+
 from ollama import OllamaLangModel
 
 
+@pytest.fixture
+def fake_ollama():
+    """A fake Ollama server that loads a model on /api/generate."""
+    state = {"loaded": [], "preloads": []}
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            state["preloads"].append(body)
+            state["loaded"].append(body["model"] + ":latest")
+            self._reply({"model": body["model"], "done": True})
+
+        def do_GET(self):
+            self._reply({"models": [{"name": name} for name in state["loaded"]]})
+
+        def _reply(self, data):
+            body = json.dumps(data).encode()
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}", state
+    server.shutdown()
+
+
+def test_preload_makes_model_resident(fake_ollama):
+    url, state = fake_ollama
+    lang_model = OllamaLangModel(url=url, model="llama2", keep_alive="1h")
+    assert not lang_model.is_resident()
+    assert lang_model.preload()
+    assert lang_model.is_resident()
+    assert state["preloads"] == [{"model": "llama2", "keep_alive": "1h"}]
+    assert lang_model.status()["resident"]
+
+
+def test_keep_warm_pings_periodically(fake_ollama):
+    url, state = fake_ollama
+    lang_model = OllamaLangModel(url=url)
+    lang_model.start_keep_warm(interval=0.05)
+    time.sleep(0.3)
+    lang_model.stop_keep_warm()
+    assert len(state["preloads"]) >= 2
+    assert lang_model.last_preloaded is not None
+
+
+def test_preload_reports_unreachable_server():
+    lang_model = OllamaLangModel(url="http://127.0.0.1:9")
+    assert not lang_model.preload()
+    assert not lang_model.is_resident()
+
+
 @pytest.mark.integration
 def test_ollama_lang_model_hello(ollama_container):
     lang_model = OllamaLangModel()
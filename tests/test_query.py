@@ -1,5 +1,21 @@
+import asyncio
+from datetime import datetime
+
+import pytest
+
+from deadline import Deadline, DeadlineExceeded
 from lang_model import LangModel
-from query import QueryEngine, QueryResult, ContextChunk
+from lexical import LexicalIndex
+from map_reduce import MapReduceSummarizer
+from query import (
+    CAPPED_GENERATION_TOKENS,
+    REDUCED_CONTEXT,
+    SKIPPED_MAP_REDUCE,
+    SKIPPED_TIME_EXTRACTION,
+    ContextChunk,
+    QueryEngine,
+    QueryResult,
+)
 
 
 class DummyEmbedder:
@@ -24,7 +40,7 @@ class DummyVectorStore:
 
 
 class DummyLangModel(LangModel):
-    def generate(self, prompt: str) -> str:
+    def generate(self, prompt: str, **kwargs) -> str:
         return "dummy answer"
 
 
@@ -86,3 +102,367 @@ def test_query_handles_missing_fields():
     )
     assert actual == expected
     assert actual.answer
+
+
+def test_aquery_basic():
+    engine = QueryEngine(
+        embedder=DummyEmbedder(),
+        vector_store=DummyVectorStore(),
+        lang_model=DummyLangModel(),
+        max_context=2,
+    )
+    actual = asyncio.run(engine.aquery("test"))
+    expected = QueryResult(
+        answer="dummy answer",
+        context=[
+            ContextChunk(id="id_0", text="doc_0", metadata={"meta": 0}, distance=0.0),
+            ContextChunk(id="id_1", text="doc_1", metadata={"meta": 1}, distance=1.0),
+        ],
+    )
+    assert actual == expected
+
+
+def test_aquery_uses_async_lang_model():
+    class AsyncOnlyLangModel(DummyLangModel):
+        def generate(self, prompt: str, **kwargs) -> str:
+            raise AssertionError("sync generate should not be called")
+
+        async def agenerate(self, prompt: str, **kwargs) -> str:
+            return "async answer"
+
+    engine = QueryEngine(
+        embedder=DummyEmbedder(),
+        vector_store=DummyVectorStore(),
+        lang_model=AsyncOnlyLangModel(),
+        max_context=1,
+    )
+    actual = asyncio.run(engine.aquery("test"))
+    assert actual.answer == "async answer"
+
+
+def test_aquery_coalesces_identical_queries():
+    class CountingLangModel(DummyLangModel):
+        def __init__(self):
+            self.calls = 0
+
+        async def agenerate(self, prompt: str, **kwargs) -> str:
+            self.calls += 1
+            await asyncio.sleep(0.05)
+            return "dummy answer"
+
+    lang_model = CountingLangModel()
+    engine = QueryEngine(
+        embedder=DummyEmbedder(),
+        vector_store=DummyVectorStore(),
+        lang_model=lang_model,
+        max_context=1,
+        with_time_aware_filtering=False,
+    )
+
+    async def run():
+        return await asyncio.gather(
+            engine.aquery("What did I do?"),
+            engine.aquery("what did  I do?"),
+            engine.aquery("Something else"),
+        )
+
+    results = asyncio.run(run())
+    assert all(r.answer == "dummy answer" for r in results)
+    assert lang_model.calls == 2
+
+
+class RecordingLangModel(DummyLangModel):
+    def __init__(self):
+        self.calls = []
+
+    def generate(self, prompt: str, **kwargs) -> str:
+        self.calls.append(kwargs)
+        return '{"start": null, "end": null}'
+
+
+def test_query_without_deadline_is_not_degraded():
+    lang_model = RecordingLangModel()
+    engine = QueryEngine(
+        embedder=DummyEmbedder(),
+        vector_store=DummyVectorStore(),
+        lang_model=lang_model,
+        max_context=4,
+    )
+    actual = engine.query("test", deadline=Deadline(60))
+    assert actual.degradations == []
+    assert len(actual.context) == 4
+    assert len(lang_model.calls) == 2  # time range + answer
+    assert lang_model.calls[-1]["max_tokens"] is None
+
+
+def test_query_degrades_when_short_on_time():
+    lang_model = RecordingLangModel()
+    engine = QueryEngine(
+        embedder=DummyEmbedder(),
+        vector_store=DummyVectorStore(),
+        lang_model=lang_model,
+        max_context=4,
+    )
+    actual = engine.query("test", deadline=Deadline(5))
+    assert actual.degradations == [
+        SKIPPED_TIME_EXTRACTION,
+        REDUCED_CONTEXT,
+        CAPPED_GENERATION_TOKENS,
+    ]
+    assert len(actual.context) == 2
+    assert len(lang_model.calls) == 1  # answer only
+    assert lang_model.calls[0]["max_tokens"] == QueryEngine.CAPPED_MAX_TOKENS
+    assert lang_model.calls[0]["timeout"] <= 5
+
+
+def test_aquery_deadline_exceeded_during_generation():
+    class SlowLangModel(DummyLangModel):
+        async def agenerate(self, prompt: str, **kwargs) -> str:
+            await asyncio.sleep(5)
+            return "too late"
+
+    engine = QueryEngine(
+        embedder=DummyEmbedder(),
+        vector_store=DummyVectorStore(),
+        lang_model=SlowLangModel(),
+        with_time_aware_filtering=False,
+    )
+    with pytest.raises(DeadlineExceeded):
+        asyncio.run(engine.aquery("test", deadline=Deadline(0.1)))
+
+
+class WideRangeVectorStore(DummyVectorStore):
+    def get_by_time_range(self, start_time=None, end_time=None, **kwargs):
+        n = 20
+        return {
+            "ids": [f"id_{i}" for i in range(n)],
+            "documents": [f"note {i}" for i in range(n)],
+            "metadatas": [{"created_at": n - i} for i in range(n)],
+        }
+
+
+def wide_range_engine(lang_model):
+    from time_range import TimeRange
+
+    engine = QueryEngine(
+        embedder=DummyEmbedder(),
+        vector_store=WideRangeVectorStore(),
+        lang_model=lang_model,
+        max_context=5,
+        map_reducer=MapReduceSummarizer(lang_model, max_group_tokens=10),
+    )
+    time_range = TimeRange(start=datetime(2025, 4, 1), end=datetime(2025, 4, 30))
+    engine.time_range_extractor.extract = lambda q, timeout=None: time_range
+
+    async def aextract(q, timeout=None):
+        return time_range
+
+    engine.time_range_extractor.aextract = aextract
+    return engine
+
+
+def test_query_map_reduces_wide_time_range():
+    class RecordingLangModel(LangModel):
+        def __init__(self):
+            self.prompts = []
+
+        def generate(self, prompt, **kwargs):
+            self.prompts.append(prompt)
+            return f"partial {len(self.prompts)}"
+
+    lang_model = RecordingLangModel()
+    result = wide_range_engine(lang_model).query("What did I do in April?")
+
+    # All chunks in the range are used, oldest first
+    assert len(result.context) == 20
+    assert result.context[0].id == "id_19"
+    assert any("note 7" in p for p in lang_model.prompts[:-1])
+    assert "note 7" not in lang_model.prompts[-1]  # Final prompt sees summaries
+    assert result.answer == f"partial {len(lang_model.prompts)}"
+
+    result = asyncio.run(wide_range_engine(lang_model).aquery("What did I do?"))
+    assert len(result.context) == 20
+
+
+def test_query_skips_map_reduce_when_short_on_time():
+    result = wide_range_engine(DummyLangModel()).query(
+        "What did I do in April?", deadline=Deadline(25)
+    )
+    assert SKIPPED_MAP_REDUCE in result.degradations
+    assert len(result.context) == 5
+
+
+class TopicEmbedder:
+    """Embeds texts onto one axis per topic keyword."""
+
+    TOPICS = ("bug", "hiring")
+
+    def embed(self, texts):
+        return [
+            [1.0 if topic in t.lower() else 0.0 for topic in self.TOPICS] + [0.1]
+            for t in texts
+        ]
+
+
+class ChatLangModel(LangModel):
+    def __init__(self):
+        self.chats = []
+
+    def generate(self, prompt, **kwargs):
+        raise AssertionError("chat turns should not call generate")
+
+    def chat(self, messages, **kwargs):
+        self.chats.append(messages)
+        return f"answer {len(self.chats)}"
+
+
+def chat_engine(lang_model, vector_store):
+    from time_range import TimeRange
+
+    engine = QueryEngine(
+        embedder=TopicEmbedder(),
+        vector_store=vector_store,
+        lang_model=lang_model,
+        max_context=2,
+    )
+    extracted = []
+
+    def extract(query, timeout=None):
+        extracted.append(query)
+        if "tuesday" in query.lower():
+            return TimeRange(start=datetime(2025, 5, 6), end=datetime(2025, 5, 6))
+        return TimeRange(start=datetime(2025, 5, 5), end=datetime(2025, 5, 5))
+
+    engine.time_range_extractor.extract = extract
+    return engine, extracted
+
+
+class CountingVectorStore(DummyVectorStore):
+    def query(self, embedding, max_results=5, **kwargs):
+        self.queries.append(kwargs)
+        return super().query(embedding, max_results, **kwargs)
+
+
+def test_chat_reuses_context_for_follow_ups():
+    from chat_session import ChatSession
+
+    lang_model = ChatLangModel()
+    vector_store = CountingVectorStore()
+    engine, extracted = chat_engine(lang_model, vector_store)
+    session = ChatSession(id="s1")
+
+    first = engine.chat(session, "What bug did I fix on Monday?")
+    assert not first.reused_context
+    assert len(vector_store.queries) == 1
+
+    # Same topic, no time mentioned: no extraction and no retrieval
+    follow_up = engine.chat(session, "Which bug was the hardest?")
+    assert follow_up.reused_context
+    assert extracted == ["What bug did I fix on Monday?"]
+    assert len(vector_store.queries) == 1
+    # The prompt prefix is unchanged and the history is sent along
+    first_messages, second_messages = lang_model.chats
+    assert second_messages[0] == first_messages[0]
+    assert second_messages[1:3] == [
+        {"role": "user", "content": "What bug did I fix on Monday?"},
+        {"role": "assistant", "content": "answer 1"},
+    ]
+
+    # A new time range re-retrieves for the same topic
+    changed_range = engine.chat(session, "And which bug on Tuesday?")
+    assert not changed_range.reused_context
+    assert len(vector_store.queries) == 2
+    assert vector_store.queries[-1]["start_time"] == datetime(2025, 5, 6).timestamp()
+
+    # A new topic re-retrieves for the session's time range
+    changed_topic = engine.chat(session, "How is hiring going?")
+    assert not changed_topic.reused_context
+    assert len(vector_store.queries) == 3
+    assert session.topic_query == "How is hiring going?"
+    assert len(session.messages) == 8
+
+
+def test_achat_reuses_context_for_follow_ups():
+    from chat_session import ChatSession
+
+    class AsyncChatLangModel(ChatLangModel):
+        async def achat(self, messages, **kwargs):
+            return self.chat(messages, **kwargs)
+
+    lang_model = AsyncChatLangModel()
+    vector_store = CountingVectorStore()
+    engine, _ = chat_engine(lang_model, vector_store)
+
+    async def aextract(query, timeout=None):
+        return engine.time_range_extractor.extract(query, timeout)
+
+    engine.time_range_extractor.aextract = aextract
+    session = ChatSession(id="s1")
+
+    async def conversation():
+        await engine.achat(session, "What bug did I fix on Monday?")
+        return await engine.achat(session, "Which bug was the hardest?")
+
+    result = asyncio.run(conversation())
+    assert result.reused_context
+    assert result.answer == "answer 2"
+    assert len(vector_store.queries) == 1
+
+
+class LexicalVectorStore(DummyVectorStore):
+    """Vector matches id_0..., and the documents of every chunk by id."""
+
+    def query(self, embedding, max_results=5, ids=None, **kwargs):
+        self.queries.append(ids)
+        if ids is not None:
+            ids = sorted(ids)[:max_results]
+        else:
+            ids = [f"id_{i}" for i in range(max_results)]
+        return {
+            "ids": [ids],
+            "documents": [[f"doc {i}" for i in ids]],
+            "metadatas": [[{} for _ in ids]],
+            "distances": [[0.5 for _ in ids]],
+        }
+
+    def get_by_ids(self, ids, include=None):
+        return {
+            "ids": ids,
+            "documents": [f"doc {i}" for i in ids],
+            "metadatas": [{} for _ in ids],
+        }
+
+
+def test_find_similar_context_fuses_lexical_matches():
+    lexical = LexicalIndex()
+    lexical.add(
+        ["id_1", "ticket", "other"],
+        ["notes on the doc", "PROJ-1234 fixed", "PROJ-1234 and the doc"],
+        [{"event_date": 1.0}] * 3,
+    )
+    vector_store = LexicalVectorStore()
+    engine = QueryEngine(
+        embedder=DummyEmbedder(),
+        vector_store=vector_store,
+        lang_model=DummyLangModel(),
+        lexical=lexical,
+    )
+    # Ranked by both searches, id_1 comes first; the lexical-only match
+    # is fetched, without a distance
+    context = engine._find_similar_context("the doc", max_results=3)
+    assert [c.id for c in context] == ["id_1", "id_0", "other"]
+    assert context[2].text == "doc other" and context[2].distance is None
+    assert vector_store.queries == [None]
+
+    # The chunks naming something few chunks mention are ranked up, but the
+    # full vector search still runs
+    context = engine._find_similar_context("status of PROJ-1234?", max_results=3)
+    assert vector_store.queries[-2] is None
+    assert sorted(vector_store.queries[-1]) == ["other", "ticket"]
+    assert {c.id for c in context[:2]} == {"other", "ticket"}
+    assert context[2].id == "id_0"
+
+    # A number is not an exact term, so does not single out chunks
+    lexical.add(["weeks"], ["the last 2 weeks"], [{"event_date": 1.0}])
+    context = engine._find_similar_context("the last 2 weeks", max_results=3)
+    assert vector_store.queries[-1] is None and len(context) == 3
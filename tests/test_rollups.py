@@ -0,0 +1,204 @@
+import uuid
+from datetime import date, datetime
+
+import chromadb
+
+from indexer import Indexer
+from lang_model import LangModel
+from query import QueryEngine
+from rollups import DAY, WEEK, RollupBuilder, RollupStore, rollup_context
+from time_range import TimeRange
+from vector_store import Metadata, VectorStore
+
+
+class CountingLangModel(LangModel):
+    def __init__(self):
+        self.prompts = []
+
+    def generate(self, prompt, **kwargs):
+        self.prompts.append(prompt)
+        return f"summary {len(self.prompts)}"
+
+
+def make_store():
+    return VectorStore(
+        collection_name=f"rollups_{uuid.uuid4().hex}", chroma_client=chromadb.Client()
+    )
+
+
+def add_note(store, chunk_id, text, when):
+    store.add(
+        [chunk_id],
+        [[0.1, 0.2, 0.3]],
+        [text],
+        [Metadata(file=f"{chunk_id}.md", text=text, created_at=when, modified_at=when)],
+    )
+
+
+def test_build_day_summarizes_and_reuses():
+    store = make_store()
+    add_note(store, "a", "Fixed the login bug", datetime(2025, 5, 5, 10))
+    add_note(store, "b", "Reviewed the MTTR doc", datetime(2025, 5, 5, 15))
+    add_note(store, "c", "Other day", datetime(2025, 5, 6, 9))
+    lang_model = CountingLangModel()
+    builder = RollupBuilder(store, lang_model, RollupStore())
+
+    rollup = builder.build_day(date(2025, 5, 5))
+    assert rollup.summary == "summary 1"
+    assert "Fixed the login bug" in lang_model.prompts[0]
+    assert "Other day" not in lang_model.prompts[0]
+
+    # Unchanged chunks reuse the stored summary
+    builder.invalidate([date(2025, 5, 5)])
+    builder.build_stale()
+    assert builder.store.get(DAY, date(2025, 5, 5)).summary == "summary 1"
+
+    # A changed chunk invalidates the day
+    add_note(store, "d", "Shipped the button", datetime(2025, 5, 5, 17))
+    builder.invalidate([date(2025, 5, 5)])
+    builder.build_day(date(2025, 5, 5))
+    assert builder.store.get(DAY, date(2025, 5, 5)).summary.startswith("summary")
+    assert "Shipped the button" in lang_model.prompts[-1]
+
+
+def test_invalidation_during_build_keeps_rollup_stale():
+    store = RollupStore()
+    store.invalidate([date(2025, 5, 5)])
+    rollup = store.get(DAY, date(2025, 5, 5))
+    store.invalidate([date(2025, 5, 5)])  # Changed again while building
+    rollup.summary = "old summary"
+    store.put(rollup)
+    assert store.get(DAY, date(2025, 5, 5)).stale
+
+
+def test_rollup_context_uses_weeks_and_days():
+    store = make_store()
+    # Monday 2025-05-05 through Wednesday 2025-05-14
+    for day in [5, 6, 9, 13]:
+        add_note(store, f"n{day}", f"Work on day {day}", datetime(2025, 5, day, 12))
+    builder = RollupBuilder(store, CountingLangModel(), RollupStore())
+    assert rollup_context(builder.store, date(2025, 5, 5), date(2025, 5, 14)) is None
+
+    builder.backfill()
+    assert rollup_context(builder.store, date(2025, 5, 5), date(2025, 5, 14)) is None
+    builder.build_stale()
+    covering = rollup_context(builder.store, date(2025, 5, 5), date(2025, 5, 14))
+    assert [(r.period, r.start) for r in covering] == [
+        (WEEK, date(2025, 5, 5)),
+        (DAY, date(2025, 5, 13)),
+    ]
+
+
+def test_backfill_reads_days_from_the_catalog(monkeypatch):
+    store = make_store()
+    add_note(store, "a", "Fixed the login bug", datetime(2025, 5, 5, 10))
+    add_note(store, "b", "Shipped the button", datetime(2025, 5, 5, 17))
+    add_note(store, "c", "Other day", datetime(2025, 5, 7, 9))
+
+    def scan():
+        raise AssertionError("backfill should not read every chunk")
+
+    monkeypatch.setattr(store, "get_all_metadata", scan)
+    builder = RollupBuilder(store, CountingLangModel(), RollupStore())
+    builder.backfill()
+    assert builder.store.is_backfilled()
+    assert {start for period, start in builder.store.stale() if period == DAY} == {
+        date(2025, 5, 5),
+        date(2025, 5, 7),
+    }
+
+
+def test_indexer_invalidates_rollups(tmp_path):
+    class DummyEmbedder:
+        def embed(self, texts):
+            return [[float(len(t))] for t in texts]
+
+    class DummyChunker:
+        def chunk_file(self, file_path):
+            with open(file_path) as f:
+                return [line.strip() for line in f if line.strip()]
+
+    file_path = tmp_path / "note.txt"
+    file_path.write_text("alpha\nbeta\n")
+    store = make_store()
+    builder = RollupBuilder(store, CountingLangModel(), RollupStore())
+    indexer = Indexer(
+        embedder=DummyEmbedder(),
+        chunker=DummyChunker(),
+        vector_store=store,
+        rollups=builder,
+    )
+    indexer.index_dir(str(tmp_path))
+    created = datetime.fromtimestamp(file_path.stat().st_ctime).date()
+    assert (DAY, created) in builder.store.stale()
+    builder.build_stale()
+    assert builder.store.stale() == []
+
+
+def test_query_engine_answers_range_from_rollups():
+    class DummyEmbedder:
+        def embed(self, texts):
+            raise AssertionError("raw retrieval should not be needed")
+
+    store = make_store()
+    add_note(store, "a", "Fixed the login bug", datetime(2025, 5, 5, 10))
+    builder = RollupBuilder(store, CountingLangModel(), RollupStore())
+    builder.backfill()
+    builder.build_stale()
+    engine = QueryEngine(
+        embedder=DummyEmbedder(),
+        vector_store=store,
+        lang_model=CountingLangModel(),
+        rollups=builder.store,
+    )
+    context = engine._retrieve_context(
+        "What did I do?",
+        TimeRange(start=datetime(2025, 5, 5), end=datetime(2025, 5, 11, 23, 59)),
+        max_results=10,
+    )
+    assert [c.id for c in context] == ["rollup::week::2025-05-05"]
+
+
+def test_query_engine_does_not_map_reduce_rollups():
+    import asyncio
+
+    class DummyEmbedder:
+        def embed(self, texts):
+            raise AssertionError("raw retrieval should not be needed")
+
+    class FailingMapReducer:
+        def condense(self, *args, **kwargs):
+            raise AssertionError("rollups are summaries already")
+
+        acondense = condense
+
+    store = make_store()
+    # Tuesday through Friday: four daily rollups
+    for day in [6, 7, 8, 9]:
+        add_note(store, f"n{day}", f"Work on day {day}", datetime(2025, 5, day, 12))
+    builder = RollupBuilder(store, CountingLangModel(), RollupStore())
+    builder.backfill()
+    builder.build_stale()
+    lang_model = CountingLangModel()
+    engine = QueryEngine(
+        embedder=DummyEmbedder(),
+        vector_store=store,
+        lang_model=lang_model,
+        max_context=2,
+        rollups=builder.store,
+        map_reducer=FailingMapReducer(),
+        map_reduce_min_days=3,
+    )
+    time_range = TimeRange(start=datetime(2025, 5, 6), end=datetime(2025, 5, 9, 23))
+    engine.time_range_extractor.extract = lambda q, timeout=None: time_range
+
+    async def aextract(q, timeout=None):
+        return time_range
+
+    engine.time_range_extractor.aextract = aextract
+    for result in [
+        engine.query("What did I do?"),
+        asyncio.run(engine.aquery("What did I do this week?")),
+    ]:
+        assert len(result.context) == 4
+        assert "Summary of" in lang_model.prompts[-1]
@@ -0,0 +1,80 @@
+import os
+
+from scanner import Scanner, is_ignored, parse_ignore_file
+
+
+def _write(root, rel_path, content="x"):
+    path = root / rel_path
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(content)
+
+
+def _scan(root, **kwargs):
+    return sorted(
+        os.path.relpath(entry.path, root).replace(os.sep, "/")
+        for entry in Scanner(**kwargs).scan(str(root))
+    )
+
+
+def test_scanner_filters_extensions_and_skips_tool_dirs(tmp_path):
+    for rel_path in [
+        "a.md",
+        "b.TXT",
+        "c.py",
+        "notes/d.md",
+        "notes/deep/e.md",
+        ".git/f.md",
+        ".obsidian/g.md",
+        "node_modules/pkg/h.md",
+        "sub/.trash/i.md",
+    ]:
+        _write(tmp_path, rel_path)
+    assert _scan(tmp_path, file_exts=[".md", "txt"]) == [
+        "a.md",
+        "b.TXT",
+        "notes/d.md",
+        "notes/deep/e.md",
+    ]
+
+
+def test_scanner_yields_stat_and_skips_large_files(tmp_path):
+    _write(tmp_path, "small.md", "x" * 10)
+    _write(tmp_path, "large.md", "x" * 100)
+    entries = list(Scanner(max_file_size=50).scan(str(tmp_path)))
+    assert [os.path.basename(e.path) for e in entries] == ["small.md"]
+    assert entries[0].stat.st_size == 10
+
+
+def test_scanner_honours_ignore_files(tmp_path):
+    _write(tmp_path, ".gitignore", "# drafts\n*.tmp\n/build/\nlogs\n!keep.tmp\n")
+    _write(tmp_path, "notes/.whisperignore", "private/*.md\n")
+    for rel_path in [
+        "a.md",
+        "a.tmp",
+        "keep.tmp",
+        "build/b.md",
+        "src/build/c.md",
+        "logs/d.md",
+        "notes/logs",
+        "notes/e.md",
+        "notes/private/f.md",
+        "private/g.md",
+    ]:
+        _write(tmp_path, rel_path)
+    assert _scan(tmp_path, file_exts=[".md", ".tmp"]) == [
+        "a.md",
+        "keep.tmp",
+        "notes/e.md",
+        "private/g.md",
+        "src/build/c.md",
+    ]
+
+
+def test_ignore_rules_double_star(tmp_path):
+    (tmp_path / ".gitignore").write_text("**/archive/**/*.md\ndocs/**\n")
+    rules = parse_ignore_file(str(tmp_path / ".gitignore"))
+    assert is_ignored(rules, "archive/2023/a.md", "a.md", False)
+    assert is_ignored(rules, "x/archive/a.md", "a.md", False)
+    assert not is_ignored(rules, "archive.md", "archive.md", False)
+    assert is_ignored(rules, "docs/a/b.md", "b.md", False)
+    assert not is_ignored(rules, "docs", "docs", True)
@@ -0,0 +1,96 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from singleflight import SingleFlight, normalize_text
+
+
+def test_do_coalesces_concurrent_calls():
+    flight = SingleFlight()
+    calls = []
+    started = threading.Event()
+
+    def slow():
+        calls.append(1)
+        started.set()
+        time.sleep(0.2)
+        return "result"
+
+    with ThreadPoolExecutor(max_workers=5) as pool:
+        first = pool.submit(flight.do, "key", slow)
+        started.wait()
+        others = [pool.submit(flight.do, "key", slow) for _ in range(4)]
+        results = [first.result()] + [f.result() for f in others]
+    assert results == ["result"] * 5
+    assert len(calls) == 1
+    assert flight.in_flight() == 0
+
+
+def test_do_runs_again_after_completion():
+    flight = SingleFlight()
+    calls = []
+    flight.do("key", lambda: calls.append(1))
+    flight.do("key", lambda: calls.append(1))
+    assert len(calls) == 2
+
+
+def test_do_shares_exceptions():
+    flight = SingleFlight()
+    started = threading.Event()
+
+    def failing():
+        started.set()
+        time.sleep(0.1)
+        raise ValueError("boom")
+
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        first = pool.submit(flight.do, "key", failing)
+        started.wait()
+        second = pool.submit(flight.do, "key", failing)
+        with pytest.raises(ValueError):
+            first.result()
+        with pytest.raises(ValueError):
+            second.result()
+
+
+def test_ado_coalesces_concurrent_calls():
+    flight = SingleFlight()
+    calls = []
+
+    async def slow():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return "result"
+
+    async def run():
+        return await asyncio.gather(*(flight.ado("key", slow) for _ in range(10)))
+
+    assert asyncio.run(run()) == ["result"] * 10
+    assert len(calls) == 1
+    assert flight.in_flight() == 0
+
+
+def test_ado_cancelled_waiter_does_not_cancel_others():
+    flight = SingleFlight()
+
+    async def slow():
+        await asyncio.sleep(0.05)
+        return "result"
+
+    async def run():
+        first = asyncio.ensure_future(flight.ado("key", slow))
+        second = asyncio.ensure_future(flight.ado("key", slow))
+        await asyncio.sleep(0)
+        first.cancel()
+        return await second
+
+    assert asyncio.run(run()) == "result"
+
+
+def test_normalize_text():
+    assert (
+        normalize_text("  What did I   do\nYesterday? ") == "what did i do yesterday?"
+    )
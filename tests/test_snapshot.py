@@ -0,0 +1,125 @@
+import chromadb
+import numpy as np
+import pytest
+
+from dedup import FingerprintIndex
+from indexer import Indexer
+from membership import MembershipStore
+from snapshot import SnapshotError, export_snapshot, import_snapshot, read_manifest
+from vector_store import VectorStore
+
+
+class CountingEmbedder:
+    def __init__(self):
+        self.texts = []
+
+    def embed(self, texts):
+        self.texts.extend(texts)
+        return [[float(len(t)), 0.5, -1.25] for t in texts]
+
+
+def _store(name):
+    return VectorStore(collection_name=name, chroma_client=chromadb.Client())
+
+
+def test_snapshot_round_trip(tmp_path):
+    notes = tmp_path / "notes"
+    notes.mkdir()
+    (notes / "2024-05-01.md").write_text("# Plan\n\nShip the importer.\n")
+    (notes / "2024-05-02.md").write_text("# Notes\n\nThe demo went well.\n")
+    source = Indexer(embedder=CountingEmbedder(), vector_store=_store("snap_source"))
+    source.index_dir(str(notes))
+    path = str(tmp_path / "notes.snapshot")
+
+    info = export_snapshot(
+        source.vector_store, path, source.membership, source.fingerprints
+    )
+    assert info.count == source.vector_store.collection.count()
+    assert info.dimension == 3 and info.file_count == 2
+    manifest = read_manifest(path)
+    assert manifest["embedding_model"] == "all-MiniLM-L6-v2"
+    assert manifest["sections"]["embeddings"]["offset"] % 64 == 0
+
+    target = _store("snap_target")
+    membership, fingerprints = MembershipStore(), FingerprintIndex()
+    imported = import_snapshot(target, path, membership, fingerprints)
+    assert imported.count == info.count
+
+    expected = source.vector_store.collection.get(
+        include=["embeddings", "documents", "metadatas"]
+    )
+    actual = target.collection.get(
+        ids=expected["ids"], include=["embeddings", "documents", "metadatas"]
+    )
+    assert actual["ids"] == expected["ids"]
+    assert actual["documents"] == expected["documents"]
+    assert actual["metadatas"] == expected["metadatas"]
+    # Cosine collections keep vectors normalized, so read back within rounding
+    np.testing.assert_allclose(actual["embeddings"], expected["embeddings"], rtol=1e-6)
+    assert len(fingerprints) == len(source.fingerprints)
+
+    # Indexing the same notes against the import embeds nothing
+    embedder = CountingEmbedder()
+    restored = Indexer(
+        embedder=embedder,
+        vector_store=target,
+        membership=membership,
+        fingerprints=fingerprints,
+    )
+    metrics = restored.index_dir(str(notes))
+    assert metrics.file_count == 0 and embedder.texts == []
+
+    # Importing again leaves the collection as it is
+    import_snapshot(target, path, membership, fingerprints)
+    assert target.collection.count() == info.count
+
+
+def test_snapshot_defaults_to_the_collections_sidecars(tmp_path, monkeypatch):
+    from lexical import LexicalIndex
+
+    closed = []
+    for cls in (FingerprintIndex, LexicalIndex):
+        monkeypatch.setattr(
+            cls, "close", lambda self, close=cls.close: closed.append(close(self))
+        )
+    notes = tmp_path / "notes"
+    notes.mkdir()
+    (notes / "2024-05-01.md").write_text("# Plan\n\nShip the importer.\n")
+    source = Indexer(embedder=CountingEmbedder(), vector_store=_store("snap_own"))
+    source.index_dir(str(notes))
+    path = str(tmp_path / "notes.snapshot")
+    closed.clear()
+
+    assert export_snapshot(source.vector_store, path).file_count == 1
+    assert len(closed) == 1  # The fingerprint index it opened
+    target = _store("snap_own_copy")
+    import_snapshot(target, path)
+    assert len(closed) == 3  # and the import's fingerprint and lexical indexes
+
+    # The import went to the membership the collection's Indexers share
+    embedder = CountingEmbedder()
+    metrics = Indexer(embedder=embedder, vector_store=target).index_dir(str(notes))
+    assert metrics.file_count == 0 and embedder.texts == []
+
+
+def test_snapshot_import_checks_embedding_model(tmp_path):
+    store = _store("snap_model")
+    store.add(["a"], [[1.0, 2.0]], ["a"], [{"file": "a.md"}])
+    path = str(tmp_path / "a.snapshot")
+    export_snapshot(store, path, MembershipStore(), FingerprintIndex(), "other-model")
+
+    target = _store("snap_model_target")
+    with pytest.raises(SnapshotError):
+        import_snapshot(target, path, MembershipStore(), FingerprintIndex())
+    assert target.collection.count() == 0
+    info = import_snapshot(
+        target, path, MembershipStore(), FingerprintIndex(), force=True
+    )
+    assert info.embedding_model == "other-model" and target.collection.count() == 1
+
+
+def test_snapshot_rejects_other_files(tmp_path):
+    path = tmp_path / "notes.md"
+    path.write_text("not a snapshot")
+    with pytest.raises(SnapshotError):
+        read_manifest(str(path))
@@ -1,12 +1,17 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+
+from lang_model import LangModel, LangModelError
 from time_range import TimeRangeExtractor
 
 
-class MockLangModel:
+class MockLangModel(LangModel):
     def __init__(self, response):
         self._response = response
 
-    def generate(self, prompt):
+    def generate(self, prompt, **kwargs):
         return self._response
 
 
@@ -64,3 +69,121 @@ def test_extract_invalid_date_format():
     result = extractor.extract("Invalid date format")
     assert result.start is None
     assert result.end == datetime(2025, 5, 3, 23, 59, 59)
+
+
+def test_extract_lang_model_error():
+    class FailingLangModel(LangModel):
+        def generate(self, prompt, **kwargs):
+            raise LangModelError("Dummy", "unavailable", status_code=503)
+
+    extractor = TimeRangeExtractor(FailingLangModel())
+    result = extractor.extract("What did I do yesterday?")
+    assert result.start is None
+    assert result.end is None
+
+
+def test_aextract_good_response():
+    class AsyncLangModel(LangModel):
+        def generate(self, prompt, **kwargs):
+            raise AssertionError("sync generate should not be called")
+
+        async def agenerate(self, prompt, **kwargs):
+            return '{"start": "2025-05-01", "end": "2025-05-03"}'
+
+    extractor = TimeRangeExtractor(AsyncLangModel())
+    result = asyncio.run(extractor.aextract("What did I do last week?"))
+    assert result.start == datetime(2025, 5, 1)
+    assert result.end == datetime(2025, 5, 3, 23, 59, 59)
+
+
+def test_extract_coalesces_concurrent_calls():
+    class SlowLangModel(LangModel):
+        def __init__(self):
+            self.calls = 0
+
+        def generate(self, prompt, **kwargs):
+            self.calls += 1
+            time.sleep(0.2)
+            return '{"start": "2025-05-01", "end": "2025-05-03"}'
+
+    lang_model = SlowLangModel()
+    extractor = TimeRangeExtractor(lang_model)
+    with ThreadPoolExecutor(max_workers=3) as pool:
+        results = list(pool.map(extractor.extract, ["Last week?"] * 3))
+    assert all(r.start == datetime(2025, 5, 1) for r in results)
+    assert lang_model.calls == 1
+
+
+def test_extract_uses_json_mode_and_caches():
+    class JsonLangModel(LangModel):
+        def __init__(self):
+            self.calls = []
+
+        def generate(self, prompt, **kwargs):
+            raise AssertionError("extraction should use generate_json")
+
+        def generate_json(self, prompt, schema=None, max_tokens=None, timeout=None):
+            self.calls.append((prompt, schema, max_tokens))
+            return '{"start": "2025-05-01", "end": "2025-05-03"}'
+
+    lang_model = JsonLangModel()
+    extractor = TimeRangeExtractor(lang_model)
+    first = extractor.extract("What did I do last week?")
+    second = extractor.extract("what did I do   LAST week?")
+    assert first == second
+    assert len(lang_model.calls) == 1
+    prompt, schema, max_tokens = lang_model.calls[0]
+    assert schema == TimeRangeExtractor.SCHEMA
+    assert max_tokens == TimeRangeExtractor.MAX_TOKENS
+    assert "What did I do last week?" in prompt
+
+
+def test_extract_does_not_cache_failures():
+    class FlakyLangModel(LangModel):
+        def __init__(self):
+            self.responses = ["not json", '{"start": "2025-05-01", "end": null}']
+
+        def generate(self, prompt, **kwargs):
+            return self.responses.pop(0)
+
+    extractor = TimeRangeExtractor(FlakyLangModel())
+    assert extractor.extract("May 1?").start is None
+    assert extractor.extract("May 1?").start == datetime(2025, 5, 1)
+
+
+def test_extract_json_wrapped_in_text():
+    response = 'Here you go: {"start": "2025-05-01", "end": "2025-05-01"} Done.'
+    extractor = TimeRangeExtractor(MockLangModel(response))
+    result = extractor.extract("What did I do on May 1?")
+    assert result.start == datetime(2025, 5, 1)
+
+
+def test_mentions_time():
+    from time_range import mentions_time
+
+    for text in [
+        "What did I do yesterday?",
+        "And which bug on Tuesday?",
+        "What about the last 2 weeks?",
+        "Anything from three days ago?",
+        "What happened in March?",
+        "Show me notes from May 3",
+        "And on 2024-05-01?",
+        "What did I ship in Q3?",
+        "How about this morning?",
+        "Summarize 2023",
+    ]:
+        assert mentions_time(text), text
+    for text in [
+        "Which bug was the hardest?",
+        "What did she say after that?",
+        "Tell me more about the next step",
+        "What's the status now?",
+        "List the 3 main points",
+        "May I see the details?",
+        "Was it fixed before the release?",
+        "What did we decide at the last meeting?",
+        "Explain it in 2 sentences",
+        "Who sat in on the review?",
+    ]:
+        assert not mentions_time(text), text
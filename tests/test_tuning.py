@@ -0,0 +1,86 @@
+import chromadb
+import numpy as np
+import pytest
+
+from tuning import TuningResult, exact_neighbors, recommend, tune_hnsw
+from vector_store import HnswConfig, VectorStore
+
+
+def _store(name, vectors, **metadata):
+    store = VectorStore(collection_name=name, chroma_client=chromadb.Client())
+    ids = [f"v{i}" for i in range(len(vectors))]
+    store.collection.add(
+        ids=ids,
+        embeddings=vectors,
+        metadatas=[{"file": "v.md", **metadata}] * len(vectors),
+    )
+    return store
+
+
+def test_exact_neighbors_by_space():
+    vectors = np.array([[1.0, 0.0], [10.0, 1.0], [0.0, 1.0]], dtype=np.float32)
+    queries = np.array([[1.0, 0.1]], dtype=np.float32)
+    assert exact_neighbors(vectors, queries, 2, "l2").tolist() == [[0, 2]]
+    # Cosine ignores the length of the vectors, inner product does not
+    assert exact_neighbors(vectors, queries, 2, "cosine").tolist() == [[1, 0]]
+    assert exact_neighbors(vectors, queries, 1, "ip").tolist() == [[1]]
+
+
+def test_tune_hnsw_measures_recall_and_latency():
+    rng = np.random.default_rng(0)
+    store = _store("tune_test", rng.normal(size=(400, 16)).astype(np.float32))
+    results = tune_hnsw(
+        store,
+        k=5,
+        sample_size=20,
+        ms=(4, 16),
+        construction_efs=(50,),
+        search_efs=(5, 100),
+    )
+    assert [(r.m, r.construction_ef, r.search_ef) for r in results] == [
+        (4, 50, 5),
+        (4, 50, 100),
+        (16, 50, 5),
+        (16, 50, 100),
+    ]
+    assert all(0 <= r.recall <= 1 and r.latency_ms > 0 for r in results)
+    assert results[-1].recall >= 0.9
+    assert results[-1].recall >= results[0].recall
+    # The trial indexes are dropped, the collection left alone
+    names = [c.name for c in store.client.list_collections()]
+    assert "tune_test" in names and not any(n.startswith("tune-") for n in names)
+    assert store.collection.count() == 400
+
+
+def test_tune_hnsw_with_queries_and_duplicates():
+    rng = np.random.default_rng(1)
+    store = _store("tune_duplicates", rng.normal(size=(10, 4)).astype(np.float32))
+    duplicate = _store("tune_only_duplicates", [[1.0, 0.0]], duplicate_of="v0")
+    results = tune_hnsw(
+        store,
+        k=20,
+        queries=[[1.0, 0.0, 0.0, 0.0]],
+        ms=(8,),
+        construction_efs=(50,),
+        search_efs=(50,),
+    )
+    # k is capped at the number of vectors, which are all found
+    assert results[0].recall == 1.0
+    with pytest.raises(ValueError):
+        tune_hnsw(duplicate)
+
+
+def test_recommend_prefers_fastest_reaching_target():
+    results = [
+        TuningResult(16, 100, 10, 0.80, 1.0, 1.0, 1.0),
+        TuningResult(16, 100, 50, 0.96, 2.0, 2.0, 1.0),
+        TuningResult(16, 100, 100, 0.99, 3.0, 3.0, 1.0),
+        TuningResult(32, 200, 10, 0.97, 1.5, 1.5, 2.0),
+    ]
+    assert recommend(results, 0.95) == results[3]
+    assert recommend(results, 0.95, HnswConfig(m=16, construction_ef=100)) == (
+        results[1]
+    )
+    # None reaching the target: the best recall
+    assert recommend(results, 0.999) == results[2]
+    assert recommend(results, 0.9, HnswConfig(m=8)) is None
@@ -1,9 +1,11 @@
-import pytest
-from vector_store import VectorStore
+from datetime import datetime
 
+import chromadb
+import pytest
 
-from vector_store import Metadata
-from datetime import datetime
+import vector_store
+from membership import FileRecord
+from vector_store import HnswConfig, Metadata, VectorStore
 
 
 def test_add_and_query_vector_store():
@@ -64,9 +66,10 @@ def test_add_mismatched_lengths():
 
 def test_duplicate_ids():
     store = VectorStore(collection_name="dup_test")
-    from vector_store import Metadata
     from datetime import datetime
 
+    from vector_store import Metadata
+
     now = datetime.now()
     meta = Metadata(
         file="f.md",
@@ -155,9 +158,10 @@ def test_query_with_start_and_end_time():
 
 def test_query_more_than_available():
     store = VectorStore(collection_name="more_than_avail")
-    from vector_store import Metadata
     from datetime import datetime
 
+    from vector_store import Metadata
+
     now = datetime.now()
     meta = Metadata(
         file="f.md",
@@ -179,9 +183,10 @@ def test_query_more_than_available():
 
 def test_delete_by_file_path():
     store = VectorStore(collection_name="delete_test")
-    from vector_store import Metadata
     from datetime import datetime
 
+    from vector_store import Metadata
+
     now = datetime.now()
     # Add two vectors for the same file path but different hashes
     ids1 = ["hash1::chunk0", "hash1::chunk1"]
@@ -229,9 +234,10 @@ def test_delete_by_file_path():
 
 def test_reindex_overwrites_old_vectors():
     store = VectorStore(collection_name="reindex_test")
-    from vector_store import Metadata
     from datetime import datetime
 
+    from vector_store import Metadata
+
     now = datetime.now()
     # Simulate first index
     ids1 = ["hashA::chunk0", "hashA::chunk1"]
@@ -286,3 +292,176 @@ def test_non_numeric_embedding():
         )
     with pytest.raises(Exception):
         store.query(["a", "b", "c"], max_results=1)
+
+
+def test_version_changes_on_write():
+    store = VectorStore(collection_name="version_test")
+    before = store.version
+    meta = Metadata(file="v.md", text="doc")
+    store.add(
+        ids=["v1"], embeddings=[[0.1, 0.2, 0.3]], documents=["doc"], metadatas=[meta]
+    )
+    assert store.version == before + 1
+    store.delete_by_file_path("v.md")
+    assert store.version == before + 2
+
+
+def test_add_splits_batches_over_chroma_limit(monkeypatch):
+    store = VectorStore(
+        collection_name="max_batch_test", chroma_client=chromadb.Client()
+    )
+    monkeypatch.setattr(store.client, "get_max_batch_size", lambda: 2)
+    calls = []
+    add = store.collection.add
+    monkeypatch.setattr(
+        store.collection, "add", lambda **kw: calls.append(kw["ids"]) or add(**kw)
+    )
+    ids = [f"m{i}" for i in range(5)]
+    store.add(
+        ids, [[float(i), 0.0, 0.0] for i in range(5)], ids, [Metadata("m.md")] * 5
+    )
+    assert calls == [["m0", "m1"], ["m2", "m3"], ["m4"]]
+    assert store.existing_ids(ids) == set(ids)
+
+
+def test_buffered_writer_flushes_on_thresholds():
+    store = VectorStore(collection_name="writer_test", chroma_client=chromadb.Client())
+    flushed = []
+    writer = store.writer(max_count=3, max_bytes=1 << 20, max_latency=60)
+    writer.add(["w1", "w2"], [[0.1, 0.2, 0.3]] * 2, ["a", "b"], [Metadata("w.md")] * 2)
+    writer.after_flush(flushed.append)
+    # Buffered rows are visible through the writer, not yet in the store
+    assert writer.existing_ids(["w1", "w3"]) == {"w1"}
+    assert writer.get_embeddings(["w2"]) == {"w2": [0.1, 0.2, 0.3]}
+    assert store.existing_ids(["w1", "w2"]) == set()
+    assert flushed == []
+
+    writer.add(["w3"], [[0.1, 0.2, 0.3]], ["c"], [Metadata("w.md")])
+    assert len(writer) == 0 and flushed == [None]
+    assert store.existing_ids(["w1", "w2", "w3"]) == {"w1", "w2", "w3"}
+
+    # Nothing buffered: the callback runs right away
+    writer.after_flush(flushed.append)
+    assert flushed == [None, None]
+
+    writer.max_bytes = 1
+    writer.add(["w4"], [[0.1, 0.2, 0.3]], ["d"], [Metadata("w.md")])
+    assert len(writer) == 0
+
+    writer.max_bytes, writer.max_latency = 1 << 20, 0
+    writer.add(["w5"], [[0.1, 0.2, 0.3]], ["e"], [Metadata("w.md")])
+    assert len(writer) == 0
+
+
+def test_buffered_writer_reports_failed_writes(monkeypatch):
+    store = VectorStore(
+        collection_name="writer_fail_test", chroma_client=chromadb.Client()
+    )
+    writer = store.writer()
+    writer.add(["f1"], [[0.1, 0.2, 0.3]], ["a"], [Metadata("f.md")])
+    errors = []
+    writer.after_flush(errors.append)
+
+    def fail(*args):
+        raise RuntimeError("disk full")
+
+    monkeypatch.setattr(store, "add", fail)
+    with pytest.raises(RuntimeError):
+        writer.close()
+    assert [str(e) for e in errors] == ["disk full"]
+    assert len(writer) == 0
+
+
+def test_hnsw_config_applies_to_new_collections(monkeypatch, caplog):
+    client = chromadb.Client()
+    monkeypatch.setenv("WHISPER_NOTE_HNSW", "space=l2, m=8, search_ef=20")
+    store = VectorStore(collection_name="hnsw_test", chroma_client=client)
+    assert store.hnsw_config == HnswConfig(
+        space="l2", m=8, construction_ef=100, search_ef=20
+    )
+
+    # Only search_ef changes once the collection exists
+    store = VectorStore(
+        collection_name="hnsw_test",
+        chroma_client=client,
+        hnsw=HnswConfig(space="cosine", m=8, search_ef=50),
+    )
+    assert store.hnsw_config == HnswConfig(
+        space="l2", m=8, construction_ef=100, search_ef=50
+    )
+    assert "only applies to new collections" in caplog.text
+
+    monkeypatch.delenv("WHISPER_NOTE_HNSW")
+    store = VectorStore(collection_name="hnsw_default", chroma_client=client)
+    assert store.hnsw_config == HnswConfig()
+
+
+def test_hnsw_config_parse_rejects_unknown_parameters():
+    with pytest.raises(ValueError):
+        HnswConfig.parse("space=hamming")
+    with pytest.raises(ValueError):
+        HnswConfig.parse("ef=10")
+
+
+def test_query_within_ids():
+    store = VectorStore(collection_name="ids_test", chroma_client=chromadb.Client())
+    ids = ["i1", "i2", "i3"]
+    store.add(ids, [[1.0, 0.0], [0.9, 0.1], [0.0, 1.0]], ids, [Metadata("i.md")] * 3)
+    # Ids that are not stored are ignored
+    assert store.query([1.0, 0.0], ids=["i3", "i2", "gone"])["ids"] == [["i2", "i3"]]
+    assert store.query([1.0, 0.0], ids=["gone"])["ids"] == [[]]
+
+
+def test_file_operations_use_catalog(monkeypatch):
+    store = VectorStore(collection_name="catalog_test", chroma_client=chromadb.Client())
+    store.add(
+        ["a", "b", "c"],
+        [[1.0, 0.0], [0.9, 0.1], [0.0, 1.0]],
+        ["a", "b", "c"],
+        [
+            Metadata("/v/a.md", "h1"),
+            Metadata("/v/sub/b.md", "h2"),
+            Metadata("/w/c.md", "h3"),
+        ],
+    )
+    assert store.is_file_hash_indexed("/v/a.md", "h1")
+    assert not store.is_file_hash_indexed("/v/a.md", "h2")
+    assert store.get_by_file_path("/v/sub/b.md")["ids"] == ["b"]
+    assert store.counts().file_count == 3
+
+    store.update_metadata(["b"], [{"file": "/w/b.md"}])
+    assert store.delete_by_folder("/v/") == 1
+    assert sorted(store.collection.get()["ids"]) == ["b", "c"]
+    assert store.catalog.ids_under("/w/") == ["b", "c"]
+
+    # A row written behind the catalog's back, as by a failed write, is
+    # picked up when a process first opens it
+    store.collection.add(ids=["d"], embeddings=[[0.5, 0.5]], metadatas=[{"file": "d"}])
+    monkeypatch.delitem(vector_store._catalogs, str(store.collection.id))
+    assert store.catalog.ids_of_file("d") == ["d"]
+    assert store.counts().chunk_count == 3
+
+
+def test_file_operations_keep_chunks_other_files_refer_to():
+    store = VectorStore(collection_name="shared_test", chroma_client=chromadb.Client())
+    store.add(
+        ["x", "y"],
+        [[1.0, 0.0], [0.0, 1.0]],
+        ["x", "y"],
+        [Metadata("/v/a.md"), Metadata("/v/a.md")],
+    )
+    # /w/b.md has the same content as x, so x is shared rather than stored twice
+    store.membership.replace_file(FileRecord("/v/a.md", "h1", 1.0, 4), ["x", "y"])
+    store.membership.replace_file(FileRecord("/w/b.md", "h2", 1.0, 2), ["x"])
+    assert store.counts().file_count == 2
+    assert store.is_file_hash_indexed("/w/b.md", "h2")
+    assert not store.is_file_hash_indexed("/w/b.md", "h1")
+
+    assert store.delete_by_folder("/v/") == 1
+    assert store.collection.get()["ids"] == ["x"]
+    assert store.get_by_file_path("/w/b.md")["ids"] == ["x"]
+    assert store.membership.get_file("/v/a.md") is None
+    assert store.counts().file_count == 1
+
+    store.delete_by_file_path("/w/b.md")
+    assert store.collection.count() == 0 and store.counts().file_count == 0
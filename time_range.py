@@ -1,79 +1,203 @@
-from dataclasses import dataclass
-from typing import Optional
-from datetime import datetime, timedelta
+import asyncio
 import json
 import logging
+import re
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import ClassVar
+
+from lang_model import LangModelError
+from singleflight import SingleFlight, normalize_text
+
+_UNIT = r"(?:days?|weeks?|weekends?|months?|years?|quarters?)"
+_WEEKDAY = r"(?:mon|tues|wednes|thurs|fri|satur|sun)days?"
+# "May" is left out: it is more often a verb than a month
+_MONTH = (
+    r"(?:january|february|march|april|june|july|august|september|october"
+    r"|november|december)"
+)
+_MONTH_ABBR = r"(?:jan|feb|mar|apr|may|jun|jul|aug|sept?|oct|nov|dec)"
+# Phrases that refer to a point or period in time. Words that are as often
+# about anything else ("now", "last", "after", "sat", "may") and bare
+# numbers only count as part of such a phrase.
+_TIME_EXPRESSION = re.compile(
+    r"\b(?:today|tonight|yesterday|tomorrow|recently|last night"
+    r"|this (?:morning|afternoon|evening)"
+    rf"|{_WEEKDAY}|{_MONTH}|q[1-4]"
+    rf"|(?:last|past|previous|next|this|coming)(?: \d+| few| couple of)? {_UNIT}"
+    rf"|(?:last|next|this|coming) {_WEEKDAY}"
+    rf"|(?:\d+|an?|one|two|three|few|couple of|several) {_UNIT} ago"
+    rf"|{_MONTH_ABBR}\.? \d{{1,2}}|\d{{1,2}}(?:st|nd|rd|th)? (?:of )?{_MONTH_ABBR}"
+    r"|(?:in|since|until|during) may"
+    r"|(?:19|20)\d{2}|\d{4}-\d{1,2}(?:-\d{1,2})?|\d{1,2}/\d{1,2}(?:/\d{2,4})?)\b",
+    re.IGNORECASE,
+)
+
+
+def mentions_time(text: str) -> bool:
+    """
+    Cheap check for whether text may refer to a time. False means time range
+    extraction can be skipped; True only means it may be worth running.
+    """
+    return bool(_TIME_EXPRESSION.search(text))
 
 
 @dataclass
 class TimeRange:
-    start: Optional[datetime]
-    end: Optional[datetime]
+    start: datetime | None
+    end: datetime | None
 
 
 class TimeRangeExtractor:
     """
     Uses an LLM to determine if a user query is time-sensitive and extracts start/end dates if applicable.
+    A small, fast model is enough: the output is constrained to a JSON schema
+    and capped at MAX_TOKENS, and results are cached per query and day.
     """
 
-    PROMPT_TEMPLATE = """
-        Given the following user question, determine whether it has a time-sensitive component. If it does, return the start
-        and end date that the question refers to in ISO 8601 format (YYYY-MM-DD). If the question is not time-sensitive,
-        return null for both.
-
-        IMPORTANT:
-        - Output ONLY a single line of valid JSON.
-        - Do NOT include any explanation, markdown, or extra text before or after the JSON.
-        - Do NOT include phrases like 'Here's the output:' or code blocks.
-        - Your response will be parsed by a computer. If you include anything other than the JSON object, it will cause an error.
-        - Assume today's date is {today}.
-        
-        Output strictly in this JSON format:
-        {{
-            "start": "YYYY-MM-DD" or null,
-            "end": "YYYY-MM-DD" or null
-        }}
-
-        For example, if the user's question is "What did I do yesterday?", return {{ "start": "{yesterday}", "end": "{yesterday}" }}.
-        User question: "{query}"
-        """
+    PROMPT_TEMPLATE = (
+        "Today is {weekday}, {today}. Give the dates (YYYY-MM-DD) of the period the "
+        "question refers to, or null for both if it does not refer to one. "
+        'Reply in JSON: {{"start": ..., "end": ...}}\n'
+        'Example: "What did I do yesterday?" -> '
+        '{{"start": "{yesterday}", "end": "{yesterday}"}}\n'
+        "Question: {query}"
+    )
+    SCHEMA: ClassVar[dict] = {
+        "type": "object",
+        "properties": {
+            "start": {"type": ["string", "null"]},
+            "end": {"type": ["string", "null"]},
+        },
+        "required": ["start", "end"],
+        "additionalProperties": False,
+    }
+    MAX_TOKENS = 48
+    CACHE_SIZE = 256
 
     def __init__(self, lang_model):
         self.lang_model = lang_model
+        self._inflight = SingleFlight()
+        self._cache: OrderedDict[tuple, TimeRange] = OrderedDict()
+        self._cache_lock = threading.Lock()
 
-    def extract(self, query: str) -> TimeRange:
-        today = datetime.now().strftime("%Y-%m-%d")
-        yesterday = (datetime.now() - timedelta(days=1)).strftime("%Y-%m-%d")
-        prompt = self.PROMPT_TEMPLATE.format(
-            today=today, yesterday=yesterday, query=query
-        )
-        response = self.lang_model.generate(prompt)
-        try:
-            data = json.loads(response)
+    def extract(self, query: str, timeout: float | None = None) -> TimeRange:
+        """
+        Extract the time range of a query, giving up after timeout seconds.
+        Results are cached by query and day, and concurrent calls for the same
+        query share a single LLM call.
+        """
+        key = self._key(query)
+        cached = self._cached(key)
+        if cached is not None:
+            return cached
+        return self._inflight.do(key, lambda: self._extract(key, query, timeout))
 
-            # Always use start of day for start date
-            start = self._parse_date_str(data.get("start"))
-            if start:
-                start = start.replace(hour=0, minute=0, second=0, microsecond=0)
+    async def aextract(self, query: str, timeout: float | None = None) -> TimeRange:
+        key = self._key(query)
+        cached = self._cached(key)
+        if cached is not None:
+            return cached
+        return await self._inflight.ado(
+            key, lambda: self._aextract(key, query, timeout)
+        )
 
-            # Always use end of day for end date
-            end = self._parse_date_str(data.get("end"))
-            if end:
-                end = end.replace(hour=23, minute=59, second=59, microsecond=0)
+    @staticmethod
+    def _key(query: str):
+        return (normalize_text(query), datetime.now().date())
 
-            logging.getLogger(__name__).debug(
-                f"Time range from '{query}' is start={start}, end={end}"
+    def _extract(self, key, query: str, timeout: float | None) -> TimeRange:
+        try:
+            response = self.lang_model.generate_json(
+                self._build_prompt(query),
+                schema=self.SCHEMA,
+                max_tokens=self.MAX_TOKENS,
+                timeout=timeout,
             )
-            return TimeRange(
-                start=start,
-                end=end,
+        except LangModelError as e:
+            logging.getLogger(__name__).error(
+                f"Failed to extract time range from '{query}', error: {e}"
             )
+            return TimeRange(start=None, end=None)
+        return self._remember(key, self._parse_response(query, response))
 
-        except Exception as e:
+    async def _aextract(self, key, query: str, timeout: float | None) -> TimeRange:
+        try:
+            response = await asyncio.wait_for(
+                self.lang_model.agenerate_json(
+                    self._build_prompt(query),
+                    schema=self.SCHEMA,
+                    max_tokens=self.MAX_TOKENS,
+                    timeout=timeout,
+                ),
+                timeout,
+            )
+        except (LangModelError, TimeoutError) as e:
             logging.getLogger(__name__).error(
-                f"Failed to extract time range from '{query}', error: {str(e)}, response: {response}"
+                f"Failed to extract time range from '{query}', error: {e!r}"
             )
             return TimeRange(start=None, end=None)
+        return self._remember(key, self._parse_response(query, response))
+
+    def _cached(self, key) -> TimeRange | None:
+        with self._cache_lock:
+            time_range = self._cache.get(key)
+            if time_range is not None:
+                self._cache.move_to_end(key)
+            return time_range
+
+    def _remember(self, key, time_range: TimeRange | None) -> TimeRange:
+        """Cache a parsed time range; failures are not cached so they are retried."""
+        if time_range is None:
+            return TimeRange(start=None, end=None)
+        with self._cache_lock:
+            self._cache[key] = time_range
+            while len(self._cache) > self.CACHE_SIZE:
+                self._cache.popitem(last=False)
+        return time_range
+
+    def _build_prompt(self, query: str) -> str:
+        now = datetime.now()
+        return self.PROMPT_TEMPLATE.format(
+            weekday=now.strftime("%A"),
+            today=now.strftime("%Y-%m-%d"),
+            yesterday=(now - timedelta(days=1)).strftime("%Y-%m-%d"),
+            query=query,
+        )
+
+    def _parse_response(self, query: str, response: str) -> TimeRange | None:
+        """Parse the model's JSON reply, or return None if it is not valid JSON."""
+        try:
+            data = json.loads(response)
+        except json.JSONDecodeError:
+            # Models without a JSON mode may wrap the object in other text
+            match = re.search(r"\{.*\}", response, re.DOTALL)
+            try:
+                data = json.loads(match.group(0)) if match else None
+            except json.JSONDecodeError:
+                data = None
+        if not isinstance(data, dict):
+            logging.getLogger(__name__).error(
+                f"Failed to extract time range from '{query}', response: {response}"
+            )
+            return None
+
+        # Always use start of day for start date
+        start = self._parse_date_str(data.get("start"))
+        if start:
+            start = start.replace(hour=0, minute=0, second=0, microsecond=0)
+
+        # Always use end of day for end date
+        end = self._parse_date_str(data.get("end"))
+        if end:
+            end = end.replace(hour=23, minute=59, second=59, microsecond=0)
+
+        logging.getLogger(__name__).debug(
+            f"Time range from '{query}' is start={start}, end={end}"
+        )
+        return TimeRange(start=start, end=end)
 
     @staticmethod
     def _parse_date_str(date_str):
@@ -81,8 +205,8 @@ class TimeRangeExtractor:
             return None
         try:
             return datetime.strptime(date_str, "%Y-%m-%d")
-        except Exception as e:
+        except (TypeError, ValueError) as e:
             logging.getLogger(__name__).error(
-                f"Invalid date string: {date_str}, error: {str(e)}"
+                f"Invalid date string: {date_str}, error: {e!s}"
             )
         return None
@@ -0,0 +1,179 @@
+import logging
+import time
+import uuid
+from collections.abc import Iterable, Sequence
+from dataclasses import dataclass
+
+import chromadb
+import numpy as np
+
+from vector_store import HnswConfig, VectorStore
+
+# Values swept for each HNSW parameter
+TUNE_MS = (8, 16, 32)
+TUNE_CONSTRUCTION_EFS = (100, 200)
+TUNE_SEARCH_EFS = (10, 20, 50, 100, 200)
+# Vectors copied into the trial indexes, sampled when the collection is larger
+TUNE_MAX_VECTORS = 20000
+
+
+@dataclass
+class TuningResult:
+    m: int
+    construction_ef: int
+    search_ef: int
+    recall: float  # Mean recall@k against exact search
+    latency_ms: float  # Mean per query
+    p95_latency_ms: float
+    build_seconds: float  # To build the trial index
+
+
+def exact_neighbors(
+    vectors: np.ndarray, queries: np.ndarray, k: int, space: str = "cosine"
+) -> np.ndarray:
+    """Indexes of the k rows of vectors nearest each query, by brute force."""
+    if space == "cosine":
+        vectors = _normalized(vectors)
+        queries = _normalized(queries)
+    if space == "l2":
+        distances = (
+            (queries**2).sum(axis=1)[:, None]
+            - 2 * queries @ vectors.T
+            + (vectors**2).sum(axis=1)[None, :]
+        )
+    else:
+        distances = -(queries @ vectors.T)
+    k = min(k, len(vectors))
+    nearest = np.argpartition(distances, k - 1, axis=1)[:, :k]
+    order = np.take_along_axis(distances, nearest, axis=1).argsort(axis=1)
+    return np.take_along_axis(nearest, order, axis=1)
+
+
+def tune_hnsw(
+    vector_store: VectorStore,
+    k: int = 10,
+    sample_size: int = 100,
+    queries: Sequence[Sequence[float]] | None = None,
+    ms: Iterable[int] = TUNE_MS,
+    construction_efs: Iterable[int] = TUNE_CONSTRUCTION_EFS,
+    search_efs: Iterable[int] = TUNE_SEARCH_EFS,
+    max_vectors: int = TUNE_MAX_VECTORS,
+    seed: int = 0,
+) -> list[TuningResult]:
+    """
+    Sweep HNSW parameters over a copy of the collection's vectors and
+    measure each combination's recall@k against exact search and its query
+    latency. Queries are the given embeddings, or else sample_size stored
+    vectors held out of the trial indexes. The collection is not modified:
+    trial indexes are built in an in-memory Chroma client and dropped.
+    """
+    rng = np.random.default_rng(seed)
+    vectors = _load_vectors(vector_store)
+    if queries is None:
+        held_out = rng.choice(len(vectors), min(sample_size, len(vectors) // 2), False)
+        query_vectors = vectors[held_out]
+        vectors = np.delete(vectors, held_out, axis=0)
+    else:
+        query_vectors = np.asarray(queries, dtype=np.float32)
+    if len(vectors) > max_vectors:
+        vectors = vectors[rng.choice(len(vectors), max_vectors, replace=False)]
+    if not len(vectors) or not len(query_vectors):
+        raise ValueError("Not enough vectors to tune on")
+
+    space = vector_store.hnsw_config.space
+    k = min(k, len(vectors))
+    exact = exact_neighbors(vectors, query_vectors, k, space)
+    ids = [str(i) for i in range(len(vectors))]
+    client = chromadb.EphemeralClient()
+    batch_size = client.get_max_batch_size()
+    results = []
+    # Chroma reads ef_search when it loads an index, so changing it on a
+    # loaded collection has no effect: each combination gets its own index
+    for m in ms:
+        for construction_ef in construction_efs:
+            for search_ef in search_efs:
+                name = f"tune-{uuid.uuid4().hex}"
+                config = HnswConfig(space, m, construction_ef, search_ef)
+                collection = client.create_collection(
+                    name, configuration=config.to_chroma()
+                )
+                try:
+                    started = time.perf_counter()
+                    for start in range(0, len(vectors), batch_size):
+                        collection.add(
+                            ids=ids[start : start + batch_size],
+                            embeddings=vectors[start : start + batch_size],
+                        )
+                    build_seconds = time.perf_counter() - started
+                    recall, latencies = _measure(collection, query_vectors, exact, k)
+                finally:
+                    client.delete_collection(name)
+                results.append(
+                    TuningResult(
+                        m,
+                        construction_ef,
+                        search_ef,
+                        recall,
+                        float(np.mean(latencies)),
+                        float(np.percentile(latencies, 95)),
+                        build_seconds,
+                    )
+                )
+                logging.getLogger(__name__).debug(f"{results[-1]}")
+    return results
+
+
+def recommend(
+    results: Iterable[TuningResult],
+    target_recall: float,
+    config: HnswConfig | None = None,
+) -> TuningResult | None:
+    """
+    The fastest result reaching target_recall, or the one with the best
+    recall if none does. With config, only results sharing its m and
+    construction_ef are considered, as those cannot change on a live
+    collection.
+    """
+    results = [
+        r
+        for r in results
+        if config is None
+        or (r.m == config.m and r.construction_ef == config.construction_ef)
+    ]
+    if not results:
+        return None
+    reaching = [r for r in results if r.recall >= target_recall]
+    if reaching:
+        return min(reaching, key=lambda r: (r.latency_ms, -r.recall))
+    return max(results, key=lambda r: (r.recall, -r.latency_ms))
+
+
+def _load_vectors(vector_store: VectorStore) -> np.ndarray:
+    """The collection's distinct vectors; duplicates share their original's."""
+    pages = []
+    for page in vector_store.iter_rows(include=["embeddings", "metadatas"]):
+        keep = [
+            i
+            for i, metadata in enumerate(page["metadatas"])
+            if not (metadata or {}).get("duplicate_of")
+        ]
+        pages.append(np.asarray(page["embeddings"], dtype=np.float32)[keep])
+    if not pages:
+        return np.empty((0, 0), dtype=np.float32)
+    return np.concatenate(pages)
+
+
+def _measure(collection, queries: np.ndarray, exact: np.ndarray, k: int):
+    """Mean recall@k of single-vector queries, and each one's latency in ms."""
+    hits, latencies = 0, []
+    for query, expected in zip(queries, exact):
+        started = time.perf_counter()
+        found = collection.query(query_embeddings=[query], n_results=k, include=[])
+        latencies.append((time.perf_counter() - started) * 1000)
+        hits += len({int(i) for i in found["ids"][0]} & set(expected.tolist()))
+    return hits / (len(queries) * k), latencies
+
+
+def _normalized(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
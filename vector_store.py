@@ -1,8 +1,17 @@
 import logging
-import chromadb
-from typing import List, Optional
+import os
+import re
+import threading
+import time
+from collections.abc import Callable, Iterator
 from dataclasses import dataclass, fields
 from datetime import datetime
+from typing import Optional, Self
+
+import chromadb
+
+from catalog import CatalogCounts, ChunkCatalog
+from membership import MembershipStore
 
 
 @dataclass
@@ -13,18 +22,287 @@ class Metadata:
     text: str = ""
     modified_at: datetime = datetime.fromtimestamp(0)
     created_at: datetime = datetime.fromtimestamp(0)
+    # When the events in the chunk happened; defaults to created_at
+    event_date: datetime | None = None
+    # Where the chunk's text lies in the file's text (with newlines
+    # translated), and the SHA-256 of the chunk's content
+    start_offset: int = -1
+    end_offset: int = -1
+    chunk_hash: str = ""
+    # For an exact duplicate of a chunk already indexed, the id of that chunk,
+    # whose embedding it shares. Exact and near duplicates have the same
+    # dedup_key.
+    duplicate_of: str = ""
+    dedup_key: str = ""
+
+
+# A BufferedWriter writes its rows once it holds this many of them,
+WRITE_BATCH_COUNT = 1024
+# or roughly this many bytes of them,
+WRITE_BATCH_BYTES = 16 << 20
+# or its oldest row has waited this many seconds
+WRITE_BATCH_LATENCY = 5.0
+
+# HNSW parameters for collections, as "space=cosine,m=16,construction_ef=100,
+# search_ef=100" (any subset). The space, m and construction_ef only apply
+# to collections created afterwards; search_ef also to existing ones.
+HNSW_ENV = "WHISPER_NOTE_HNSW"
+HNSW_SPACES = ("cosine", "l2", "ip")
+
+
+@dataclass
+class HnswConfig:
+    """Parameters of a collection's HNSW index."""
+
+    # Embedding models like MiniLM output unit vectors, for which cosine
+    # ranks like l2 but reports distances in [0, 2]
+    space: str = "cosine"
+    m: int = 16  # Neighbors per node: recall and memory against build time
+    construction_ef: int = 100  # Candidates per insert: graph quality
+    search_ef: int = 100  # Candidates per query: recall against latency
+
+    @classmethod
+    def parse(cls, spec: str) -> "HnswConfig":
+        config = cls()
+        for part in spec.split(","):
+            if not part.strip():
+                continue
+            key, _, value = part.partition("=")
+            key, value = key.strip(), value.strip()
+            if key == "space":
+                if value not in HNSW_SPACES:
+                    raise ValueError(f"Unknown HNSW space: {value}")
+                config.space = value
+            elif key in ("m", "construction_ef", "search_ef"):
+                setattr(config, key, int(value))
+            else:
+                raise ValueError(f"Unknown HNSW parameter: {key}")
+        return config
+
+    @classmethod
+    def from_env(cls) -> Optional["HnswConfig"]:
+        spec = os.environ.get(HNSW_ENV, "").strip()
+        return cls.parse(spec) if spec else None
+
+    def to_chroma(self) -> dict:
+        return {
+            "hnsw": {
+                "space": self.space,
+                "max_neighbors": self.m,
+                "ef_construction": self.construction_ef,
+                "ef_search": self.search_ef,
+            }
+        }
+
+
+# In-process write counter per collection id, bumped on every add or delete.
+# Lets callers tell whether the index changed between two points in time.
+_collection_versions: dict[str, int] = {}
+
+# Chunk catalog per collection id, opened and reconciled with the collection
+# on first use, then kept in step by every VectorStore writing to it
+_catalogs: dict[str, ChunkCatalog] = {}
+_catalogs_lock = threading.Lock()
+# File membership per collection id, shared by the Indexers and file-level
+# operations of this process
+_memberships: dict[str, MembershipStore] = {}
+
+# Suffix of the file next to a collection's sidecars that records the id of
+# the collection they were built for, so a collection deleted and created
+# again under the same name does not inherit them
+SIDECAR_MARKER = "collection-id"
+# What follows "{collection name}." in the name of a sidecar file, including
+# SQLite's -wal, -shm and -journal files
+_SIDECAR_FILE = re.compile(r"\w+\.sqlite(-\w+)?")
+# Marker path -> collection id, for sidecars checked by this process
+_checked_sidecars: dict[str, str] = {}
+_sidecars_lock = threading.Lock()
+
+
+def stored_metadata(md: Metadata | dict) -> dict:
+    """
+    Metadata as stored: a dict with float timestamps. Dicts are taken to
+    be stored already.
+    """
+    if isinstance(md, dict):
+        return md
+    d = md.__dict__.copy()
+    if isinstance(d.get("modified_at"), datetime):
+        d["modified_at"] = d["modified_at"].timestamp()
+    if isinstance(d.get("created_at"), datetime):
+        d["created_at"] = d["created_at"].timestamp()
+    # Every chunk has an event_date so time filters on it match
+    # chunks without a date of their own.
+    if isinstance(d.get("event_date"), datetime):
+        d["event_date"] = d["event_date"].timestamp()
+    elif d.get("event_date") is None:
+        d["event_date"] = d.get("created_at")
+    return d
 
 
 class VectorStore:
     def __init__(
         self,
         collection_name: str = "notes",
-        chroma_client: Optional[chromadb.ClientAPI] = None,
+        chroma_client: chromadb.ClientAPI | None = None,
+        hnsw: HnswConfig | None = None,
     ):
+        """
+        hnsw: Index parameters, by default those of WHISPER_NOTE_HNSW or
+            HnswConfig's. Only search_ef can change once the collection exists.
+        """
         self.client = chroma_client or chromadb.PersistentClient()
-        self.collection = self.client.get_or_create_collection(collection_name)
+        configured = hnsw or HnswConfig.from_env()
+        self.collection = self.client.get_or_create_collection(
+            collection_name, configuration=(configured or HnswConfig()).to_chroma()
+        )
+        if configured:
+            self._apply_hnsw(configured)
+
+    @property
+    def hnsw_config(self) -> HnswConfig:
+        """The HNSW parameters the collection actually uses."""
+        hnsw = (self.collection.configuration or {}).get("hnsw") or {}
+        defaults = HnswConfig(space="l2")  # Chroma's own defaults
+        return HnswConfig(
+            space=hnsw.get("space") or defaults.space,
+            m=hnsw.get("max_neighbors") or defaults.m,
+            construction_ef=hnsw.get("ef_construction") or defaults.construction_ef,
+            search_ef=hnsw.get("ef_search") or defaults.search_ef,
+        )
+
+    def set_search_ef(self, search_ef: int):
+        """
+        Persist a new search_ef. Chroma reads it when it loads the index, so
+        clients that already queried the collection keep the old one until
+        they restart.
+        """
+        self.collection.modify(configuration={"hnsw": {"ef_search": search_ef}})
+
+    def _apply_hnsw(self, configured: HnswConfig):
+        actual = self.hnsw_config
+        if actual.search_ef != configured.search_ef:
+            self.set_search_ef(configured.search_ef)
+        fixed = ("space", "m", "construction_ef")
+        if any(getattr(actual, f) != getattr(configured, f) for f in fixed):
+            logging.getLogger(__name__).warning(
+                f"Collection {self.collection.name} was created with {actual};"
+                f" {configured} only applies to new collections"
+            )
+
+    @property
+    def version(self) -> int:
+        """Number of writes made to this collection by this process."""
+        return _collection_versions.get(str(self.collection.id), 0)
+
+    def sidecar_path(self, suffix: str) -> str:
+        """
+        Path for auxiliary data kept next to Chroma's own files, or ':memory:'
+        when the Chroma client is not persistent.
+        """
+        settings = self.client.get_settings()
+        if not settings.is_persistent:
+            return ":memory:"
+        self._check_sidecars(settings.persist_directory)
+        return os.path.join(
+            settings.persist_directory, f"{self.collection.name}.{suffix}"
+        )
+
+    def _check_sidecars(self, directory: str):
+        """
+        Remove the sidecars of an earlier collection of the same name, once
+        per process, before any is opened. Sidecars from before the marker
+        was written are kept, unless the collection is empty.
+        """
+        name, collection_id = self.collection.name, str(self.collection.id)
+        marker = os.path.join(directory, f"{name}.{SIDECAR_MARKER}")
+        with _sidecars_lock:
+            if _checked_sidecars.get(marker) == collection_id:
+                return
+            try:
+                with open(marker, encoding="utf-8") as f:
+                    recorded = f.read().strip()
+            except FileNotFoundError:
+                recorded = None
+            if recorded is None:
+                stale = self.collection.count() == 0
+            else:
+                stale = recorded != collection_id
+            if stale:
+                removed = 0
+                for entry in os.listdir(directory):
+                    if entry.startswith(f"{name}.") and _SIDECAR_FILE.fullmatch(
+                        entry[len(name) + 1 :]
+                    ):
+                        os.remove(os.path.join(directory, entry))
+                        removed += 1
+                if removed:
+                    logging.getLogger(__name__).warning(
+                        f"Removed {removed} file(s) of an earlier collection"
+                        f" named {name}"
+                    )
+            if recorded != collection_id:
+                with open(marker, "w", encoding="utf-8") as f:
+                    f.write(collection_id)
+            _checked_sidecars[marker] = collection_id
+
+    @property
+    def catalog(self) -> ChunkCatalog:
+        """
+        The collection's chunk catalog. Rebuilt from the collection when this
+        process first uses it if it does not hold as many chunks, e.g. when
+        it is new or a write to one of them failed.
+        """
+        key = str(self.collection.id)
+        with _catalogs_lock:
+            catalog = _catalogs.get(key)
+            if catalog is None:
+                catalog = ChunkCatalog(self.sidecar_path("catalog.sqlite"))
+                if len(catalog) != self.collection.count():
+                    self._rebuild_catalog(catalog)
+                _catalogs[key] = catalog
+        return catalog
+
+    @property
+    def membership(self) -> MembershipStore:
+        """
+        Which files refer to which of the collection's chunks, as recorded
+        by the Indexer. Chunks are shared between files with the same
+        content, so file-level operations go by it rather than by the file
+        each chunk was stored for.
+        """
+        key = str(self.collection.id)
+        with _catalogs_lock:
+            membership = _memberships.get(key)
+            if membership is None:
+                membership = MembershipStore(self.sidecar_path("membership.sqlite"))
+                _memberships[key] = membership
+        return membership
 
-    def get_all_metadata(self) -> List[Metadata]:
+    def _rebuild_catalog(self, catalog: ChunkCatalog):
+        catalog.clear()
+        for page in self.iter_rows(include=["metadatas"]):
+            catalog.add(page["ids"], page["metadatas"])
+        logging.getLogger(__name__).info(
+            f"Cataloged {len(catalog)} chunk(s) of {self.collection.name}"
+        )
+
+    def counts(self) -> CatalogCounts:
+        """
+        Files and chunks in the collection. Files whose chunks were all
+        stored for other files with the same content count too.
+        """
+        counts = self.catalog.counts()
+        files = set(self.catalog.files())
+        files.update(record.file for record in self.membership.files())
+        counts.file_count = len(files)
+        return counts
+
+    def _bump_version(self):
+        key = str(self.collection.id)
+        _collection_versions[key] = _collection_versions.get(key, 0) + 1
+
+    def get_all_metadata(self) -> list[Metadata]:
         """
         Return all metadata objects for the collection as a list of Metadata instances.
         Filters out any keys not present in the Metadata dataclass.
@@ -44,61 +322,183 @@ class VectorStore:
                     d["created_at"] = datetime.fromtimestamp(d["created_at"])
                 if "modified_at" in d and isinstance(d["modified_at"], (float, int)):
                     d["modified_at"] = datetime.fromtimestamp(d["modified_at"])
+                if "event_date" in d and isinstance(d["event_date"], (float, int)):
+                    d["event_date"] = datetime.fromtimestamp(d["event_date"])
                 filtered.append(Metadata(**d))
         return filtered
 
+    def iter_rows(
+        self, batch_size: int = 1000, include: list[str] | None = None
+    ) -> Iterator[chromadb.GetResult]:
+        """Every row of the collection, a page of batch_size rows at a time."""
+        offset = 0
+        while True:
+            page = self.collection.get(
+                include=include or ["documents", "metadatas"],
+                limit=batch_size,
+                offset=offset,
+            )
+            if not page["ids"]:
+                return
+            yield page
+            offset += len(page["ids"])
+
     def delete_by_file_path(self, rel_path: str):
         """
-        Delete all vectors whose metadata['file'] matches rel_path.
+        Delete all vectors whose metadata['file'] matches rel_path, or that
+        the file refers to. Vectors other files still refer to are kept, and
+        moved over to one of those files.
         """
-        self.collection.delete(where={"file": rel_path})
+        self.delete_files([rel_path])
 
-    def is_file_hash_indexed(self, rel_path: str, file_hash: str) -> bool:
+    def delete_by_folder(self, prefix: str) -> int:
         """
-        Return True if any vector with metadata['file'] == rel_path and metadata['file_hash'] == file_hash exists.
+        Delete the vectors of all files whose path starts with prefix, e.g. a
+        folder path ending with a separator, as delete_by_file_path does.
+        Returns the number deleted.
         """
-        results = self.collection.get(
-            where={"$and": [{"file": rel_path}, {"file_hash": file_hash}]}
+        files = set(self.catalog.files(prefix))
+        files.update(record.file for record in self.membership.files(prefix))
+        return self.delete_files(sorted(files))
+
+    def delete_files(self, file_paths: list[str]) -> int:
+        """
+        Forget files, deleting the vectors stored for them or that they
+        refer to, unless other files still refer to them. Returns the number
+        deleted.
+        """
+        stored = {
+            chunk_id
+            for file_path in file_paths
+            for chunk_id in self.catalog.ids_of_file(file_path)
+        }
+        orphans = set(self.membership.remove_files(file_paths))
+        shared = self.membership.referenced(stored)
+        deleted = sorted(orphans | (stored - shared))
+        self.delete(deleted)
+        relinked = sorted(shared)
+        self.update_metadata(
+            relinked,
+            [{"file": self.membership.files_of(chunk_id)[0]} for chunk_id in relinked],
         )
-        return len(results["ids"]) > 0
+        return len(deleted)
+
+    def get_by_file_path(self, rel_path: str) -> chromadb.GetResult:
+        """
+        Return the ids and metadatas of all vectors whose metadata['file'] matches rel_path.
+        """
+        return self.get_by_ids(self.catalog.ids_of_file(rel_path))
+
+    def is_file_hash_indexed(self, rel_path: str, file_hash: str) -> bool:
+        """
+        Return True if the file is indexed with this file hash: as recorded
+        by the Indexer, or on a vector stored for it with an event date.
+        Vectors indexed before event dates were recorded do not count, so
+        their files are indexed again.
+        """
+        record = self.membership.get_file(rel_path)
+        if record is not None:
+            return record.file_hash == file_hash
+        return self.catalog.has_file_hash(rel_path, file_hash)
+
+    def get_embeddings(self, ids: list[str]) -> dict[str, list[float]]:
+        """The embeddings of the given ids, for those that exist."""
+        results = self.collection.get(ids=ids, include=["embeddings"])
+        embeddings = results.get("embeddings")
+        if embeddings is None:
+            return {}
+        return {
+            i: e.tolist() if hasattr(e, "tolist") else list(e)
+            for i, e in zip(results["ids"], embeddings)
+        }
+
+    def get_by_ids(
+        self, ids: list[str], include: list[str] | None = None
+    ) -> chromadb.GetResult:
+        """
+        Return the ids and metadatas, or the fields in include, of the given
+        ids, for those that exist.
+        """
+        include = include or ["metadatas"]
+        if not ids:
+            return {"ids": [], **{field: [] for field in include}}
+        return self.collection.get(ids=ids, include=include)
+
+    def existing_ids(self, ids: list[str]) -> set:
+        """The subset of ids that are stored."""
+        if not ids:
+            return set()
+        return set(self.collection.get(ids=list(set(ids)), include=[])["ids"])
+
+    def update_metadata(self, ids: list[str], metadatas: list[dict]):
+        """Set the given metadata fields on each of ids."""
+        size = self.client.get_max_batch_size()
+        catalog = self.catalog
+        for start in range(0, len(ids), size):
+            self.collection.update(
+                ids=ids[start : start + size], metadatas=metadatas[start : start + size]
+            )
+            catalog.update(ids[start : start + size], metadatas[start : start + size])
+
+    def delete(self, ids: list[str]):
+        if not ids:
+            return
+        size = self.client.get_max_batch_size()
+        catalog = self.catalog
+        for start in range(0, len(ids), size):
+            self.collection.delete(ids=ids[start : start + size])
+            catalog.delete(ids[start : start + size])
+        self._bump_version()
+
+    def writer(
+        self,
+        max_count: int = WRITE_BATCH_COUNT,
+        max_bytes: int = WRITE_BATCH_BYTES,
+        max_latency: float = WRITE_BATCH_LATENCY,
+    ) -> "BufferedWriter":
+        """A BufferedWriter that adds to this store in large batches."""
+        return BufferedWriter(self, max_count, max_bytes, max_latency)
 
     def add(
         self,
-        ids: List[str],
-        embeddings: List[List[float]],
-        documents: List[str],
-        metadatas: Optional[List[Metadata]] = None,
+        ids: list[str],
+        embeddings: list[list[float]],
+        documents: list[str],
+        metadatas: list[Metadata | dict] | None = None,
     ):
         """
-        Add embeddings to the vector store.
+        Add embeddings to the vector store, in as few batches as Chroma allows.
         ids: List of unique string IDs
         embeddings: List of embedding vectors (same length as ids)
         documents: List of chunk texts (same length as ids)
-        metadatas: List of Metadata objects (same length as ids, optional)
-        """
-        # Convert Metadata dataclasses to dicts with float timestamps
-        meta_dicts = []
-        if metadatas:
-            for md in metadatas:
-                d = md.__dict__.copy()
-                if isinstance(d.get("modified_at"), datetime):
-                    d["modified_at"] = d["modified_at"].timestamp()
-                if isinstance(d.get("created_at"), datetime):
-                    d["created_at"] = d["created_at"].timestamp()
-                meta_dicts.append(d)
-        else:
-            meta_dicts = None
-        self.collection.add(
-            ids=ids, embeddings=embeddings, documents=documents, metadatas=meta_dicts
-        )
+        metadatas: List of Metadata objects, or of metadata dicts as stored
+            (same length as ids, optional)
+        """
+        meta_dicts = [stored_metadata(md) for md in metadatas] if metadatas else None
+        size = self.client.get_max_batch_size()
+        # At least one call, so Chroma validates an empty add as before
+        catalog = self.catalog
+        for start in range(0, max(len(ids), 1), size):
+            end = start + size
+            self.collection.add(
+                ids=ids[start:end],
+                embeddings=embeddings[start:end],
+                documents=documents[start:end],
+                metadatas=meta_dicts[start:end] if meta_dicts else None,
+            )
+            # Each batch as soon as Chroma has it, so a failed batch leaves
+            # the catalog matching what was written
+            catalog.add(ids[start:end], meta_dicts[start:end] if meta_dicts else None)
+        self._bump_version()
 
     def query(
         self,
-        embedding: List[float],
-        start_time: Optional[float] = None,
-        end_time: Optional[float] = None,
+        embedding: list[float],
+        start_time: float | None = None,
+        end_time: float | None = None,
         time_field: str = "created_at",
         max_results: int = 10,
+        ids: list[str] | None = None,
     ) -> chromadb.QueryResult:
         """
         Query the vector store for the most similar embeddings.
@@ -108,24 +508,171 @@ class VectorStore:
         end_time: (optional) maximum timestamp (inclusive)
         time_field: (default 'created_at') metadata field to filter by
         max_results: Number of results to return
+        ids: (optional) only search among these chunks
         """
-        where_clauses = []
-        if start_time is not None:
-            where_clauses.append({time_field: {"$gte": start_time}})
-        if end_time is not None:
-            where_clauses.append({time_field: {"$lte": end_time}})
-        if len(where_clauses) > 1:
-            where = {"$and": where_clauses}
-        elif len(where_clauses) == 1:
-            where = where_clauses[0]
-        else:
-            where = None
+        where = self._time_filter(start_time, end_time, time_field)
         logging.getLogger(__name__).debug(
             f"Querying for '{max_results}' results(s) where: {where}"
         )
+        if ids is not None:
+            ids = sorted(self.existing_ids(ids))  # Chroma fails on unknown ids
+            if not ids:
+                return _empty_query_result()
         return self.collection.query(
             query_embeddings=[embedding],
             n_results=max_results,
             include=["documents", "metadatas", "distances"],
             where=where,
+            ids=ids,
         )
+
+    def get_by_time_range(
+        self,
+        start_time: float | None = None,
+        end_time: float | None = None,
+        time_field: str = "created_at",
+    ) -> chromadb.GetResult:
+        """
+        Return the ids, documents and metadatas of all chunks whose time_field
+        falls within [start_time, end_time].
+        """
+        return self.collection.get(
+            where=self._time_filter(start_time, end_time, time_field),
+            include=["documents", "metadatas"],
+        )
+
+    @staticmethod
+    def _time_filter(
+        start_time: float | None, end_time: float | None, time_field: str
+    ) -> dict | None:
+        where_clauses = []
+        if start_time is not None:
+            where_clauses.append({time_field: {"$gte": start_time}})
+        if end_time is not None:
+            where_clauses.append({time_field: {"$lte": end_time}})
+        if len(where_clauses) > 1:
+            return {"$and": where_clauses}
+        elif len(where_clauses) == 1:
+            return where_clauses[0]
+        return None
+
+
+def _empty_query_result() -> chromadb.QueryResult:
+    return {
+        "ids": [[]],
+        "documents": [[]],
+        "metadatas": [[]],
+        "distances": [[]],
+    }
+
+
+class BufferedWriter:
+    """
+    Accumulates rows added across many files and writes them to a
+    VectorStore in large batches, amortizing Chroma's per-write transaction
+    and index update. Rows are written once max_count rows or about
+    max_bytes bytes are buffered, or the oldest has waited max_latency
+    seconds (checked on add and flush_if_due), and on flush and close.
+    Reads through the writer see buffered rows as if they were stored.
+    """
+
+    def __init__(
+        self,
+        vector_store: VectorStore,
+        max_count: int = WRITE_BATCH_COUNT,
+        max_bytes: int = WRITE_BATCH_BYTES,
+        max_latency: float = WRITE_BATCH_LATENCY,
+    ):
+        self.vector_store = vector_store
+        self.max_count = max_count
+        self.max_bytes = max_bytes
+        self.max_latency = max_latency
+        self._rows: dict[str, tuple] = {}  # id -> (embedding, document, metadata)
+        self._bytes = 0
+        self._oldest = 0.0
+        self._callbacks: list[Callable[[Exception | None], None]] = []
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def __enter__(self) -> Self:
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def add(
+        self,
+        ids: list[str],
+        embeddings: list[list[float]],
+        documents: list[str],
+        metadatas: list[Metadata],
+    ):
+        """Buffer rows, writing them all if a threshold is hit."""
+        if not self._rows:
+            self._oldest = time.monotonic()
+        for row in zip(ids, embeddings, documents, metadatas):
+            if row[0] in self._rows:
+                continue
+            self._rows[row[0]] = row[1:]
+            # Text, float32 vector and a rough allowance for the metadata
+            self._bytes += len(row[2].encode("utf-8")) + 4 * len(row[1]) + 512
+        if len(self._rows) >= self.max_count or self._bytes >= self.max_bytes:
+            self.flush()
+        else:
+            self.flush_if_due()
+
+    def after_flush(self, callback: Callable[[Exception | None], None]):
+        """
+        Call callback once every row buffered now has been written, with the
+        error if writing them failed. Called right away if nothing is buffered.
+        """
+        if self._rows:
+            self._callbacks.append(callback)
+        else:
+            callback(None)
+
+    def flush_if_due(self):
+        if self._rows and time.monotonic() - self._oldest >= self.max_latency:
+            self.flush()
+
+    def flush(self):
+        """
+        Write every buffered row, then run the pending callbacks. Raises if
+        the write failed, after the callbacks were told.
+        """
+        rows, callbacks = self._rows, self._callbacks
+        self._rows, self._bytes, self._callbacks = {}, 0, []
+        if rows:
+            logging.getLogger(__name__).debug(f"Writing {len(rows)} buffered row(s)")
+            try:
+                self.vector_store.add(
+                    list(rows),
+                    [row[0] for row in rows.values()],
+                    [row[1] for row in rows.values()],
+                    [row[2] for row in rows.values()],
+                )
+            except Exception as e:
+                for callback in callbacks:
+                    callback(e)
+                raise
+        for callback in callbacks:
+            callback(None)
+
+    def close(self):
+        self.flush()
+
+    def existing_ids(self, ids: list[str]) -> set:
+        """The subset of ids that are stored or buffered."""
+        buffered = {i for i in ids if i in self._rows}
+        return buffered | self.vector_store.existing_ids(
+            [i for i in ids if i not in buffered]
+        )
+
+    def get_embeddings(self, ids: list[str]) -> dict[str, list[float]]:
+        """The embeddings of the given ids, for those stored or buffered."""
+        found = {i: self._rows[i][0] for i in ids if i in self._rows}
+        missing = [i for i in ids if i not in found]
+        if missing:
+            found.update(self.vector_store.get_embeddings(missing))
+        return found